@@ -0,0 +1,14 @@
+{ pkgs ? import <nixpkgs> { } }:
+with pkgs.python3Packages;
+buildPythonPackage {
+  pname = "collector";
+  version = "0.1";
+  format = "pyproject";
+  src = builtins.filterSource (
+    name: type: (baseNameOf name == "collector.py") || (baseNameOf name == "pyproject.toml")
+  ) ./.;
+
+  buildInputs = [
+    setuptools
+  ];
+}
@@ -0,0 +1,682 @@
+"""Shared runtime of the smarthome collectors.
+
+A collector declares its sensor once and supplies an async function reading one
+source, a device address for instance:
+
+    THERMOMETER = Sensor(
+        'thermometer',
+        [('temperature', 'REAL'), ('battery', 'INTEGER'), ('device', 'TEXT')],
+        key=['device'],
+        panel='Thermometers',
+    )
+
+    async def read(device):
+        ...
+        return {'temperature': 21.5, 'battery': 90, 'device': device}
+
+    def main():
+        collector.main(THERMOMETER, read, 'read_thermometer')
+
+The runtime creates the table and its rollups, registers the sensor with the
+dashboard, reads every source on its own schedule with retries, and writes the
+samples in batches, to monthly partitions or through the ingest daemon if asked.
+"""
+import asyncio
+import os
+import re
+import signal
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ROLLUP_RESOLUTIONS = {'1m': 60, '15m': 900, '1h': 3600, '1d': 86400}
+NUMERIC_TYPES = {'INTEGER', 'REAL'}
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+class Sensor:
+    """Declaration of a sensor: the table its samples are stored in and their fields.
+
+    fields is a list of (name, SQL type). key names the fields that identify a
+    sample together with its timestamp, such as the device when one collector
+    reads several. Numeric fields outside key and unrolled get rollups. panel is
+    the title of the dashboard panel the fields are shown in; with registered
+    False the sensor stays out of the registry and off the dashboard.
+    """
+    def __init__(self, table, fields, key=(), unrolled=(), panel=None, registered=True):
+        for name in [table] + [name for name, _ in fields]:
+            if not IDENTIFIER.match(name) or name == 'timestamp':
+                raise ValueError(f"Invalid table or field name {name}.")
+        if not set(key) <= {name for name, _ in fields}:
+            raise ValueError(f"Key of {table} names unknown fields.")
+        self.table = table
+        self.fields = list(fields)
+        self.key = list(key)
+        self.panel = panel or table
+        self.registered = registered
+        self.columns = ['timestamp'] + [name for name, _ in self.fields]
+        self.rollup_columns = [
+            name for name, type_ in self.fields
+            if type_.upper() in NUMERIC_TYPES and name not in self.key and name not in unrolled
+        ]
+        self.key_indices = [self.columns.index(name) for name in self.key]
+
+    def insert_sql(self, schema='main'):
+        # The same text for every batch, so sqlite3 reuses the prepared statement from its cache.
+        return f"""
+            INSERT OR IGNORE INTO {schema}.{self.table} ({", ".join(self.columns)})
+            VALUES ({", ".join("?" * len(self.columns))})
+        """
+
+    def row(self, sample):
+        """Return the values of sample in column order, with its timestamp as a datetime."""
+        row = [sample['timestamp']] + [sample.get(name) for name, _ in self.fields]
+        for index in self.key_indices:
+            if row[index] is None:
+                row[index] = ''
+        return tuple(row)
+
+# ===============================
+# Schema
+# ===============================
+# SQL rendering an epoch second timestamp column the way the ISO text tables store it.
+EPOCH_AS_TEXT = "strftime('%Y-%m-%d %H:%M:%S+00:00', timestamp, 'unixepoch')"
+
+def is_epoch_table(cursor, table, schema='main'):
+    """True if table stores its timestamps as integer epoch seconds rather than ISO text."""
+    for row in cursor.execute(f"PRAGMA {schema}.table_info({table})"):
+        if row[1] == 'timestamp':
+            return row[2].upper() == 'INTEGER'
+    return False
+
+def create_table(cursor, sensor, schema='main'):
+    """Create the table of sensor: integer epoch second keys in a WITHOUT ROWID table."""
+    columns = [
+        f"{name} {type_} NOT NULL DEFAULT ''" if name in sensor.key else f"{name} {type_}"
+        for name, type_ in sensor.fields
+    ]
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{sensor.table} (
+            timestamp INTEGER NOT NULL,
+            {", ".join(columns)},
+            PRIMARY KEY ({", ".join(['timestamp'] + sensor.key)})
+        ) WITHOUT ROWID
+    """)
+
+def create_rollups(cursor, table, columns, schema='main', key=()):
+    """Create min/max/sum/count rollup tables for table and keep them updated by trigger.
+
+    A rollup table that does not exist yet is backfilled from the rows already in table.
+    The rollup tables always live in the main database. For a table in an attached
+    partition, a TEMP trigger, which may reach across databases, feeds them instead.
+    Buckets are epoch seconds, also for a table that still has text timestamps, and
+    there is one bucket per key, so readings of different devices are not mixed.
+
+    A rollup table from before table had its key is rebuilt: buckets with rows in
+    table are computed again per key, the others, archived or in partitions, are
+    kept under the empty key.
+    """
+    epoch = "{}" if is_epoch_table(cursor, table, schema) else "CAST(strftime('%s', {}) AS INTEGER)"
+    trigger = "TRIGGER" if schema == 'main' else "TEMP TRIGGER"
+    key = list(key)
+    aggregates = ", ".join(f"{c}_min, {c}_max, {c}_sum, {c}_count" for c in columns)
+    for name, seconds in ROLLUP_RESOLUTIONS.items():
+        rollup = f"{table}_rollup_{name}"
+        bucket = f"{epoch} / {seconds} * {seconds}"
+        existing = [row[1] for row in cursor.execute(f"PRAGMA main.table_info({rollup})")]
+        rebuild = schema == 'main' and existing and not set(key) <= set(existing)
+        if rebuild:
+            logger.info(f"Rebuilding {rollup} with buckets per {', '.join(key)}.")
+            # The trigger would follow the renamed table and keep its old conflict target.
+            cursor.execute(f"DROP TRIGGER IF EXISTS {rollup}_insert")
+            cursor.execute(f"ALTER TABLE {rollup} RENAME TO {rollup}_unkeyed")
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {rollup} (
+                bucket INTEGER {"NOT NULL" if key else "PRIMARY KEY"},
+                {"".join(f"{k} NOT NULL DEFAULT '', " for k in key)}
+                {", ".join(f"{c}_min, {c}_max, {c}_sum, {c}_count INTEGER" for c in columns)}
+                {f", PRIMARY KEY (bucket, {', '.join(key)})" if key else ""}
+            )
+        """)
+        cursor.execute(f"""
+            CREATE {trigger} IF NOT EXISTS {"" if schema == 'main' else f"{schema}_"}{rollup}_insert AFTER INSERT ON {schema}.{table}
+            BEGIN
+                INSERT INTO {rollup} (bucket, {"".join(f"{k}, " for k in key)}{aggregates})
+                VALUES ({bucket.format("NEW.timestamp")}, {"".join(f"coalesce(NEW.{k}, ''), " for k in key)}{", ".join(f"NEW.{c}, NEW.{c}, NEW.{c}, NEW.{c} IS NOT NULL" for c in columns)})
+                ON CONFLICT({", ".join(["bucket"] + key)}) DO UPDATE SET
+                    {", ".join(
+                        f"{c}_min = coalesce(min({c}_min, excluded.{c}_min), {c}_min, excluded.{c}_min), "
+                        f"{c}_max = coalesce(max({c}_max, excluded.{c}_max), {c}_max, excluded.{c}_max), "
+                        f"{c}_sum = coalesce({c}_sum + excluded.{c}_sum, {c}_sum, excluded.{c}_sum), "
+                        f"{c}_count = {c}_count + excluded.{c}_count"
+                        for c in columns
+                    )};
+            END
+        """)
+        if not existing or rebuild:
+            logger.info(f"Backfilling {rollup} from {table}.")
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO {rollup} (bucket, {"".join(f"{k}, " for k in key)}{aggregates})
+                SELECT {bucket.format("timestamp")} AS bucket, {"".join(f"coalesce({k}, '') AS {k}, " for k in key)}
+                    {", ".join(f"min({c}), max({c}), sum({c}), count({c})" for c in columns)}
+                FROM {table}
+                GROUP BY {", ".join(["bucket"] + key)}
+            """)
+        if rebuild:
+            cursor.execute(f"""
+                INSERT INTO {rollup} (bucket, {"".join(f"{k}, " for k in key)}{aggregates})
+                SELECT bucket, {"".join("'', " for k in key)}{aggregates}
+                FROM {rollup}_unkeyed
+                WHERE bucket NOT IN (SELECT bucket FROM {rollup})
+            """)
+            cursor.execute(f"DROP TABLE {rollup}_unkeyed")
+
+def register(cursor, sensor):
+    """List the fields of sensor in the registry the dashboard builds its sensors and panels from."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sensors (
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            panel TEXT NOT NULL,
+            rollup INTEGER NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+    cursor.executemany(
+        "INSERT OR REPLACE INTO sensors (table_name, column_name, panel, rollup) VALUES (?, ?, ?, ?)",
+        [
+            (sensor.table, name, sensor.panel, name in sensor.rollup_columns)
+            for name, type_ in sensor.fields
+            if name not in sensor.key and type_.upper() in NUMERIC_TYPES
+        ],
+    )
+
+def create_tables(cursor, sensor, schema='main'):
+    """Create the table and rollups of sensor and register it.
+
+    A table an older collector created with text timestamps is kept as it is;
+    the writers store ISO text timestamps in it until the collector migrates it.
+    """
+    create_table(cursor, sensor, schema)
+    if sensor.rollup_columns:
+        create_rollups(cursor, sensor.table, sensor.rollup_columns, schema, sensor.key)
+    if schema == 'main' and sensor.registered:
+        register(cursor, sensor)
+
+def month_of(timestamp):
+    return timestamp.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def partition_path(database, month):
+    """Return the path of the partition holding the raw rows of month, next to the main database."""
+    stem, extension = os.path.splitext(database)
+    return f"{stem}-{month:%Y-%m}{extension or '.db'}"
+
+def create_catalog(cursor):
+    """Create the catalog of partitions. Paths are relative to the directory of the main database."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS partitions (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL
+        )
+    """)
+
+# ===============================
+# Writers
+# ===============================
+class BufferedWriter:
+    """The sample buffer the writers share; subclasses write it out in flush.
+
+    The buffer is flushed when it holds batch_size samples, by flush_if_due or
+    periodic_flush once flush_interval seconds have passed since the last flush,
+    and when the writer is closed. add calls flush_if_due too. Called from an
+    event loop, flushes run on a thread of their own, so a locked database or a
+    slow daemon does not stall the reads of every source; without a loop, as in
+    read_han, they run inline.
+    """
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+        # add appends to buffer on the event loop while flush takes from it on the flushing thread.
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='flush')
+        self.flushing = None
+
+    def add(self, sensor, sample):
+        with self.lock:
+            self.buffer.append((sensor, sample))
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.flush_soon()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush if flush_interval seconds have passed since the last flush."""
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush_soon()
+
+    def flush_soon(self):
+        """Flush right away, or on the flushing thread when called from an event loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self.flushing is None or self.flushing.done():
+            self.flushing = loop.run_in_executor(self.executor, self.flush)
+            self.flushing.add_done_callback(self.flushed)
+
+    def flushed(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Flush failed, keeping the samples for the next one.", exc_info=future.exception())
+
+    def take(self):
+        """Empty the buffer and return the samples it held."""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            samples, self.buffer = self.buffer, []
+        return samples
+
+    def requeue(self, samples):
+        """Put samples back at the front of the buffer, to be written by the next flush."""
+        with self.lock:
+            self.buffer[:0] = samples
+
+    def flush(self):
+        raise NotImplementedError
+
+    async def periodic_flush(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await loop.run_in_executor(self.executor, self.flush)
+            except Exception:
+                logger.error("Periodic flush failed, keeping the samples for the next one.", exc_info=True)
+
+    def close(self):
+        # Waits for a flush still running on the flushing thread.
+        self.executor.shutdown()
+
+class DataWriter(BufferedWriter):
+    """Keep one connection open and write buffered samples in a single transaction.
+
+    Samples of every sensor go through one writer, one executemany per table and
+    transaction. The buffering is that of BufferedWriter.
+
+    When partitioned, raw rows go to one database file per month, attached on
+    demand and listed in the catalog of the main database, while the rollups stay
+    in the main database.
+    """
+    # Partitions kept attached; samples arrive in order, so only the previous month is still needed at a boundary.
+    MAX_ATTACHED = 2
+
+    def __init__(self, database, sensors, batch_size=1, flush_interval=60, partitioned=False):
+        super().__init__(batch_size, flush_interval)
+        self.database = database
+        self.sensors = list(sensors)
+        self.partitioned = partitioned
+        self.attached = []
+        # (schema, table) -> whether its timestamps are epoch seconds.
+        self.epoch = {}
+        # Used by one thread at a time: the flushing thread, or the caller's when there is no event loop.
+        self.conn = sqlite3.connect(database, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.create_tables('main')
+            if partitioned:
+                create_catalog(self.conn.cursor())
+        logger.debug(f"Connected to database {database}.")
+
+    def create_tables(self, schema):
+        cursor = self.conn.cursor()
+        for sensor in self.sensors:
+            create_tables(cursor, sensor, schema)
+            self.epoch[(schema, sensor.table)] = is_epoch_table(cursor, sensor.table, schema)
+
+    def attach(self, month):
+        """Attach the partition of month, creating it if needed. Returns its schema name."""
+        schema = f"partition_{month:%Y_%m}"
+        if schema in self.attached:
+            return schema
+        path = partition_path(self.database, month)
+        self.conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        self.conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        self.conn.execute(f"PRAGMA {schema}.synchronous=NORMAL")
+        with self.conn:
+            self.create_tables(schema)
+            self.conn.execute(
+                "INSERT OR IGNORE INTO partitions (month, path) VALUES (?, ?)",
+                (f"{month:%Y-%m}", os.path.basename(path)),
+            )
+        logger.debug(f"Attached partition {path}.")
+        self.attached.append(schema)
+        while len(self.attached) > self.MAX_ATTACHED:
+            self.detach(self.attached.pop(0))
+        return schema
+
+    def detach(self, schema):
+        # TEMP triggers outlive DETACH and would be left pointing at a missing table.
+        triggers = self.conn.execute("SELECT name FROM sqlite_temp_master WHERE type = 'trigger'").fetchall()
+        for (name,) in triggers:
+            if name.startswith(f"{schema}_"):
+                self.conn.execute(f"DROP TRIGGER temp.{name}")
+        self.conn.execute(f"DETACH DATABASE {schema}")
+
+    def flush(self):
+        samples = self.take()
+        if not samples:
+            return
+        try:
+            months = {}
+            for sensor, sample in samples:
+                month = month_of(sample['timestamp']) if self.partitioned else None
+                tables = months.setdefault(month, {})
+                tables.setdefault(sensor.table, (sensor, []))[1].append(sensor.row(sample))
+            for month in sorted(months, key=lambda month: month or 0):
+                schema = self.attach(month) if self.partitioned else 'main'
+                with self.conn:
+                    for sensor, rows in months[month].values():
+                        if self.epoch[(schema, sensor.table)]:
+                            rows = [(int(row[0].timestamp()),) + row[1:] for row in rows]
+                        # Counts the rows inserted, not those ignored as duplicates.
+                        self.rows_written += self.conn.executemany(sensor.insert_sql(schema), rows).rowcount
+        except BaseException:
+            # Months already committed are written again, and ignored as duplicates.
+            self.requeue(samples)
+            raise
+        logger.debug(f"Stored {len(samples)} samples in database.")
+
+    def close(self):
+        try:
+            super().close()
+            self.flush()
+        finally:
+            self.conn.close()
+            logger.debug("Disconnected from database.")
+
+# Frames of the ingest daemon: uint32 body length, uint8 kind, body. See ingest/app.py.
+INGEST_FRAME = struct.Struct('<IB')
+INGEST_DECLARE, INGEST_ROWS, INGEST_ACK, INGEST_NACK = 1, 2, 3, 4
+INGEST_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+INGEST_SEND_TIMEOUT = 30
+
+def encode_ingest_value(value):
+    if value is None:
+        return b'\x00'
+    if isinstance(value, datetime):
+        return b'\x04' + struct.pack('<q', (value - INGEST_EPOCH) // timedelta(microseconds=1))
+    if isinstance(value, int):
+        return b'\x01' + struct.pack('<q', value)
+    if isinstance(value, float):
+        return b'\x02' + struct.pack('<d', value)
+    if isinstance(value, bytes):
+        return b'\x05' + struct.pack('<H', len(value)) + value
+    data = str(value).encode()
+    return b'\x03' + struct.pack('<H', len(data)) + data
+
+class IngestWriter(BufferedWriter):
+    """Send buffered samples to the ingest daemon, which owns the only write connection.
+
+    Same interface as DataWriter. Samples stay buffered until the daemon has
+    acknowledged committing them: sent samples are kept until their ACK, and
+    are sent again after a NACK or a lost connection. When the daemon falls
+    behind, sending blocks: that is its back-pressure.
+    """
+    def __init__(self, database, socket_path, sensors, batch_size=1, flush_interval=60):
+        super().__init__(batch_size, flush_interval)
+        self.database = database
+        self.socket_path = socket_path
+        self.sensors = list(sensors)
+        # Samples sent on the current connection and not acknowledged yet, in the order sent.
+        self.unacked = []
+        self.sock = None
+        # The schema stays ours; only the samples go through the daemon.
+        with sqlite3.connect(database, timeout=60) as conn:
+            for sensor in self.sensors:
+                create_tables(conn.cursor(), sensor)
+        conn.close()
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(INGEST_SEND_TIMEOUT)
+        self.sock.connect(self.socket_path)
+        self.streams = {}
+        self.acknowledged = 0
+        self.incoming = b''
+        logger.debug(f"Connected to ingest daemon at {self.socket_path}.")
+
+    def disconnect(self):
+        """Close the connection. Its unacknowledged samples go back to the front of the buffer."""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.requeue(self.unacked)
+        self.unacked = []
+
+    def flush(self):
+        samples = self.take()
+        if samples:
+            try:
+                if self.sock is None:
+                    self.connect()
+                groups = {}
+                for sensor, sample in samples:
+                    groups.setdefault(sensor.table, (sensor, []))[1].append(sample)
+                frames = []
+                for table, (sensor, table_samples) in groups.items():
+                    if table not in self.streams:
+                        self.streams[table] = len(self.streams)
+                        body = struct.pack('<H', self.streams[table]) + "\0".join([table] + sensor.columns).encode()
+                        frames.append(INGEST_FRAME.pack(len(body), INGEST_DECLARE) + body)
+                    rows = [sensor.row(sample) for sample in table_samples]
+                    body = struct.pack('<HH', self.streams[table], len(rows)) + b"".join(encode_ingest_value(v) for row in rows for v in row)
+                    frames.append(INGEST_FRAME.pack(len(body), INGEST_ROWS) + body)
+                self.sock.sendall(b"".join(frames))
+            except OSError as e:
+                logger.warning(f"Could not send {len(samples)} samples to the ingest daemon: {str(e)}")
+                self.requeue(samples)
+                self.disconnect()
+                return
+            # The daemon acknowledges rows in the order of the frames, which group them by table.
+            self.unacked.extend((sensor, sample) for sensor, table_samples in groups.values() for sample in table_samples)
+            logger.debug(f"Sent {len(samples)} samples to the ingest daemon.")
+        if self.sock is not None:
+            try:
+                self.receive(wait=False)
+            except OSError as e:
+                logger.warning(f"Lost the connection to the ingest daemon: {str(e)}")
+                self.disconnect()
+
+    def receive(self, wait=True):
+        """Read acknowledgements. Returns False once the daemon has closed the connection.
+
+        Without wait, reads only what has arrived. After a NACK or the end of the
+        connection, the unacknowledged samples are buffered to be sent again.
+        """
+        closed = False
+        # A socket with a timeout waits for data even with MSG_DONTWAIT, so switch it to non-blocking instead.
+        self.sock.settimeout(INGEST_SEND_TIMEOUT if wait else 0)
+        try:
+            while True:
+                data = self.sock.recv(4096)
+                self.incoming += data
+                if not data:
+                    closed = True
+                if wait or not data:
+                    break
+        except BlockingIOError:
+            pass
+        finally:
+            self.sock.settimeout(INGEST_SEND_TIMEOUT)
+        while len(self.incoming) >= INGEST_FRAME.size:
+            length, kind = INGEST_FRAME.unpack_from(self.incoming)
+            if len(self.incoming) < INGEST_FRAME.size + length:
+                break
+            body = self.incoming[INGEST_FRAME.size:INGEST_FRAME.size + length]
+            self.incoming = self.incoming[INGEST_FRAME.size + length:]
+            if kind in (INGEST_ACK, INGEST_NACK):
+                (committed,) = struct.unpack('<Q', body)
+                del self.unacked[:committed - self.acknowledged]
+                self.rows_written += committed - self.acknowledged
+                self.acknowledged = committed
+            if kind == INGEST_NACK:
+                logger.warning(f"The ingest daemon could not commit {len(self.unacked)} samples, sending them again.")
+                closed = True
+                break
+        if closed:
+            self.disconnect()
+        return not closed
+
+    def close(self):
+        super().close()
+        try:
+            # The second attempt sends what a NACK or a lost connection returned to the buffer.
+            for _ in range(2):
+                self.flush()
+                if self.sock is not None:
+                    # The daemon closes its end once everything sent has been committed.
+                    self.sock.shutdown(socket.SHUT_WR)
+                    while self.receive():
+                        pass
+                if not self.buffer:
+                    break
+        except OSError as e:
+            logger.warning(f"Ingest daemon did not confirm the last samples: {str(e)}")
+        finally:
+            self.disconnect()
+            if self.buffer:
+                logger.warning(f"The ingest daemon did not confirm {len(self.buffer)} samples; they may not have been stored.")
+            logger.debug("Disconnected from ingest daemon.")
+
+# ===============================
+# Scheduling
+# ===============================
+# Seconds to wait before the first retry of a failed read; doubled per failure up to sample_period.
+RETRY_DELAY = 5
+MAX_ATTEMPTS = 10
+
+async def collect(sensor, read, source, sample_period, writer, connections):
+    """Read source every sample_period seconds until cancelled.
+
+    read(source) returns a sample, a dict of field values, or None to skip the
+    sample. connections limits how many sources are read at once. Failed reads
+    are retried with exponential backoff without delaying the other sources.
+    A sample the writer fails to store stays in its buffer for the next flush;
+    that is not a failure of the source, so it does not delay the next read.
+    """
+    loop = asyncio.get_running_loop()
+    retry_count = 0
+    one_time_message = f"Started reading {source} every {sample_period} seconds."
+    next_sample = loop.time()
+    while True:
+        await asyncio.sleep(max(0, next_sample - loop.time()))
+        try:
+            async with connections:
+                sample = await read(source)
+        except Exception as e:
+            retry_count += 1
+            logger.error(f"Reading {source} failed.", exc_info=not isinstance(e, (TimeoutError, BrokenPipeError)))
+            delay = min(sample_period, RETRY_DELAY * 2 ** (retry_count - 1))
+            if retry_count <= MAX_ATTEMPTS:
+                logger.info(f"Retrying {source} in {delay} seconds. Attempt {retry_count} of {MAX_ATTEMPTS}.")
+            elif retry_count == MAX_ATTEMPTS + 1:
+                logger.critical(f"{source} failed too many times. Retrying every {delay} seconds.")
+            next_sample = loop.time() + delay
+            continue
+        next_sample += sample_period * max(1, (loop.time() - next_sample) // sample_period + 1)
+        if retry_count > 0:
+            logger.info(f"Reading {source} works again.")
+            retry_count = 0
+        if one_time_message:
+            logger.info(one_time_message)
+            one_time_message = None
+        if sample is None:
+            logger.debug(f"No new sample from {source}.")
+            continue
+        sample.setdefault('timestamp', datetime.now(timezone.utc))
+        try:
+            writer.add(sensor, sample)
+        except Exception:
+            logger.error(f"Storing the sample of {source} failed, keeping it for the next flush.", exc_info=True)
+
+async def run(sensor, read, sources, database, sample_period, max_connections=1, partitioned=False, ingest=None):
+    """Collect from every source into one shared writer until SIGTERM or cancellation."""
+    if ingest:
+        writer = IngestWriter(database, ingest, [sensor], batch_size=len(sources))
+    else:
+        writer = DataWriter(database, [sensor], batch_size=len(sources), partitioned=partitioned)
+    connections = asyncio.Semaphore(max_connections)
+    tasks = [
+        asyncio.create_task(collect(sensor, read, source, sample_period, writer, connections))
+        for source in sources
+    ]
+    tasks.append(asyncio.create_task(writer.periodic_flush()))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: [task.cancel() for task in tasks])
+    logger.info(f"Started writing {sensor.table} from {len(sources)} sources to {database} every {sample_period} seconds. Press Ctrl+C to stop.")
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+def main(sensor, read, name):
+    """Command line entry point of a collector built on this runtime."""
+    help_message = f"USAGE: {name} [--partitioned] [--ingest SOCKET] SOURCE[,SOURCE...] SAMPLE-PERIOD DATABASE [MAX-CONNECTIONS]\n" \
+        "    where SOURCE identifies a device to read.\n" \
+        "    where SAMPLE-PERIOD is the time in seconds between reading the current values.\n" \
+        "    where DATABASE is the path to the SQLite file to store the values.\n" \
+        "    where MAX-CONNECTIONS is the number of sources read at the same time, 1 by default.\n" \
+        "    where --partitioned writes the samples of each month to a database file of its own.\n" \
+        "    where --ingest sends the samples to the ingest daemon listening on SOCKET."
+    partitioned = '--partitioned' in sys.argv
+    if partitioned:
+        sys.argv.remove('--partitioned')
+    ingest = None
+    if '--ingest' in sys.argv:
+        index = sys.argv.index('--ingest')
+        if index + 1 >= len(sys.argv):
+            logger.error("Missing SOCKET after --ingest.")
+            logger.info(help_message)
+            sys.exit(1)
+        ingest = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
+    if len(sys.argv) < 4:
+        logger.error("Missing input argument SOURCE or SAMPLE-PERIOD or DATABASE.")
+        logger.info(help_message)
+        sys.exit(1)
+    if not sys.argv[2].isdigit() or int(sys.argv[2]) < 1:
+        logger.error("Invalid SAMPLE-PERIOD. Must be a numerical value larger than zero.")
+        logger.info(help_message)
+        sys.exit(1)
+    if len(sys.argv) > 4 and (not sys.argv[4].isdigit() or int(sys.argv[4]) < 1):
+        logger.error("Invalid MAX-CONNECTIONS. Must be a numerical value larger than zero.")
+        logger.info(help_message)
+        sys.exit(1)
+
+    asyncio.run(run(
+        sensor,
+        read,
+        sys.argv[1].split(','),
+        sys.argv[3],
+        int(sys.argv[2]),
+        int(sys.argv[4]) if len(sys.argv) > 4 else 1,
+        partitioned,
+        ingest,
+    ))
@@ -0,0 +1,40 @@
+"""Example collector built on the collector runtime.
+
+It reads simulated thermometers, so the whole path, from the sensor declaration
+through the registry to the dashboard, can be tried without any hardware:
+
+    python example.py kitchen,attic 10 ./example.db
+
+Each comma separated SOURCE is one thermometer. A real collector replaces read
+with the code talking to its device and keeps the rest.
+"""
+import asyncio
+import random
+import collector
+
+THERMOMETER = collector.Sensor(
+    'example_thermometer',
+    [('temperature', 'REAL'), ('battery', 'INTEGER'), ('firmware', 'TEXT'), ('device', 'TEXT')],
+    key=['device'],
+    # The battery level is charted but needs no rollups.
+    unrolled=['battery'],
+    panel='Example thermometers',
+)
+
+async def read(device):
+    """Return one sample of device, or None when it has nothing new."""
+    await asyncio.sleep(0.1)
+    if random.random() < 0.05:
+        raise TimeoutError(f"{device} did not answer.")
+    return {
+        'temperature': round(random.gauss(21, 2), 2),
+        'battery': random.randint(80, 100),
+        'firmware': '1.0',
+        'device': device,
+    }
+
+def main():
+    collector.main(THERMOMETER, read, 'example')
+
+if __name__ == "__main__":
+    main()
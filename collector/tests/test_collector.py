@@ -0,0 +1,272 @@
+import unittest
+import asyncio
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_sensor_declares_columns_key_and_rollups(self):
+        from collector import Sensor
+        from example import THERMOMETER
+        self.assertEqual(THERMOMETER.columns, ['timestamp', 'temperature', 'battery', 'firmware', 'device'])
+        self.assertEqual(THERMOMETER.rollup_columns, ['temperature'])
+        timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(THERMOMETER.row({'timestamp': timestamp, 'temperature': 20.5}), (timestamp, 20.5, None, None, ''))
+        with self.assertRaises(ValueError):
+            Sensor('bad table', [('value', 'REAL')])
+        with self.assertRaises(ValueError):
+            Sensor('thermometer', [('value', 'REAL')], key=['device'])
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_register_lists_numeric_fields_in_the_sensors_registry(self):
+        from collector import DataWriter, Sensor
+        from example import THERMOMETER
+        hidden = Sensor('hidden', [('value', 'INTEGER')], registered=False)
+        DataWriter(self.database, [THERMOMETER, hidden]).close()
+        conn = sqlite3.connect(self.database)
+        rows = conn.execute("SELECT table_name, column_name, panel, rollup FROM sensors ORDER BY column_name").fetchall()
+        conn.close()
+        self.assertEqual(rows, [
+            ('example_thermometer', 'battery', 'Example thermometers', 0),
+            ('example_thermometer', 'temperature', 'Example thermometers', 1),
+        ])
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_writer_keys_samples_by_device_and_maintains_rollups(self):
+        from collector import DataWriter
+        from example import THERMOMETER
+        writer = DataWriter(self.database, [THERMOMETER], batch_size=10)
+        timestamp = datetime(2024, 1, 1, 12, 0, 30, tzinfo=timezone.utc)
+        writer.add(THERMOMETER, {'timestamp': timestamp, 'temperature': 20.0, 'device': 'kitchen'})
+        writer.add(THERMOMETER, {'timestamp': timestamp, 'temperature': 10.0, 'device': 'attic'})
+        writer.add(THERMOMETER, {'timestamp': timestamp, 'temperature': 99.0, 'device': 'attic'})
+        writer.close()
+        self.assertEqual(writer.rows_written, 2)
+        conn = sqlite3.connect(self.database)
+        rows = conn.execute("SELECT timestamp, device, temperature FROM example_thermometer ORDER BY device").fetchall()
+        rollup = conn.execute("SELECT bucket, device, temperature_sum FROM example_thermometer_rollup_1m ORDER BY device").fetchall()
+        conn.close()
+        self.assertEqual(rows, [(1704110430, 'attic', 10.0), (1704110430, 'kitchen', 20.0)])
+        self.assertEqual(rollup, [(1704110400, 'attic', 10.0), (1704110400, 'kitchen', 20.0)])
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_rollups_from_before_the_key_are_rebuilt_per_device(self):
+        from collector import DataWriter
+        from example import THERMOMETER
+        conn = sqlite3.connect(self.database)
+        conn.execute("CREATE TABLE example_thermometer (timestamp INTEGER PRIMARY KEY, temperature REAL, battery INTEGER, firmware TEXT, device TEXT NOT NULL DEFAULT '')")
+        conn.execute("INSERT INTO example_thermometer (timestamp, temperature, device) VALUES (1704110430, 20.0, 'kitchen')")
+        for name in ('1m', '15m', '1h', '1d'):
+            conn.execute(f"CREATE TABLE example_thermometer_rollup_{name} (bucket INTEGER PRIMARY KEY, temperature_min, temperature_max, temperature_sum, temperature_count INTEGER)")
+        # An archived bucket with no raw rows left stays, under the empty device.
+        conn.execute("INSERT INTO example_thermometer_rollup_1m VALUES (1704067200, 1.0, 3.0, 4.0, 2)")
+        conn.execute("INSERT INTO example_thermometer_rollup_1m VALUES (1704110400, 0.0, 0.0, 0.0, 7)")
+        conn.commit()
+        conn.close()
+        writer = DataWriter(self.database, [THERMOMETER])
+        writer.add(THERMOMETER, {'timestamp': datetime(2024, 1, 1, 12, 0, 40, tzinfo=timezone.utc), 'temperature': 10.0, 'device': 'attic'})
+        writer.close()
+        conn = sqlite3.connect(self.database)
+        rollup = conn.execute("SELECT bucket, device, temperature_sum, temperature_count FROM example_thermometer_rollup_1m ORDER BY bucket, device").fetchall()
+        conn.close()
+        self.assertEqual(rollup, [(1704067200, '', 4.0, 2), (1704110400, 'attic', 10.0, 1), (1704110400, 'kitchen', 20.0, 1)])
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_flush_if_due_writes_a_partial_batch_after_flush_interval(self):
+        from collector import DataWriter
+        from example import THERMOMETER
+        writer = DataWriter(self.database, [THERMOMETER], batch_size=10, flush_interval=3600)
+        writer.add(THERMOMETER, {'timestamp': datetime(2024, 1, 1, tzinfo=timezone.utc), 'temperature': 1.0})
+        writer.flush_if_due()
+        self.assertEqual(len(writer.buffer), 1)
+        writer.last_flush -= 3600
+        writer.flush_if_due()
+        self.assertEqual((writer.buffer, writer.rows_written), ([], 1))
+        writer.close()
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_writer_keeps_text_timestamps_of_legacy_tables(self):
+        from collector import DataWriter, Sensor
+        sensor = Sensor('legacy', [('value', 'INTEGER')])
+        conn = sqlite3.connect(self.database)
+        conn.execute("CREATE TABLE legacy (timestamp DATETIME, value INTEGER)")
+        conn.execute("INSERT INTO legacy VALUES ('2024-01-01 00:00:10+00:00', 1)")
+        conn.commit()
+        conn.close()
+        writer = DataWriter(self.database, [sensor])
+        writer.add(sensor, {'timestamp': datetime(2024, 1, 1, 0, 0, 50, tzinfo=timezone.utc), 'value': 3})
+        writer.close()
+        conn = sqlite3.connect(self.database)
+        rows = conn.execute("SELECT timestamp, value FROM legacy ORDER BY timestamp").fetchall()
+        rollup = conn.execute("SELECT bucket, value_sum, value_count FROM legacy_rollup_1m").fetchall()
+        conn.close()
+        self.assertEqual(rows, [('2024-01-01 00:00:10+00:00', 1), ('2024-01-01 00:00:50+00:00', 3)])
+        self.assertEqual(rollup, [(1704067200, 4, 2)])
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_partitioned_writer_lists_months_in_the_catalog(self):
+        from collector import DataWriter, partition_path
+        from example import THERMOMETER
+        writer = DataWriter(self.database, [THERMOMETER], partitioned=True)
+        writer.add(THERMOMETER, {'timestamp': datetime(2024, 1, 31, 23, 59, tzinfo=timezone.utc), 'temperature': 1.0, 'device': 'a'})
+        writer.add(THERMOMETER, {'timestamp': datetime(2024, 2, 1, 0, 1, tzinfo=timezone.utc), 'temperature': 2.0, 'device': 'a'})
+        writer.close()
+        conn = sqlite3.connect(self.database)
+        catalog = conn.execute("SELECT month, path FROM partitions ORDER BY month").fetchall()
+        buckets = conn.execute("SELECT count(*) FROM example_thermometer_rollup_1d").fetchone()[0]
+        conn.close()
+        self.assertEqual(catalog, [('2024-01', 'test-2024-01.db'), ('2024-02', 'test-2024-02.db')])
+        self.assertEqual(buckets, 2)
+        self.assertTrue(os.path.exists(partition_path(self.database, datetime(2024, 2, 1))))
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_collect_reads_every_source_into_the_writer(self):
+        import collector
+        from example import THERMOMETER
+
+        async def read(device):
+            return {'temperature': 21.0, 'battery': 90, 'device': device}
+
+        async def run(writer):
+            connections = asyncio.Semaphore(1)
+            tasks = [
+                asyncio.create_task(collector.collect(THERMOMETER, read, device, 60, writer, connections))
+                for device in ('kitchen', 'attic')
+            ]
+            await asyncio.sleep(0.1)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        writer = collector.DataWriter(self.database, [THERMOMETER], batch_size=2)
+        asyncio.run(run(writer))
+        writer.close()
+        conn = sqlite3.connect(self.database)
+        devices = conn.execute("SELECT device FROM example_thermometer ORDER BY device").fetchall()
+        conn.close()
+        self.assertEqual(devices, [('attic',), ('kitchen',)])
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_write_errors_are_not_read_errors_and_keep_the_samples(self):
+        import collector
+        from example import THERMOMETER
+
+        class FailingWriter(collector.DataWriter):
+            failures = 2
+
+            def flush(self):
+                if self.buffer and self.failures:
+                    self.failures -= 1
+                    raise sqlite3.OperationalError("database is locked")
+                super().flush()
+
+        async def read(device):
+            return {'temperature': 21.0, 'device': device}
+
+        async def run(writer):
+            tasks = [
+                asyncio.create_task(collector.collect(THERMOMETER, read, 'kitchen', 0.05, writer, asyncio.Semaphore(1))),
+                asyncio.create_task(writer.periodic_flush()),
+            ]
+            await asyncio.sleep(0.2)
+            self.assertFalse(any(task.done() for task in tasks))
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        writer = FailingWriter(self.database, [THERMOMETER], batch_size=1, flush_interval=0.01)
+        with self.assertLogs('collector', 'ERROR') as logs:
+            asyncio.run(run(writer))
+        writer.close()
+        self.assertFalse([line for line in logs.output if 'Reading kitchen failed' in line])
+        self.assertTrue([line for line in logs.output if 'keeping' in line])
+        conn = sqlite3.connect(self.database)
+        count = conn.execute("SELECT count(*) FROM example_thermometer").fetchone()[0]
+        conn.close()
+        self.assertGreater(count, 0)
+        self.assertEqual(count, writer.rows_written)
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_ingest_writer_keeps_samples_until_acknowledged(self):
+        import collector
+        from example import THERMOMETER
+        socket_path = os.path.join(self.directory.name, 'ingest.sock')
+        received = []
+
+        async def daemon(reader, writer):
+            # Refuses the first rows, like a daemon whose commit failed, and acknowledges the rest.
+            committed = 0
+            while True:
+                try:
+                    length, kind = collector.INGEST_FRAME.unpack(await reader.readexactly(collector.INGEST_FRAME.size))
+                except asyncio.IncompleteReadError:
+                    break
+                body = await reader.readexactly(length)
+                if kind != collector.INGEST_ROWS:
+                    continue
+                count = int.from_bytes(body[2:4], 'little')
+                received.append(count)
+                if len(received) == 1:
+                    writer.write(collector.INGEST_FRAME.pack(8, collector.INGEST_NACK) + (0).to_bytes(8, 'little'))
+                    break
+                committed += count
+                writer.write(collector.INGEST_FRAME.pack(8, collector.INGEST_ACK) + committed.to_bytes(8, 'little'))
+            writer.close()
+
+        async def run(writer):
+            server = await asyncio.start_unix_server(daemon, socket_path)
+            timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            writer.add(THERMOMETER, {'timestamp': timestamp, 'temperature': 1.0, 'device': 'a'})
+            writer.add(THERMOMETER, {'timestamp': timestamp, 'temperature': 2.0, 'device': 'b'})
+            await asyncio.sleep(0.2)
+            # The NACK is read on the next flush, which sends the refused samples again.
+            self.assertEqual(len(writer.buffer + writer.unacked), 2)
+            writer.add(THERMOMETER, {'timestamp': timestamp, 'temperature': 3.0, 'device': 'c'})
+            await asyncio.sleep(0.2)
+            await asyncio.get_running_loop().run_in_executor(None, writer.close)
+            server.close()
+
+        writer = collector.IngestWriter(self.database, socket_path, [THERMOMETER], batch_size=2)
+        asyncio.run(run(writer))
+        self.assertEqual(received, [2, 3])
+        self.assertEqual((writer.rows_written, writer.buffer, writer.unacked), (3, [], []))
+
+    @unittest.skipIf(not os.path.exists("collector.py"), "Collector runtime not yet present")
+    def test_a_locked_database_does_not_stall_the_reads(self):
+        import collector
+        from example import THERMOMETER
+        reads = []
+
+        async def read(device):
+            reads.append(device)
+            return {'temperature': 21.0, 'device': f"{device}-{len(reads)}"}
+
+        async def run(writer):
+            task = asyncio.create_task(collector.collect(THERMOMETER, read, 'kitchen', 0.01, writer, asyncio.Semaphore(1)))
+            await asyncio.sleep(0.3)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        writer = collector.DataWriter(self.database, [THERMOMETER], batch_size=1)
+        lock = sqlite3.connect(self.database)
+        lock.execute("BEGIN IMMEDIATE")
+        try:
+            asyncio.run(run(writer))
+        finally:
+            lock.rollback()
+            lock.close()
+        writer.close()
+        self.assertGreater(len(reads), 5)
+        self.assertEqual(writer.rows_written, len(reads))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,8 @@ in
     ./read_waveplus
     ./timeseries_plot
     ./read_han
+    ./retention
+    ./ingest
   ];
 
   options = {
@@ -25,6 +27,12 @@ in
         default = "/var/lib/smarthome/smarthome.db";
         description = "Path to the SQLite database.";
       };
+
+      partitioned = mkOption {
+        type = types.bool;
+        default = false;
+        description = "Write the raw rows of each month to a database file of its own next to the database.";
+      };
     };
   };
 
@@ -0,0 +1,386 @@
+import asyncio
+import os
+import re
+import signal
+import sqlite3
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import collector
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ===============================
+# Protocol
+# ===============================
+# A connection is a sequence of frames: a little-endian uint32 body length and a
+# uint8 kind, followed by the body.
+#
+# DECLARE  uint16 stream id, then the table and column names, NUL separated.
+# ROWS     uint16 stream id, uint16 row count, then every value of every row as
+#          a one byte tag and its payload (see collector.encode_ingest_value).
+#          Aware datetimes travel as microseconds since the epoch.
+# ACK      sent by the daemon: uint64 number of rows of this connection committed so far.
+# NACK     sent by the daemon when rows could not be committed: uint64 number of rows
+#          committed before them. The daemon then closes the connection; the collector
+#          keeps every row after that count and sends them again.
+# Collectors send frames with the IngestWriter of the collector module, which shares these definitions.
+FRAME_HEADER = collector.INGEST_FRAME
+DECLARE, ROWS, ACK, NACK = collector.INGEST_DECLARE, collector.INGEST_ROWS, collector.INGEST_ACK, collector.INGEST_NACK
+STREAM = struct.Struct('<H')
+ROWS_HEADER = struct.Struct('<HH')
+COUNT = struct.Struct('<Q')
+MAX_FRAME = 1 << 20
+EPOCH = collector.INGEST_EPOCH
+
+NULL, INTEGER, REAL, TEXT, TIMESTAMP, BLOB = range(6)
+INTEGER_VALUE = struct.Struct('<q')
+REAL_VALUE = struct.Struct('<d')
+TEXT_LENGTH = struct.Struct('<H')
+IDENTIFIER = collector.IDENTIFIER
+
+def decode_values(body, offset, count):
+    """Decode count values of body starting at offset. Returns the values and the new offset."""
+    values = []
+    for _ in range(count):
+        tag = body[offset]
+        offset += 1
+        if tag == NULL:
+            values.append(None)
+        elif tag == INTEGER:
+            values.append(INTEGER_VALUE.unpack_from(body, offset)[0])
+            offset += INTEGER_VALUE.size
+        elif tag == REAL:
+            values.append(REAL_VALUE.unpack_from(body, offset)[0])
+            offset += REAL_VALUE.size
+        elif tag == TEXT:
+            (length,) = TEXT_LENGTH.unpack_from(body, offset)
+            offset += TEXT_LENGTH.size
+            values.append(body[offset:offset + length].decode())
+            offset += length
+        elif tag == BLOB:
+            (length,) = TEXT_LENGTH.unpack_from(body, offset)
+            offset += TEXT_LENGTH.size
+            values.append(bytes(body[offset:offset + length]))
+            offset += length
+        elif tag == TIMESTAMP:
+            values.append(EPOCH + timedelta(microseconds=INTEGER_VALUE.unpack_from(body, offset)[0]))
+            offset += INTEGER_VALUE.size
+        else:
+            raise ValueError(f"Unknown value tag {tag}.")
+    return values, offset
+
+def encode_frame(kind, body):
+    return FRAME_HEADER.pack(len(body), kind) + body
+
+# ===============================
+# Storage
+# ===============================
+TRIGGER_HEADER = re.compile(r'^CREATE TRIGGER\s+(\w+)\s+AFTER INSERT ON\s+(?:main\.)?(\w+)')
+
+class Database:
+    """The single write connection. Used from one thread only.
+
+    Tables and rollup triggers are created by the collectors. When partitioned,
+    the tables of a partition are created from the definitions in the main
+    database, and its rollup triggers are recreated as TEMP triggers, the way
+    the collectors' own writers do it.
+    """
+    # Partitions kept attached; rows arrive in order, so only the previous month is still needed at a boundary.
+    MAX_ATTACHED = 2
+
+    def __init__(self, database, partitioned=False):
+        self.database = database
+        self.partitioned = partitioned
+        self.attached = []
+        self.prepared = set()
+        self.conn = sqlite3.connect(database, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if partitioned:
+            with self.conn:
+                collector.create_catalog(self.conn.cursor())
+
+    def attach(self, month):
+        """Attach the partition of month, creating it if needed. Returns its schema name."""
+        schema = f"partition_{month:%Y_%m}"
+        if schema in self.attached:
+            return schema
+        path = collector.partition_path(self.database, month)
+        self.conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        self.conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        self.conn.execute(f"PRAGMA {schema}.synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO partitions (month, path) VALUES (?, ?)",
+                (f"{month:%Y-%m}", os.path.basename(path)),
+            )
+        logger.debug(f"Attached partition {path}.")
+        self.attached.append(schema)
+        while len(self.attached) > self.MAX_ATTACHED:
+            self.detach(self.attached.pop(0))
+        return schema
+
+    def detach(self, schema):
+        # TEMP triggers outlive DETACH and would be left pointing at a missing table.
+        triggers = self.conn.execute("SELECT name FROM sqlite_temp_master WHERE type = 'trigger'").fetchall()
+        for (name,) in triggers:
+            if name.startswith(f"{schema}_"):
+                self.conn.execute(f"DROP TRIGGER temp.{name}")
+        self.conn.execute(f"DETACH DATABASE {schema}")
+        self.prepared = {entry for entry in self.prepared if entry[0] != schema}
+
+    def prepare_partition_table(self, schema, table):
+        """Create table in an attached partition if needed, and the TEMP triggers feeding its rollups."""
+        if (schema, table) in self.prepared:
+            return
+        if not self.conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            sql = self.conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if sql is None:
+                raise sqlite3.OperationalError(f"no such table: {table}")
+            self.conn.execute(sql[0].replace("CREATE TABLE ", f"CREATE TABLE {schema}.", 1))
+        triggers = self.conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,))
+        for (sql,) in triggers.fetchall():
+            self.conn.execute(TRIGGER_HEADER.sub(
+                lambda match: f"CREATE TEMP TRIGGER IF NOT EXISTS {schema}_{match[1]} AFTER INSERT ON {schema}.{match[2]}",
+                sql,
+                count=1,
+            ))
+        self.prepared.add((schema, table))
+
+    def schemas_of(self, table, columns, rows):
+        """Return {schema: rows} for rows of table, attaching the partitions they belong to."""
+        if not self.partitioned or 'timestamp' not in columns:
+            return {'main': rows}
+        index = columns.index('timestamp')
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(collector.month_of(row[index]), []).append(row)
+        by_schema = {}
+        for month, month_rows in sorted(by_month.items()):
+            schema = self.attach(month)
+            self.prepare_partition_table(schema, table)
+            by_schema[schema] = month_rows
+        return by_schema
+
+    def insert(self, schema, table, columns, rows):
+        if 'timestamp' in columns:
+            index = columns.index('timestamp')
+            epoch = collector.is_epoch_table(self.conn, table, schema)
+            rows = [
+                row[:index] + ((int(row[index].timestamp()) if epoch else row[index]),) + row[index + 1:]
+                for row in rows
+            ]
+        self.conn.executemany(f"""
+            INSERT OR IGNORE INTO {schema}.{table} ({", ".join(columns)})
+            VALUES ({", ".join("?" * len(columns))})
+        """, rows)
+
+    def commit(self, batch):
+        """Write every (table, columns, rows) of batch in one transaction. Returns the indices that failed.
+
+        If the transaction fails, the entries are retried one transaction each,
+        so one bad entry cannot lose the rows of other collectors.
+        """
+        try:
+            self._write(batch)
+            return []
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Error writing {len(batch[0][2])} rows to {batch[0][0]}: {str(e)}")
+                return [0]
+        failed = []
+        for i, entry in enumerate(batch):
+            if self.commit([entry]):
+                failed.append(i)
+        return failed
+
+    def _write(self, batch):
+        by_schema = [
+            (schema, table, columns, schema_rows)
+            for table, columns, rows in batch
+            for schema, schema_rows in self.schemas_of(table, columns, rows).items()
+        ]
+        with self.conn:
+            for schema, table, columns, rows in by_schema:
+                self.insert(schema, table, columns, rows)
+
+    def close(self):
+        self.conn.close()
+
+# ===============================
+# Daemon
+# ===============================
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.received = 0
+        self.committed = 0
+        self.failed = False
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def acknowledge(self, rows):
+        if self.failed:
+            return
+        self.committed += rows
+        if self.committed >= self.received:
+            self.idle.set()
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(ACK, COUNT.pack(self.committed)))
+
+    def reject(self):
+        """Refuse every row from the first uncommitted one on and close the connection."""
+        if self.failed:
+            return
+        self.failed = True
+        self.idle.set()
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(NACK, COUNT.pack(self.committed)))
+            self.writer.close()
+
+class IngestServer:
+    """Accept rows from collectors over a Unix socket and write them with one connection.
+
+    Rows of every connection go through one bounded queue. The writer takes what
+    has queued up within commit_interval, up to max_batch rows, and commits it in
+    a single transaction, so commits are grouped across collectors. When the
+    queue is full, connections are no longer read, and collectors block in send
+    until the writer has caught up.
+    """
+    def __init__(self, database, socket_path, partitioned=False, commit_interval=0.25, max_batch=5000, max_pending=1000):
+        self.database = database
+        self.socket_path = socket_path
+        self.partitioned = partitioned
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(max_pending)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+        self.db = None
+        self.clients = set()
+        self.rows_written = 0
+        self.commits = 0
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.db = await loop.run_in_executor(self.executor, Database, self.database, self.partitioned)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle, self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"Accepting rows on {self.socket_path}.")
+        writer = asyncio.create_task(self.write_loop())
+        try:
+            # Serve until cancelled. Not serve_forever: since Python 3.12.1, wait_closed waits
+            # for the open connections, and serve_forever awaits it when cancelled.
+            await loop.create_future()
+        finally:
+            # Stop reading, commit and acknowledge what has queued up, then hang up.
+            server.close()
+            for client in self.clients:
+                client.writer.transport.pause_reading()
+            await self.queue.join()
+            for client in list(self.clients):
+                client.idle.set()
+                client.writer.close()
+            await server.wait_closed()
+            writer.cancel()
+            await loop.run_in_executor(self.executor, self.db.close)
+            self.executor.shutdown()
+            logger.info(f"Wrote {self.rows_written} rows in {self.commits} commits.")
+
+    async def handle(self, reader, writer):
+        client = Client(writer)
+        self.clients.add(client)
+        streams = {}
+        try:
+            while True:
+                try:
+                    length, kind = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if length > MAX_FRAME:
+                    raise ValueError(f"Frame of {length} bytes is too large.")
+                body = await reader.readexactly(length)
+                if kind == DECLARE:
+                    (stream,) = STREAM.unpack_from(body)
+                    table, *columns = body[STREAM.size:].decode().split("\0")
+                    if not all(IDENTIFIER.match(name) for name in [table] + columns):
+                        raise ValueError(f"Invalid table or column name in {table}.")
+                    streams[stream] = (table, columns)
+                elif kind == ROWS:
+                    stream, count = ROWS_HEADER.unpack_from(body)
+                    table, columns = streams[stream]
+                    values, _ = decode_values(body, ROWS_HEADER.size, count * len(columns))
+                    rows = [tuple(values[i:i + len(columns)]) for i in range(0, len(values), len(columns))]
+                    client.received += len(rows)
+                    client.idle.clear()
+                    await self.queue.put((client, table, columns, rows))
+                else:
+                    raise ValueError(f"Unknown frame kind {kind}.")
+            await client.idle.wait()
+        except (ValueError, KeyError, struct.error, asyncio.IncompleteReadError) as e:
+            logger.error(f"Closing connection after protocol error: {str(e)}")
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            rows = len(batch[0][3])
+            deadline = loop.time() + self.commit_interval
+            while rows < self.max_batch:
+                try:
+                    entry = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        entry = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(entry)
+                rows += len(entry[3])
+            # Rows of a rejected connection are sent again by its collector.
+            entries = [entry for entry in batch if not entry[0].failed]
+            if entries:
+                failed = await loop.run_in_executor(self.executor, self.db.commit, [entry[1:] for entry in entries])
+                self.commits += 1
+                for i, (client, _, _, entry_rows) in enumerate(entries):
+                    if i in failed:
+                        client.reject()
+                    else:
+                        self.rows_written += len(entry_rows)
+                        client.acknowledge(len(entry_rows))
+            for _ in batch:
+                self.queue.task_done()
+
+def main():
+    partitioned = '--partitioned' in sys.argv
+    if partitioned:
+        sys.argv.remove('--partitioned')
+    if len(sys.argv) < 3:
+        logger.error("USAGE: ingest [--partitioned] DATABASE SOCKET [COMMIT-INTERVAL]")
+        sys.exit(1)
+    commit_interval = float(sys.argv[3]) if len(sys.argv) > 3 else 0.25
+    server = IngestServer(sys.argv[1], sys.argv[2], partitioned, commit_interval)
+
+    async def run():
+        task = asyncio.create_task(server.serve())
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        try:
+            await task
+        except asyncio.CancelledError:
+            logger.info("Stopped.")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+{ config, lib, pkgs, ... }:
+
+with lib;
+
+let
+  cfg = config.services.smarthome;
+in
+{
+  options = {
+    services.smarthome.ingest = {
+      enable = mkOption {
+        type = types.bool;
+        default = false;
+        description = "Route the rows of all collectors through one writer daemon instead of letting each collector write the database.";
+      };
+
+      database = mkOption {
+        type = types.str;
+        default = cfg.database;
+        description = "Path to the SQLite database.";
+      };
+
+      socket = mkOption {
+        type = types.str;
+        default = "/run/smarthome/ingest.sock";
+        description = "Path of the Unix socket the collectors send their rows to.";
+      };
+
+      commitInterval = mkOption {
+        type = types.float;
+        default = 0.25;
+        description = "Number of seconds rows of all collectors are gathered before they are committed together.";
+      };
+    };
+  };
+
+  config = mkIf cfg.ingest.enable {
+    systemd.services.smarthome-ingest = {
+      description = "Smarthome Ingest Service";
+      after = [ "local-fs.target" ];
+
+      serviceConfig = {
+        ExecStart = "${pkgs.callPackage ./ingest.nix {}}/bin/ingest ${optionalString cfg.partitioned "--partitioned "}${cfg.ingest.database} ${cfg.ingest.socket} ${toString cfg.ingest.commitInterval}";
+        User = "smarthome";
+        Group = "smarthome";
+        RuntimeDirectory = "smarthome";
+        RuntimeDirectoryMode = "0750";
+        # Partition files are shared with the other services of the group.
+        UMask = "0002";
+      };
+    };
+  };
+}
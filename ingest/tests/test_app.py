@@ -0,0 +1,146 @@
+import unittest
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+def declare(stream, table, columns):
+    import app
+    body = app.STREAM.pack(stream) + "\0".join([table] + columns).encode()
+    return app.FRAME_HEADER.pack(len(body), app.DECLARE) + body
+
+def rows_frame(stream, rows):
+    import app
+    import collector
+    body = app.ROWS_HEADER.pack(stream, len(rows)) + b"".join(collector.encode_ingest_value(v) for row in rows for v in row)
+    return app.FRAME_HEADER.pack(len(body), app.ROWS) + body
+
+async def read_frame(reader):
+    """Return (kind, committed count) of the next ACK or NACK, or None at the end of the connection."""
+    import app
+    try:
+        length, kind = app.FRAME_HEADER.unpack(await reader.readexactly(app.FRAME_HEADER.size))
+    except asyncio.IncompleteReadError:
+        return None
+    return kind, app.COUNT.unpack(await reader.readexactly(length))[0]
+
+def at(second):
+    return datetime.fromtimestamp(1704067200 + second, timezone.utc)
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.db')
+        self.socket = os.path.join(self.directory.name, 'ingest.sock')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def start_server(self):
+        """Run an IngestServer in a thread of its own until the end of the test."""
+        import app
+        server = app.IngestServer(self.database, self.socket, commit_interval=0.01)
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(server.serve())
+        thread = threading.Thread(target=loop.run_until_complete, args=(asyncio.gather(task, return_exceptions=True),))
+        thread.start()
+
+        def stop():
+            loop.call_soon_threadsafe(task.cancel)
+            thread.join()
+            loop.close()
+
+        self.addCleanup(stop)
+        for _ in range(100):
+            if os.path.exists(self.socket):
+                break
+            time.sleep(0.01)
+        return server
+
+    def create_table(self):
+        conn = sqlite3.connect(self.database)
+        conn.execute("CREATE TABLE readings (timestamp INTEGER PRIMARY KEY, value INTEGER)")
+        conn.commit()
+        conn.close()
+
+    def select(self, sql):
+        conn = sqlite3.connect(self.database)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    @unittest.skipIf(not os.path.exists("app.py"), "ingest not yet present")
+    def test_rows_are_acknowledged_until_a_commit_fails(self):
+        import app
+        self.create_table()
+        self.start_server()
+
+        async def run():
+            reader, writer = await asyncio.open_unix_connection(self.socket)
+            writer.write(declare(0, 'readings', ['timestamp', 'value']) + rows_frame(0, [(at(1), 1), (at(2), 2)]))
+            first = await read_frame(reader)
+            writer.write(rows_frame(0, [(at(3), None)]))
+            second = await read_frame(reader)
+            writer.write(declare(1, 'missing', ['timestamp', 'value']) + rows_frame(1, [(at(4), 4)]))
+            third = await read_frame(reader)
+            end = await read_frame(reader)
+            writer.close()
+            return first, second, third, end
+
+        first, second, third, end = asyncio.run(run())
+        # Counts are cumulative, and a NACK carries the count committed before the failed rows.
+        self.assertEqual(first, (app.ACK, 2))
+        self.assertEqual(second, (app.ACK, 3))
+        self.assertEqual(third, (app.NACK, 3))
+        self.assertIsNone(end)
+        self.assertEqual(self.select("SELECT * FROM readings ORDER BY timestamp"), [(1704067201, 1), (1704067202, 2), (1704067203, None)])
+
+    @unittest.skipIf(not os.path.exists("app.py"), "ingest not yet present")
+    def test_a_protocol_error_closes_the_connection(self):
+        import app
+        self.create_table()
+        self.start_server()
+
+        async def run():
+            reader, writer = await asyncio.open_unix_connection(self.socket)
+            writer.write(rows_frame(7, [(at(1), 1)]))
+            frame = await read_frame(reader)
+            writer.close()
+            return frame
+
+        with self.assertLogs(app.logger, 'ERROR'):
+            self.assertIsNone(asyncio.run(run()))
+        self.assertEqual(self.select("SELECT count(*) FROM readings"), [(0,)])
+
+    @unittest.skipIf(not os.path.exists("app.py"), "ingest not yet present")
+    def test_collector_writer_resends_the_rows_of_a_failed_commit(self):
+        import app
+        import collector
+        sensor = collector.Sensor('thermometer', [('temperature', 'REAL'), ('device', 'TEXT')], key=['device'])
+        write = app.Database._write
+        failures = [1]
+
+        def fail_once(db, batch):
+            if failures[0]:
+                failures[0] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            write(db, batch)
+
+        writer = collector.IngestWriter(self.database, self.socket, [sensor], batch_size=100)
+        with mock.patch.object(app.Database, '_write', fail_once), self.assertLogs(app.logger, 'ERROR'):
+            self.start_server()
+            for second in range(5):
+                writer.add(sensor, {'timestamp': at(second), 'temperature': float(second), 'device': 'attic'})
+            writer.close()
+        self.assertEqual(writer.rows_written, 5)
+        self.assertEqual(writer.buffer, [])
+        self.assertEqual(self.select("SELECT count(*), sum(temperature) FROM thermometer"), [(5, 10.0)])
+        self.assertEqual(self.select("SELECT device, temperature_count FROM thermometer_rollup_1d"), [('attic', 5)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,164 +1,530 @@
+import signal
 import sqlite3
+import struct
 import sys
 import time
 from datetime import datetime, timezone
 import logging
 import serial
+import collector
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def parse_stream(stream):
-    timestamp = datetime.now(timezone.utc)
+# DLMS/COSEM data type tags of fixed size integers: tag -> (width, signed)
+INTEGER_TYPES = {
+    0x05: (4, True),   # double-long
+    0x06: (4, False),  # double-long-unsigned
+    0x0f: (1, True),   # integer
+    0x10: (2, True),   # long
+    0x11: (1, False),  # unsigned
+    0x12: (2, False),  # long-unsigned
+    0x14: (8, True),   # long64
+    0x15: (8, False),  # long64-unsigned
+    0x16: (1, False),  # enum
+}
+STRING_TYPES = {0x09, 0x0a}  # octet-string, visible-string
+OBIS_TAG = b'\x09\x06'
+
+def decode_value(frame, offset):
+    """Decode the DLMS value starting at offset. Returns the value and the offset after it."""
+    tag = frame[offset]
+    if tag in INTEGER_TYPES:
+        width, signed = INTEGER_TYPES[tag]
+        end = offset + 1 + width
+        if end > len(frame):
+            raise IndexError("Truncated value.")
+        return int.from_bytes(frame[offset + 1:end], 'big', signed=signed), end
+    if tag in STRING_TYPES:
+        end = offset + 2 + frame[offset + 1]
+        if end > len(frame):
+            raise IndexError("Truncated value.")
+        return bytes(frame[offset + 2:end]), end
+    raise ValueError(f"Unsupported DLMS type {tag:#04x}.")
+
+def iter_records(frame):
+    """Yield (OBIS code, value) for every OBIS code in frame that is followed by a decodable value."""
+    start = frame.find(OBIS_TAG)
+    while start >= 0:
+        code = bytes(frame[start + 2:start + 8])
+        try:
+            value, end = decode_value(frame, start + 8)
+        except (IndexError, ValueError):
+            end = start + 2
+        else:
+            yield code, value
+        start = frame.find(OBIS_TAG, end)
+
+def scaled(factor):
+    return lambda value: value * factor
+
+def as_str(value):
+    return value.decode('ascii', 'replace')
+
+def as_clock(value):
+    """DLMS date-time: year, month, day, weekday, hour, minute, second, hundredths, deviation, status."""
+    return datetime(int.from_bytes(value[0:2], 'big'), value[2], value[3], value[5], value[6], value[7])
+
+def as_encoded(value):
+    """The value as its DLMS double-long-unsigned encoding, type tag included.
+
+    Cumulative_hourly_active_export_kVArh has always been stored this way, as
+    a BLOB in its VARCHAR column, so new rows match the ones already there.
+    """
+    return b'\x06' + round(value).to_bytes(4, 'big')
+
+def obis(code):
+    return bytes(int(part) for part in code.split('.'))
+
+# OBIS code -> (field, convert) per meter list, keyed by the start of the list version.
+# Values are converted to the units the Kamstrup lists use, which is what the tables hold.
+# Kaifa lists identify their values by position rather than by OBIS code, so
+# they cannot be decoded through this table and are not supported.
+OBIS_LISTS = {
+    'Kamstrup': {
+        obis('1.1.0.2.129.255'): ('OBIS_List_version', as_str),
+        obis('1.1.0.0.5.255'): ('METER_ID', as_str),
+        obis('1.1.96.1.1.255'): ('METER_TYPE', as_str),
+        obis('1.1.1.7.0.255'): ('ACTIVE_POWER_PLUS', int),
+        obis('1.1.2.7.0.255'): ('ACTIVE_POWER_MINUS', int),
+        obis('1.1.3.7.0.255'): ('REACTIVE_POWER_PLUS', int),
+        obis('1.1.4.7.0.255'): ('REACTIVE_POWER_MINUS', int),
+        obis('1.1.31.7.0.255'): ('CURRENT_PHASE_L1', int),
+        obis('1.1.51.7.0.255'): ('CURRENT_PHASE_L2', int),
+        obis('1.1.71.7.0.255'): ('CURRENT_PHASE_L3', int),
+        obis('1.1.32.7.0.255'): ('VOLTAGE_PHASE_L1', int),
+        obis('1.1.52.7.0.255'): ('VOLTAGE_PHASE_L2', int),
+        obis('1.1.72.7.0.255'): ('VOLTAGE_PHASE_L3', int),
+        obis('0.1.1.0.0.255'): ('Clock_and_date', as_clock),
+        obis('1.1.1.8.0.255'): ('Cumulative_hourly_active_import_kWh', int),
+        obis('1.1.2.8.0.255'): ('Cumulative_hourly_active_export_kWh', int),
+        obis('1.1.3.8.0.255'): ('Cumulative_hourly_reactive_import_kVArh', int),
+        obis('1.1.4.8.0.255'): ('Cumulative_hourly_active_export_kVArh', as_encoded),
+    },
+    'AIDON': {
+        obis('1.1.0.2.129.255'): ('OBIS_List_version', as_str),
+        obis('0.0.96.1.0.255'): ('METER_ID', as_str),
+        obis('0.0.96.1.7.255'): ('METER_TYPE', as_str),
+        obis('1.0.1.7.0.255'): ('ACTIVE_POWER_PLUS', int),
+        obis('1.0.2.7.0.255'): ('ACTIVE_POWER_MINUS', int),
+        obis('1.0.3.7.0.255'): ('REACTIVE_POWER_PLUS', int),
+        obis('1.0.4.7.0.255'): ('REACTIVE_POWER_MINUS', int),
+        obis('1.0.31.7.0.255'): ('CURRENT_PHASE_L1', scaled(10)),
+        obis('1.0.51.7.0.255'): ('CURRENT_PHASE_L2', scaled(10)),
+        obis('1.0.71.7.0.255'): ('CURRENT_PHASE_L3', scaled(10)),
+        obis('1.0.32.7.0.255'): ('VOLTAGE_PHASE_L1', scaled(0.1)),
+        obis('1.0.52.7.0.255'): ('VOLTAGE_PHASE_L2', scaled(0.1)),
+        obis('1.0.72.7.0.255'): ('VOLTAGE_PHASE_L3', scaled(0.1)),
+        obis('0.0.1.0.0.255'): ('Clock_and_date', as_clock),
+        # The energy registers carry scaler 1 on both meters, so they need no conversion.
+        obis('1.0.1.8.0.255'): ('Cumulative_hourly_active_import_kWh', int),
+        obis('1.0.2.8.0.255'): ('Cumulative_hourly_active_export_kWh', int),
+        obis('1.0.3.8.0.255'): ('Cumulative_hourly_reactive_import_kVArh', int),
+        obis('1.0.4.8.0.255'): ('Cumulative_hourly_active_export_kVArh', as_encoded),
+    },
+}
+LIST_VERSION_CODE = obis('1.1.0.2.129.255')
+DEFAULT_OBIS_LIST = 'Kamstrup'
+
+def obis_list_for(version):
+    if version:
+        for prefix, codes in OBIS_LISTS.items():
+            if version.startswith(prefix.encode()):
+                return codes
+    return OBIS_LISTS[DEFAULT_OBIS_LIST]
+
+def decode_frame(frame):
+    """Decode the OBIS records of one frame into a dict of fields."""
+    records = dict(iter_records(frame))
+    codes = obis_list_for(records.get(LIST_VERSION_CODE))
+    data = {}
+    for code, value in records.items():
+        entry = codes.get(code)
+        if entry is not None:
+            field, convert = entry
+            try:
+                data[field] = convert(value)
+            except (ValueError, IndexError):
+                # E.g. a clock field shorter than a date-time, in a list with a valid FCS.
+                logger.warning(f"Invalid value for {field}: {value!r}")
+    return data
+
+def decode_frames(frames):
+    """Decode many frames, e.g. from a capture file, into one list of values per field."""
+    columns = {}
+    for i, frame in enumerate(frames):
+        for field, value in decode_frame(frame).items():
+            columns.setdefault(field, [None] * i).append(value)
+        for values in columns.values():
+            if len(values) <= i:
+                values.append(None)
+    return columns
+
+def parse_stream(stream, timestamp=None):
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc)
     data = {
         'timestamp': timestamp.replace(microsecond=0, second=timestamp.second - timestamp.second % 5),
     }
-    for part in stream.split(b'\x09\x06'):
-        match list(part):
-            case [1, 1, 0, 2, 129, 255, *rest]:
-                data['OBIS_List_version'] = int.from_bytes(bytes(rest[2:]))
-            case [1, 1, 0, 0, 5, 255, *rest]:
-                data['METER_ID'] = int.from_bytes(bytes(rest[2:]))
-            case [1, 1, 96, 1, 1, 255, *rest]:
-                data['METER_TYPE'] = bytes(rest[2:])
-            case [1, 1, 1, 7, 0, 255, *rest]:
-                data['ACTIVE_POWER_PLUS'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 2, 7, 0, 255, *rest]:
-                data['ACTIVE_POWER_MINUS'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 3, 7, 0, 255, *rest]:
-                data['REACTIVE_POWER_PLUS'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 4, 7, 0, 255, *rest]:
-                data['REACTIVE_POWER_MINUS'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 31, 7, 0, 255, *rest]:
-                data['CURRENT_PHASE_L1'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 51, 7, 0, 255, *rest]:
-                data['CURRENT_PHASE_L2'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 71, 7, 0, 255, *rest]:
-                data['CURRENT_PHASE_L3'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 32, 7, 0, 255, *rest]:
-                data['VOLTAGE_PHASE_L1'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 52, 7, 0, 255, *rest]:
-                data['VOLTAGE_PHASE_L2'] = int.from_bytes(bytes(rest[-2:]))
-            case [1, 1, 72, 7, 0, 255, *rest]:
-                data['VOLTAGE_PHASE_L3'] = int.from_bytes(bytes(rest[-2:]))
-            case [0, 1, 1, 0, 0, 255, *rest]:
-                data['Clock_and_date'] = bytes(rest)
-            case [1, 1, 1, 8, 0, 255, *rest]:
-                data['Cumulative_hourly_active_import_kWh'] = int.from_bytes(bytes(rest[2:]))
-            case [1, 1, 2, 8, 0, 255, *rest]:
-                data['Cumulative_hourly_active_export_kWh'] = int.from_bytes(bytes(rest[2:]))
-            case [1, 1, 3, 8, 0, 255, *rest]:
-                data['Cumulative_hourly_reactive_import_kVArh'] = int.from_bytes(bytes(rest[2:]))
-            case [1, 1, 4, 8, 0, 255, *rest]:
-                data['Cumulative_hourly_active_export_kVArh'] = bytes(rest)
-
+    data.update(decode_frame(stream))
     return data
 
-def store_data(data, database):
-    table = 'kamstrup_1hour' if data['timestamp'].second % 10 == 5 else 'kamstrup_10sec'
-    with sqlite3.connect(database) as conn:
-        logger.debug(f"Connected to database {database}.")
+COLUMNS = [
+    ('ACTIVE_POWER_PLUS', 'INTEGER'),
+    ('ACTIVE_POWER_MINUS', 'INTEGER'),
+    ('REACTIVE_POWER_PLUS', 'INTEGER'),
+    ('REACTIVE_POWER_MINUS', 'INTEGER'),
+    ('CURRENT_PHASE_L1', 'INTEGER'),
+    ('CURRENT_PHASE_L2', 'INTEGER'),
+    ('CURRENT_PHASE_L3', 'INTEGER'),
+    ('VOLTAGE_PHASE_L1', 'INTEGER'),
+    ('VOLTAGE_PHASE_L2', 'INTEGER'),
+    ('VOLTAGE_PHASE_L3', 'INTEGER'),
+    ('Cumulative_hourly_active_import_kWh', 'INTEGER'),
+    ('Cumulative_hourly_active_export_kWh', 'INTEGER'),
+    ('Cumulative_hourly_reactive_import_kVArh', 'INTEGER'),
+    ('Cumulative_hourly_active_export_kVArh', 'VARCHAR(255)'),
+]
+# Every numeric field of the 10 second list gets rollups; the dashboard charts them in its HAN panel.
+KAMSTRUP_10SEC = collector.Sensor('kamstrup_10sec', COLUMNS, panel='HAN')
+# The hourly list is stored as it is, without rollups and not charted.
+KAMSTRUP_1HOUR = collector.Sensor('kamstrup_1hour', COLUMNS, unrolled=[name for name, _ in COLUMNS], registered=False)
+SENSORS = (KAMSTRUP_10SEC, KAMSTRUP_1HOUR)
+
+def sensor_for(data):
+    return KAMSTRUP_1HOUR if data['timestamp'].second % 10 == 5 else KAMSTRUP_10SEC
+
+def warn_legacy_tables(database):
+    """Log the tables that still use text timestamps; the writers keep storing text in them."""
+    conn = sqlite3.connect(database, timeout=60)
+    try:
+        for sensor in SENSORS:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (sensor.table,)).fetchone()
+            if exists and not collector.is_epoch_table(conn, sensor.table):
+                logger.warning(f"{sensor.table} still uses text timestamps, run read_han_migrate to convert it.")
+    finally:
+        conn.close()
+
+def store_data(data, database, partitioned=False):
+    writer = collector.DataWriter(database, SENSORS, partitioned=partitioned)
+    try:
+        writer.add(sensor_for(data), data)
+    finally:
+        writer.close()
+
+def migrate_storage(database):
+    """Convert tables with text timestamps to the compact layout in place. Returns the tables converted.
+
+    Each table is copied into a new compact table and swapped in within one transaction, so
+    readers see either the old or the new table. Rollup tables keep their contents, only their
+    triggers are recreated. The file is vacuumed afterwards to hand the freed pages back.
+    """
+    conn = sqlite3.connect(database, isolation_level=None)
+    migrated = []
+    try:
         cursor = conn.cursor()
-        # Create table if it does not exist
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS {table} (
-                timestamp TIMESTAMP PRIMARY KEY,
-                ACTIVE_POWER_PLUS INTEGER,
-                ACTIVE_POWER_MINUS INTEGER,
-                REACTIVE_POWER_PLUS INTEGER,
-                REACTIVE_POWER_MINUS INTEGER,
-                CURRENT_PHASE_L1 INTEGER,
-                CURRENT_PHASE_L2 INTEGER,
-                CURRENT_PHASE_L3 INTEGER,
-                VOLTAGE_PHASE_L1 INTEGER,
-                VOLTAGE_PHASE_L2 INTEGER,
-                VOLTAGE_PHASE_L3 INTEGER,
-                Cumulative_hourly_active_import_kWh INTEGER,
-                Cumulative_hourly_active_export_kWh INTEGER,
-                Cumulative_hourly_reactive_import_kVArh INTEGER,
-                Cumulative_hourly_active_export_kVArh VARCHAR(255)
-            )
-        """)
-        # Insert data into table
-        cursor.execute(f"""
-            INSERT INTO {table} (
-                timestamp,
-                ACTIVE_POWER_PLUS,
-                ACTIVE_POWER_MINUS,
-                REACTIVE_POWER_PLUS,
-                REACTIVE_POWER_MINUS,
-                CURRENT_PHASE_L1,
-                CURRENT_PHASE_L2,
-                CURRENT_PHASE_L3,
-                VOLTAGE_PHASE_L1,
-                VOLTAGE_PHASE_L2,
-                VOLTAGE_PHASE_L3,
-                Cumulative_hourly_active_import_kWh,
-                Cumulative_hourly_active_export_kWh,
-                Cumulative_hourly_reactive_import_kVArh,
-                Cumulative_hourly_active_export_kVArh
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.get('timestamp'),
-            data.get('ACTIVE_POWER_PLUS'),
-            data.get('ACTIVE_POWER_MINUS'),
-            data.get('REACTIVE_POWER_PLUS'),
-            data.get('REACTIVE_POWER_MINUS'),
-            data.get('CURRENT_PHASE_L1'),
-            data.get('CURRENT_PHASE_L2'),
-            data.get('CURRENT_PHASE_L3'),
-            data.get('VOLTAGE_PHASE_L1'),
-            data.get('VOLTAGE_PHASE_L2'),
-            data.get('VOLTAGE_PHASE_L3'),
-            data.get('Cumulative_hourly_active_import_kWh'),
-            data.get('Cumulative_hourly_active_export_kWh'),
-            data.get('Cumulative_hourly_reactive_import_kVArh'),
-            data.get('Cumulative_hourly_active_export_kVArh')
-        ))
-        conn.commit()
-        logger.debug("Data stored in database.")
-    logger.debug("Disconnected from database.")
-
-def read_bytes(ser):
-    """Read the raw data from serial port."""
-    byte_counter = 0
-    bytelist = b"" 
-    timeout = 7
+        for sensor in SENSORS:
+            table = sensor.table
+            exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if not exists or collector.is_epoch_table(cursor, table):
+                continue
+            logger.info(f"Migrating {table} to integer timestamps.")
+            columns = ", ".join(name for name, _ in COLUMNS)
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                collector.create_table(cursor, collector.Sensor(f"{table}_migrating", sensor.fields, sensor.key))
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {table}_migrating (timestamp, {columns})
+                    SELECT CAST(strftime('%s', timestamp) AS INTEGER), {columns}
+                    FROM {table}
+                    WHERE timestamp IS NOT NULL
+                """)
+                cursor.execute(f"DROP TABLE {table}")
+                cursor.execute(f"ALTER TABLE {table}_migrating RENAME TO {table}")
+                if sensor.rollup_columns:
+                    collector.create_rollups(cursor, table, sensor.rollup_columns, key=sensor.key)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            migrated.append(table)
+        if migrated:
+            logger.info("Vacuuming database.")
+            cursor.execute("VACUUM")
+    finally:
+        conn.close()
+    return migrated
+
+def terminate(signum, frame):
+    raise SystemExit(0)
+
+FLAG = 0x7e
+# Seconds to wait for a complete frame before giving up on the port. The meter
+# sends a list every 10 seconds, so a quiet gap between lists must not count
+# as a dead port; only several missed lists in a row do.
+FRAME_TIMEOUT = 30
+
+def _crc16_x25_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+CRC16_X25_TABLE = _crc16_x25_table()
+
+def crc16_x25(data):
+    """CRC-16/X-25 as used for the HCS and FCS of HDLC frames."""
+    crc = 0xffff
+    for byte in data:
+        crc = (crc >> 8) ^ CRC16_X25_TABLE[(crc ^ byte) & 0xff]
+    return crc ^ 0xffff
+
+class FrameDecoder:
+    """Split a serial byte stream into HDLC frames.
+
+    Bytes are appended to a bytearray. A frame is located by its opening flag and
+    the 11-bit length in the frame format field, so 0x7e bytes inside the payload
+    are not mistaken for the end of a frame. Frames with a bad FCS are dropped.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.dropped = 0
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next_frame(self):
+        """Return the header and information field of the next frame, or None if more bytes are needed."""
+        buffer = self.buffer
+        while True:
+            start = buffer.find(FLAG)
+            if start < 0:
+                buffer.clear()
+                return None
+            if start:
+                del buffer[:start]
+            if len(buffer) < 3:
+                return None
+            # Frame format type 3: 1010 S LLL LLLLLLLL
+            if buffer[1] & 0xf0 != 0xa0:
+                del buffer[:1]
+                continue
+            length = (buffer[1] & 0x07) << 8 | buffer[2]
+            if len(buffer) < length + 2:
+                return None
+            if buffer[length + 1] != FLAG or length < 4:
+                del buffer[:1]
+                continue
+            view = memoryview(buffer)
+            valid = crc16_x25(view[1:length - 1]) == int.from_bytes(view[length - 1:length + 1], 'little')
+            frame = bytes(view[1:length - 1]) if valid else None
+            view.release()
+            # Keep the closing flag, it may also open the next frame.
+            del buffer[:length + 1]
+            if frame is None:
+                self.dropped += 1
+                logger.warning("Dropped frame with bad checksum.")
+                continue
+            return frame
+
+def read_frame(ser, decoder, timeout=FRAME_TIMEOUT):
+    """Read from the serial port until the decoder has a complete frame."""
+    deadline = time.monotonic() + timeout
     while True:
-        data = ser.read()
-        if data:
-            bytelist = bytelist + data
-            if data == b'\x7e' and byte_counter > 1:
-                logger.debug(f"Read {len(bytelist)} bytes")
-                return bytelist
-            byte_counter = byte_counter + len(data)
-        else:
-            if timeout < 0:
-                raise TimeoutError()
-            logger.debug(f"Sleeping 2.5")
-            time.sleep(2.5)
-            timeout = timeout - 2.5
+        frame = decoder.next_frame()
+        if frame is not None:
+            logger.debug(f"Read frame of {len(frame)} bytes")
+            return frame
+        if time.monotonic() > deadline:
+            raise TimeoutError()
+        # Blocks for at most the port timeout when nothing is waiting.
+        decoder.feed(ser.read(ser.in_waiting or 1))
+
+def open_serial_port():
+    return serial.Serial(port='/dev/ttyUSB0', baudrate=2400, timeout=1, parity='N', stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS)
+
+# ===============================
+# Capture and replay
+# ===============================
+
+# A capture file is CAPTURE_MAGIC followed by one record per serial read:
+# float64 epoch seconds and uint32 byte count, little-endian, then the raw bytes.
+CAPTURE_MAGIC = b'HANCAP1\n'
+CAPTURE_RECORD = struct.Struct('<dI')
+
+def write_capture_record(file, timestamp, data):
+    file.write(CAPTURE_RECORD.pack(timestamp, len(data)))
+    file.write(data)
+
+def read_capture(path):
+    """Yield (epoch seconds, bytes) for every read recorded in a capture file."""
+    with open(path, 'rb') as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a HAN capture file.")
+        while header := file.read(CAPTURE_RECORD.size):
+            timestamp, size = CAPTURE_RECORD.unpack(header)
+            yield timestamp, file.read(size)
+
+def capture(ser, path, duration):
+    """Record everything read from the serial port for duration seconds."""
+    deadline = time.monotonic() + duration
+    with open(path, 'wb') as file:
+        file.write(CAPTURE_MAGIC)
+        while time.monotonic() < deadline:
+            data = ser.read(ser.in_waiting or 1)
+            if data:
+                write_capture_record(file, time.time(), data)
+
+class FakeSerial:
+    """Stand-in for serial.Serial that serves the reads of a capture file.
+
+    With realtime, reads are held back until the same time has passed as between
+    the recorded reads. Raises EOFError once the capture is exhausted.
+    """
+    def __init__(self, path, realtime=False):
+        self.records = read_capture(path)
+        self.realtime = realtime
+        self.timestamp = None
+        self.pending = b''
+        self.started = None
+
+    @property
+    def in_waiting(self):
+        return len(self.pending)
+
+    def read(self, size=1):
+        if not self.pending:
+            record = next(self.records, None)
+            if record is None:
+                raise EOFError()
+            self.timestamp, self.pending = record
+            if self.realtime:
+                if self.started is None:
+                    self.started = (time.monotonic(), self.timestamp)
+                delay = self.started[0] + self.timestamp - self.started[1] - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def close(self):
+        self.records.close()
+
+def replay(path, database=':memory:', realtime=False):
+    """Feed a capture through the frame decoder and the writer. Returns throughput statistics."""
+    ser = FakeSerial(path, realtime)
+    decoder = FrameDecoder()
+    writer = collector.DataWriter(database, SENSORS, batch_size=12)
+    frames = 0
+    decode_time = 0.0
+    write_time = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                frame = read_frame(ser, decoder)
+            except EOFError:
+                break
+            data = parse_stream(frame, datetime.fromtimestamp(ser.timestamp, timezone.utc))
+            decoded = time.perf_counter()
+            writer.add(sensor_for(data), data)
+            write_time += time.perf_counter() - decoded
+            decode_time += decoded - started
+            frames += 1
+        started = time.perf_counter()
+        writer.close()
+        write_time += time.perf_counter() - started
+    finally:
+        ser.close()
+    return {
+        'frames': frames,
+        'dropped': decoder.dropped,
+        'rows': writer.rows_written,
+        'frames_per_second': frames / decode_time if decode_time else 0.0,
+        'us_per_frame': decode_time / frames * 1e6 if frames else 0.0,
+        'inserts_per_second': writer.rows_written / write_time if write_time else 0.0,
+    }
+
+def capture_main():
+    if len(sys.argv) < 3 or not sys.argv[2].isdigit():
+        logger.error("USAGE: read_han_capture FILE SECONDS")
+        sys.exit(1)
+    serial_port = open_serial_port()
+    try:
+        capture(serial_port, sys.argv[1], int(sys.argv[2]))
+    finally:
+        serial_port.close()
+
+def replay_main():
+    args = [arg for arg in sys.argv[1:] if arg != '--realtime']
+    if not args:
+        logger.error("USAGE: read_han_replay CAPTURE [DATABASE] [--realtime]")
+        sys.exit(1)
+    stats = replay(args[0], args[1] if len(args) > 1 else ':memory:', '--realtime' in sys.argv)
+    print(f"frames:       {stats['frames']} ({stats['dropped']} dropped)")
+    print(f"rows:         {stats['rows']}")
+    print(f"frames/s:     {stats['frames_per_second']:.0f}")
+    print(f"us per frame: {stats['us_per_frame']:.1f}")
+    print(f"inserts/s:    {stats['inserts_per_second']:.0f}")
+
+def migrate_main():
+    if len(sys.argv) < 2:
+        logger.error("USAGE: read_han_migrate DATABASE")
+        sys.exit(1)
+    migrated = migrate_storage(sys.argv[1])
+    print(f"migrated: {', '.join(migrated) or 'nothing to do'}")
 
 def main():
+    partitioned = '--partitioned' in sys.argv
+    if partitioned:
+        sys.argv.remove('--partitioned')
+    ingest = None
+    if '--ingest' in sys.argv:
+        index = sys.argv.index('--ingest')
+        ingest = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
     database = sys.argv[1]
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    flush_interval = float(sys.argv[3]) if len(sys.argv) > 3 else 60
+    warn_legacy_tables(database)
+    if ingest:
+        writer = collector.IngestWriter(database, ingest, SENSORS, batch_size, flush_interval)
+    else:
+        writer = collector.DataWriter(database, SENSORS, batch_size, flush_interval, partitioned)
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        read_loop(writer)
+    finally:
+        writer.close()
+
+def read_loop(writer):
+    database = writer.database
     attempts = 100
     retry_count = 0
     one_time_message = f"Started writing data to {database}. Press Ctrl+C to stop."
-    serial_port = serial.Serial(port='/dev/ttyUSB0', baudrate=2400, timeout=0, parity='N', stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS)
+    serial_port = open_serial_port()
+    decoder = FrameDecoder()
     while True:
+        # Also runs after a read timed out, so buffered frames are written while the meter is silent.
+        try:
+            writer.flush_if_due()
+        except Exception:
+            logger.error("Writing buffered frames failed, keeping them for the next flush.", exc_info=True)
         try:
-            time.sleep(5 - datetime.now().second % 5)
             if serial_port is None:
                 logger.debug("Connecting to device.")
-                serial_port = serial.Serial(port='/dev/ttyUSB0', baudrate=2400, timeout=0, parity='N', stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS)
-            data = parse_stream(read_bytes(serial_port))
+                serial_port = open_serial_port()
+                decoder = FrameDecoder()
+            data = parse_stream(read_frame(serial_port, decoder))
             logger.debug("Read sensor data.")
             if len(data) == 0:
                 logger.warning("No data read from sensor.")
                 continue
-            store_data(data, database)
+            writer.add(sensor_for(data), data)
             if retry_count > 0:
                 logger.info("Connection re-established.")
                 retry_count = 0
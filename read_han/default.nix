@@ -19,18 +19,33 @@ in
         default = cfg.database;
         description = "Path to the SQLite database.";
       };
+
+      batchSize = mkOption {
+        type = types.int;
+        default = 12;
+        description = "Number of frames buffered before they are written in one transaction.";
+      };
+
+      flushInterval = mkOption {
+        type = types.int;
+        default = 60;
+        description = "Maximum number of seconds a frame is buffered before it is written.";
+      };
     };
   };
 
   config = mkIf cfg.han.enable {
     systemd.services.read_han = {
       description = "HAN Data Collection Service";
-      after = [ "local-fs.target" ];
+      after = [ "local-fs.target" ] ++ optional cfg.ingest.enable "smarthome-ingest.service";
+      requires = optional cfg.ingest.enable "smarthome-ingest.service";
 
       serviceConfig = {
-        ExecStart = "${pkgs.callPackage ./read_han.nix {}}/bin/read_han ${cfg.han.database}";
+        ExecStart = "${pkgs.callPackage ./read_han.nix {}}/bin/read_han ${if cfg.ingest.enable then "--ingest ${cfg.ingest.socket} " else optionalString cfg.partitioned "--partitioned "}${cfg.han.database} ${toString cfg.han.batchSize} ${toString cfg.han.flushInterval}";
         User = "smarthome-han";
         Group = "smarthome";
+        # Partition files are shared with the other collectors of the group.
+        UMask = "0002";
       };
     };
 
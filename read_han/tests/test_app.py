@@ -0,0 +1,166 @@
+import unittest
+import logging
+import os
+import tempfile
+from unittest import mock
+
+def hdlc_frame(payload):
+    """Wrap payload in an HDLC frame of format type 3 with a valid FCS, flags included."""
+    from app import crc16_x25
+    length = len(payload) + 4
+    body = bytes((0xa0 | length >> 8, length & 0xff)) + payload
+    return b'\x7e' + body + crc16_x25(body).to_bytes(2, 'little') + b'\x7e'
+
+def record(code, tag, value):
+    """One OBIS record: the code as octet-string followed by a DLMS value."""
+    data = bytes((tag, len(value))) + value if tag in (0x09, 0x0a) else bytes((tag,)) + value
+    return b'\x09\x06' + bytes(int(part) for part in code.split('.')) + data
+
+def aidon_record(code, tag, value, scaler=None, unit=None):
+    """One AIDON list entry: a structure of the OBIS code, the value and, for measurements, its scaler and unit."""
+    if scaler is None:
+        return b'\x02\x02' + record(code, tag, value)
+    return b'\x02\x03' + record(code, tag, value) + bytes((0x02, 0x02, 0x0f, scaler & 0xff, 0x16, unit))
+
+KAMSTRUP_LIST = hdlc_frame(
+    record('1.1.0.2.129.255', 0x0a, b'Kamstrup_V0001')
+    + record('1.1.1.7.0.255', 0x06, (1234).to_bytes(4, 'big'))
+)
+
+# An hourly AIDON list, laid out like the meter sends it: LLC bytes and the
+# data-notification APDU, then an array of one structure per register.
+AIDON_LIST = hdlc_frame(
+    bytes.fromhex('e6e700') + bytes.fromhex('0f40000000') + b'\x00' + b'\x01\x10'
+    + aidon_record('1.1.0.2.129.255', 0x0a, b'AIDON_V0001')
+    + aidon_record('0.0.96.1.0.255', 0x0a, b'7359992890941742')
+    + aidon_record('0.0.96.1.7.255', 0x0a, b'6841131BN243101040')
+    + aidon_record('1.0.1.7.0.255', 0x06, (1680).to_bytes(4, 'big'), 0, 0x1b)
+    + aidon_record('1.0.2.7.0.255', 0x06, (0).to_bytes(4, 'big'), 0, 0x1b)
+    + aidon_record('1.0.3.7.0.255', 0x06, (0).to_bytes(4, 'big'), 0, 0x1d)
+    + aidon_record('1.0.4.7.0.255', 0x06, (315).to_bytes(4, 'big'), 0, 0x1d)
+    + aidon_record('1.0.31.7.0.255', 0x10, (72).to_bytes(2, 'big'), -1, 0x21)
+    + aidon_record('1.0.51.7.0.255', 0x10, (15).to_bytes(2, 'big'), -1, 0x21)
+    + aidon_record('1.0.71.7.0.255', 0x10, (40).to_bytes(2, 'big'), -1, 0x21)
+    + aidon_record('1.0.32.7.0.255', 0x12, (2312).to_bytes(2, 'big'), -1, 0x23)
+    + aidon_record('1.0.52.7.0.255', 0x12, (2307).to_bytes(2, 'big'), -1, 0x23)
+    + aidon_record('1.0.72.7.0.255', 0x12, (2330).to_bytes(2, 'big'), -1, 0x23)
+    + aidon_record('0.0.1.0.0.255', 0x09, bytes.fromhex('07e40a0e030e0000ff800000'))
+    + aidon_record('1.0.1.8.0.255', 0x06, (2879611).to_bytes(4, 'big'), 1, 0x1e)
+    + aidon_record('1.0.2.8.0.255', 0x06, (0).to_bytes(4, 'big'), 1, 0x1e)
+    + aidon_record('1.0.3.8.0.255', 0x06, (16).to_bytes(4, 'big'), 1, 0x20)
+    + aidon_record('1.0.4.8.0.255', 0x06, (1138302).to_bytes(4, 'big'), 1, 0x20)
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class MeterSerial:
+    """A serial port with a 1 second read timeout on a meter sending frame every period seconds.
+
+    Raises KeyboardInterrupt once the clock reaches stop, to end read_loop.
+    """
+    def __init__(self, frame, period, clock, stop=None):
+        self.frame = frame
+        self.period = period
+        self.clock = clock
+        self.stop = stop
+        self.next_frame = period
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def read(self, size=1):
+        if self.stop is not None and self.clock.now >= self.stop:
+            raise KeyboardInterrupt()
+        if self.clock.now >= self.next_frame:
+            self.next_frame += self.period
+            return self.frame
+        self.clock.now += 1
+        return b''
+
+    def close(self):
+        pass
+
+class TestReadHan(unittest.TestCase):
+    @unittest.skipIf(not os.path.exists("app.py"), "read_han not yet present")
+    def test_read_frame_waits_through_the_gaps_of_a_10_second_cadence(self):
+        import app
+        clock = Clock()
+        port = MeterSerial(KAMSTRUP_LIST, 10, clock)
+        decoder = app.FrameDecoder()
+        with mock.patch.object(app.time, 'monotonic', clock):
+            frames = [app.read_frame(port, decoder) for _ in range(6)]
+        self.assertEqual(clock.now, 60)
+        self.assertEqual(app.decode_frame(frames[0]), {'OBIS_List_version': 'Kamstrup_V0001', 'ACTIVE_POWER_PLUS': 1234})
+
+    @unittest.skipIf(not os.path.exists("app.py"), "read_han not yet present")
+    def test_decode_frame_skips_a_truncated_clock(self):
+        import app
+        frame = hdlc_frame(
+            record('1.1.0.2.129.255', 0x0a, b'Kamstrup_V0001')
+            + record('0.1.1.0.0.255', 0x09, bytes((0x07, 0xe8, 1, 1)))
+            + record('1.1.1.7.0.255', 0x06, (1234).to_bytes(4, 'big'))
+        )
+        decoder = app.FrameDecoder()
+        decoder.feed(frame)
+        with self.assertLogs(app.logger, logging.WARNING):
+            data = app.decode_frame(decoder.next_frame())
+        self.assertEqual(data, {'OBIS_List_version': 'Kamstrup_V0001', 'ACTIVE_POWER_PLUS': 1234})
+
+    @unittest.skipIf(not os.path.exists("app.py"), "read_han not yet present")
+    def test_decode_frame_converts_an_aidon_list_to_kamstrup_units(self):
+        import app
+        from datetime import datetime
+        decoder = app.FrameDecoder()
+        decoder.feed(AIDON_LIST)
+        data = app.decode_frame(decoder.next_frame())
+        self.assertEqual(data['METER_ID'], '7359992890941742')
+        self.assertEqual(data['ACTIVE_POWER_PLUS'], 1680)
+        self.assertEqual(data['REACTIVE_POWER_MINUS'], 315)
+        # Kamstrup reports current in 0.01 A and voltage in V, AIDON in 0.1 A and 0.1 V.
+        self.assertEqual(data['CURRENT_PHASE_L1'], 720)
+        self.assertAlmostEqual(data['VOLTAGE_PHASE_L1'], 231.2)
+        self.assertEqual(data['Clock_and_date'], datetime(2020, 10, 14, 14, 0, 0))
+        # Both meters report energy in 10 Wh (scaler 1), so the counters are stored as they are.
+        self.assertEqual(data['Cumulative_hourly_active_import_kWh'], 2879611)
+        self.assertEqual(data['Cumulative_hourly_active_export_kWh'], 0)
+        self.assertEqual(data['Cumulative_hourly_reactive_import_kVArh'], 16)
+        self.assertEqual(data['Cumulative_hourly_active_export_kVArh'], b'\x06' + (1138302).to_bytes(4, 'big'))
+
+    @unittest.skipIf(not os.path.exists("app.py"), "read_han not yet present")
+    def test_read_frame_gives_up_on_a_silent_port(self):
+        import app
+        clock = Clock()
+        with mock.patch.object(app.time, 'monotonic', clock):
+            with self.assertRaises(TimeoutError):
+                app.read_frame(MeterSerial(KAMSTRUP_LIST, 3600, clock), app.FrameDecoder())
+        self.assertLess(clock.now, 3600)
+
+    @unittest.skipIf(not os.path.exists("app.py"), "read_han not yet present")
+    def test_read_loop_keeps_the_port_open_between_lists(self):
+        import app
+        import collector
+        clock = Clock()
+        opened = []
+
+        def open_serial_port():
+            opened.append(MeterSerial(KAMSTRUP_LIST, 10, clock, stop=60))
+            return opened[-1]
+
+        with tempfile.TemporaryDirectory() as directory:
+            writer = collector.DataWriter(os.path.join(directory, 'test.db'), app.SENSORS)
+            with mock.patch.object(app.time, 'monotonic', clock), \
+                    mock.patch.object(app, 'open_serial_port', open_serial_port), \
+                    self.assertNoLogs(app.logger, logging.ERROR):
+                with self.assertRaises(KeyboardInterrupt):
+                    app.read_loop(writer)
+            writer.close()
+        self.assertEqual(len(opened), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,11 @@
 import asyncio
 from bleak import BleakClient
+import signal
 import sqlite3
 import sys
-import time
 import struct
-from datetime import datetime, timezone
 import logging
+import collector
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -15,18 +15,106 @@ logger = logging.getLogger(__name__)
 # Class WavePlus
 # ===============================
 
+# Seconds a read on an open connection may take before the connection is dropped.
+READ_TIMEOUT = 10
+
 class WavePlus:
-    def __init__(self, serial_number):
+    def __init__(self, serial_number, persistent=False):
         self.periph = None
         self.curr_val_char = None
         self.mac_addr = None
         self.sn = serial_number
         self.uuid = "b42e2a68-ade7-11e4-89d3-123b93f75cba"
         self.prev_rawdata = None
+        self.persistent = persistent
+        self.client = None
+        self.notifying = False
+        self.notified = None
+        self.last_read = None
+        # Held while connecting or disconnecting, by reads and by the watchdog alike.
+        self.lock = asyncio.Lock()
 
     async def read(self):
-        async with BleakClient(self.mac_addr) as client:
-            return await client.read_gatt_char(self.uuid)
+        if not self.persistent:
+            async with BleakClient(self.mac_addr) as client:
+                return await client.read_gatt_char(self.uuid)
+        try:
+            client = await self.connect()
+            if self.notifying and self.notified is not None:
+                rawdata, self.notified = self.notified, None
+            else:
+                rawdata = await asyncio.wait_for(client.read_gatt_char(self.uuid), READ_TIMEOUT)
+        except Exception:
+            await self.disconnect()
+            raise
+        self.last_read = asyncio.get_running_loop().time()
+        return rawdata
+
+    async def connect(self):
+        """Return the open connection, connecting and subscribing to notifications if needed.
+
+        A read and the watchdog may both find the connection down. The second to
+        get the lock gets the connection the first opened, rather than replacing a
+        client that is still connecting.
+        """
+        async with self.lock:
+            return await self._connect()
+
+    async def _connect(self):
+        if self.client is not None and self.client.is_connected:
+            return self.client
+        await self._disconnect()
+        self.client = BleakClient(self.mac_addr, disconnected_callback=self._on_disconnect)
+        await self.client.connect()
+        logger.info(f"Connected to {self.mac_addr}.")
+        characteristic = self.client.services.get_characteristic(self.uuid)
+        if characteristic is not None and 'notify' in characteristic.properties:
+            await self.client.start_notify(self.uuid, self._on_notify)
+            self.notifying = True
+            logger.info(f"Subscribed to current values of {self.mac_addr}.")
+        return self.client
+
+    async def disconnect(self):
+        async with self.lock:
+            await self._disconnect()
+
+    async def _disconnect(self):
+        client, self.client = self.client, None
+        self.notifying = False
+        self.notified = None
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                logger.debug(f"Failed to disconnect from {self.mac_addr}.", exc_info=True)
+
+    async def watchdog(self, interval, connections):
+        """Reconnect a dropped connection, and drop one that has not delivered data for three intervals."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self.last_read is not None and loop.time() - self.last_read > 3 * interval:
+                logger.warning(f"No data from {self.mac_addr} for {loop.time() - self.last_read:.0f} seconds. Reconnecting.")
+                self.last_read = None
+                await self.disconnect()
+            if self.client is None or not self.client.is_connected:
+                try:
+                    async with connections:
+                        await self.connect()
+                except Exception:
+                    logger.warning(f"Reconnecting to {self.mac_addr} failed.", exc_info=True)
+                    await self.disconnect()
+
+    def __str__(self):
+        return self.mac_addr or str(self.sn)
+
+    def _on_disconnect(self, client):
+        if client is self.client:
+            logger.warning(f"Disconnected from {self.mac_addr}.")
+            self.notifying = False
+
+    def _on_notify(self, characteristic, data):
+        self.notified = bytes(data)
 
     async def get_sensor_data(self, compare=False):
         rawdata = await self.read()
@@ -79,88 +167,193 @@ class Sensors:
         logger.error(f"Radon value out of range. {radon_raw}")
         return "N/A"
 
-def store_data(data, database):
-    with sqlite3.connect(database) as conn:
-        logger.debug(f"Connected to database {database}.")
+COLUMNS = [
+    ('humidity', 'REAL'),
+    ('radon_st_avg', 'INTEGER'),
+    ('radon_lt_avg', 'INTEGER'),
+    ('temperature', 'REAL'),
+    ('pressure', 'REAL'),
+    ('co2', 'INTEGER'),
+    ('voc', 'INTEGER'),
+    ('device', 'TEXT'),
+]
+# Samples are keyed by (timestamp, device) so devices read in the same second do not collide.
+SENSOR = collector.Sensor('sensor_data', COLUMNS, key=['device'], panel='Wave Plus')
+
+def upgrade_legacy_table(database):
+    """Add the columns newer versions write to a sensor_data table that still uses text timestamps."""
+    conn = sqlite3.connect(database, timeout=60)
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensor_data'").fetchone()
+        if not exists or collector.is_epoch_table(conn, 'sensor_data'):
+            return
+        logger.warning("sensor_data still uses text timestamps, run read_waveplus_migrate to convert it.")
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(sensor_data)")}
+        with conn:
+            for name, type_ in COLUMNS:
+                if name not in existing:
+                    # The rows already there belong to the device '', like the migration stores them.
+                    default = " NOT NULL DEFAULT ''" if name in SENSOR.key else ""
+                    conn.execute(f"ALTER TABLE sensor_data ADD COLUMN {name} {type_}{default}")
+    finally:
+        conn.close()
+
+def store_data(data, database, partitioned=False):
+    upgrade_legacy_table(database)
+    writer = collector.DataWriter(database, [SENSOR], partitioned=partitioned)
+    try:
+        writer.add(SENSOR, data)
+    finally:
+        writer.close()
+
+def migrate_storage(database):
+    """Convert sensor_data from text timestamps to the compact layout in place. Returns the tables converted.
+
+    The table is copied into a new compact table and swapped in within one transaction, so
+    readers see either the old or the new table. Rollup tables keep their contents, only their
+    triggers are recreated. The file is vacuumed afterwards to hand the freed pages back.
+    """
+    conn = sqlite3.connect(database, isolation_level=None)
+    migrated = []
+    try:
         cursor = conn.cursor()
-        # Create table if it does not exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sensor_data (
-                timestamp TIMESTAMP PRIMARY KEY,
-                humidity REAL,
-                radon_st_avg INTEGER,
-                radon_lt_avg INTEGER,
-                temperature REAL,
-                pressure REAL,
-                co2 INTEGER,
-                voc INTEGER
-            )
-        """)
-        # Insert data into table
-        cursor.execute("""
-            INSERT INTO sensor_data (timestamp, humidity, radon_st_avg, radon_lt_avg, temperature, pressure, co2, voc)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (data['timestamp'], data['humidity'], data['radon_st_avg'], data['radon_lt_avg'], data['temperature'], data['pressure'], data['co2'], data['voc']))
-        conn.commit()
-        logger.debug("Data stored in database.")
-    logger.debug("Disconnected from database.")
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensor_data'").fetchone()
+        if exists and not collector.is_epoch_table(cursor, 'sensor_data'):
+            logger.info("Migrating sensor_data to integer timestamps.")
+            existing = {row[1] for row in cursor.execute("PRAGMA table_info(sensor_data)")}
+            columns = [name for name, _ in COLUMNS if name != 'device']
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                collector.create_table(cursor, collector.Sensor('sensor_data_migrating', COLUMNS, key=SENSOR.key))
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO sensor_data_migrating (timestamp, {", ".join(columns)}, device)
+                    SELECT
+                        CAST(strftime('%s', timestamp) AS INTEGER),
+                        {", ".join(name if name in existing else "NULL" for name in columns)},
+                        {"coalesce(device, '')" if 'device' in existing else "''"}
+                    FROM sensor_data
+                    WHERE timestamp IS NOT NULL
+                """)
+                cursor.execute("DROP TABLE sensor_data")
+                cursor.execute("ALTER TABLE sensor_data_migrating RENAME TO sensor_data")
+                collector.create_rollups(cursor, 'sensor_data', SENSOR.rollup_columns, key=SENSOR.key)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            migrated.append('sensor_data')
+            logger.info("Vacuuming database.")
+            cursor.execute("VACUUM")
+    finally:
+        conn.close()
+    return migrated
+
+async def read_sample(waveplus):
+    """Read one sample of waveplus for collector.collect, or None if its values have not changed."""
+    sensors, unchanged = await waveplus.get_sensor_data(compare=True)
+    if unchanged:
+        logger.debug(f"Sensor data of {waveplus} unchanged.")
+        return None
+    return {
+        'humidity': sensors.sensor_data[SENSOR_IDX_HUMIDITY],
+        'radon_st_avg': sensors.sensor_data[SENSOR_IDX_RADON_SHORT_TERM_AVG],
+        'radon_lt_avg': sensors.sensor_data[SENSOR_IDX_RADON_LONG_TERM_AVG],
+        'temperature': sensors.sensor_data[SENSOR_IDX_TEMPERATURE],
+        'pressure': sensors.sensor_data[SENSOR_IDX_REL_ATM_PRESSURE],
+        'co2': sensors.sensor_data[SENSOR_IDX_CO2_LVL],
+        'voc': sensors.sensor_data[SENSOR_IDX_VOC_LVL],
+        'device': str(waveplus),
+    }
 
 async def run(
-    serial_number,
-    mac_addr,
+    devices,
     database,
     sample_period,
+    max_connections=1,
+    persistent=False,
+    partitioned=False,
+    ingest=None,
 ):
-    waveplus = WavePlus(serial_number)
-    waveplus.mac_addr = mac_addr
-    retry_count = 0
-    one_time_message = f"Started writing data to {database} every {sample_period} seconds. Press Ctrl+C to stop."
-    while True:
-        try:
-            if one_time_message is None:
-                time.sleep(sample_period)
-            logger.debug("Connecting to device.")
-            sensors, unchanged = await waveplus.get_sensor_data(compare=True)
-            logger.debug("Read sensor data.")
-            if unchanged and retry_count == 0 and one_time_message is None:
-                logger.debug("Sensor data unchanged.")
-                continue
-            data = {
-                'timestamp': datetime.now(timezone.utc),
-                'humidity': sensors.sensor_data[SENSOR_IDX_HUMIDITY],
-                'radon_st_avg': sensors.sensor_data[SENSOR_IDX_RADON_SHORT_TERM_AVG],
-                'radon_lt_avg': sensors.sensor_data[SENSOR_IDX_RADON_LONG_TERM_AVG],
-                'temperature': sensors.sensor_data[SENSOR_IDX_TEMPERATURE],
-                'pressure': sensors.sensor_data[SENSOR_IDX_REL_ATM_PRESSURE],
-                'co2': sensors.sensor_data[SENSOR_IDX_CO2_LVL],
-                'voc': sensors.sensor_data[SENSOR_IDX_VOC_LVL]
-            }
-            store_data(data, database)
-            if retry_count > 0:
-                logger.info("Connection re-established.")
-                retry_count = 0
-            if one_time_message:
-                logger.info(one_time_message)
-                one_time_message = None
-        except Exception as e:
-            retry_count += 1
-            logger.error("Connection failed.", exc_info=not isinstance(e, (TimeoutError, BrokenPipeError)))
-            if retry_count <= 10:
-                logger.info(f"Retrying connection. Attempt {retry_count} of 10.")
-            else:
-                logger.critical("Failed too many times.", exc_info=True)
-                raise
+    """Collect from every (serial_number, mac_addr) in devices into one shared writer.
+
+    With persistent, each device stays connected between samples and a watchdog
+    keeps the connection healthy. max_connections then limits concurrent
+    connection attempts and reads rather than open connections.
+
+    With ingest, samples are sent to the ingest daemon listening on that socket
+    instead of being written to database directly.
+    """
+    upgrade_legacy_table(database)
+    if ingest:
+        writer = collector.IngestWriter(database, ingest, [SENSOR], batch_size=len(devices))
+    else:
+        writer = collector.DataWriter(database, [SENSOR], batch_size=len(devices), partitioned=partitioned)
+    connections = asyncio.Semaphore(max_connections)
+    waveplus_devices = []
+    tasks = []
+    for serial_number, mac_addr in devices:
+        waveplus = WavePlus(serial_number, persistent)
+        waveplus.mac_addr = mac_addr
+        waveplus_devices.append(waveplus)
+        tasks.append(asyncio.create_task(collector.collect(SENSOR, read_sample, waveplus, sample_period, writer, connections)))
+        if persistent:
+            tasks.append(asyncio.create_task(waveplus.watchdog(sample_period, connections)))
+    tasks.append(asyncio.create_task(writer.periodic_flush()))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: [task.cancel() for task in tasks])
+    logger.info(f"Started writing data from {len(devices)} devices to {database} every {sample_period} seconds. Press Ctrl+C to stop.")
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*(waveplus.disconnect() for waveplus in waveplus_devices))
+        writer.close()
+
+def parse_device(device, help_message):
+    """Return (serial_number, mac_addr) for an SN or MAC_ADDR argument."""
+    if device.isdigit() and len(device) == 10:
+        return int(device), None
+    if len(device) != 17:
+        logger.error("Invalid MAC_ADDR. Must be a 17-character long string.")
+        logger.info(help_message)
+        sys.exit(1)
+    if device[2::3] != ":" * 5:
+        logger.error("Invalid MAC_ADDR. Must be a 17-character long string with ':' as separators.")
+        logger.info(help_message)
+        sys.exit(1)
+    return None, device
 
 def main():
     # ===============================
     # Script guards for correct usage
     # ===============================
-    help_message = "USAGE: read_waveplus.py SN|MAC_ADDR SAMPLE-PERIOD DATABASE\n" \
+    help_message = "USAGE: read_waveplus.py [--persistent] [--partitioned] [--ingest SOCKET] SN|MAC_ADDR[,SN|MAC_ADDR...] SAMPLE-PERIOD DATABASE [MAX-CONNECTIONS]\n" \
         "    where SN is the 10-digit serial number found under the magnetic backplate of your Wave Plus.\n" \
         "    where MAC_ADDR removes the neccesity to scan for the device using SN.\n" \
         "    where SAMPLE-PERIOD is the time in seconds between reading the current values.\n" \
         "    where DATABASE is the path to the SQLite file to store the values.\n" \
-        "EXAMPLE: read_waveplus.py 1234567890 300 ./airwave_data.db"
+        "    where MAX-CONNECTIONS is the number of devices read at the same time, 1 by default.\n" \
+        "    where --persistent keeps the devices connected between samples.\n" \
+        "    where --partitioned writes the samples of each month to a database file of its own.\n" \
+        "    where --ingest sends the samples to the ingest daemon listening on SOCKET.\n" \
+        "EXAMPLE: read_waveplus.py 1234567890,AA:BB:CC:DD:EE:FF 300 ./airwave_data.db"
+    persistent = '--persistent' in sys.argv
+    if persistent:
+        sys.argv.remove('--persistent')
+    partitioned = '--partitioned' in sys.argv
+    if partitioned:
+        sys.argv.remove('--partitioned')
+    ingest = None
+    if '--ingest' in sys.argv:
+        index = sys.argv.index('--ingest')
+        if index + 1 >= len(sys.argv):
+            logger.error("Missing SOCKET after --ingest.")
+            logger.info(help_message)
+            sys.exit(1)
+        ingest = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
     if len(sys.argv) < 4:
         logger.error("Missing input argument SN|MAC_ADDR or SAMPLE-PERIOD or DATABASE.")
         logger.info(help_message)
@@ -171,30 +364,32 @@ def main():
         logger.info(help_message)
         sys.exit(1)
 
+    if len(sys.argv) > 4 and (sys.argv[4].isdigit() is not True or int(sys.argv[4]) < 1):
+        logger.error("Invalid MAX-CONNECTIONS. Must be a numerical value larger than zero.")
+        logger.info(help_message)
+        sys.exit(1)
+
     database = sys.argv[3]
     sample_period = int(sys.argv[2])
-    serial_number = None
-    mac_addr = None
-    if sys.argv[1].isdigit() and len(sys.argv[1]) == 10:
-        serial_number = int(sys.argv[1])
-    else:
-        mac_addr = sys.argv[1]
-        if mac_addr is not None:
-            if len(mac_addr) != 17:
-                logger.error("Invalid MAC_ADDR. Must be a 17-character long string.")
-                logger.info(help_message)
-                sys.exit(1)
-            if mac_addr[2::3] != ":" * 5:
-                logger.error("Invalid MAC_ADDR. Must be a 17-character long string with ':' as separators.")
-                logger.info(help_message)
-                sys.exit(1)
+    max_connections = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    devices = [parse_device(device, help_message) for device in sys.argv[1].split(',')]
 
     asyncio.run(run(
-        serial_number,
-        mac_addr,
+        devices,
         database,
         sample_period,
+        max_connections,
+        persistent,
+        partitioned,
+        ingest,
     ))
 
+def migrate_main():
+    if len(sys.argv) < 2:
+        logger.error("USAGE: read_waveplus_migrate DATABASE")
+        sys.exit(1)
+    migrated = migrate_storage(sys.argv[1])
+    print(f"migrated: {', '.join(migrated) or 'nothing to do'}")
+
 if __name__ == "__main__":
     main()
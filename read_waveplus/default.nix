@@ -15,10 +15,29 @@ in
       };
 
       device = mkOption {
-        type = types.str;
+        type = types.nullOr types.str;
+        default = null;
         description = "The serial number or MAC address of the Airwave Plus device.";
       };
 
+      devices = mkOption {
+        type = types.listOf types.str;
+        default = optional (cfg.airwave.device != null) cfg.airwave.device;
+        description = "Serial numbers or MAC addresses of all Airwave Plus devices read by the service.";
+      };
+
+      maxConnections = mkOption {
+        type = types.int;
+        default = 1;
+        description = "Number of devices the service may be connected to at the same time.";
+      };
+
+      persistent = mkOption {
+        type = types.bool;
+        default = false;
+        description = "Keep the devices connected between samples instead of reconnecting for every read.";
+      };
+
       samplerate = mkOption {
         type = types.int;
         default = 300;
@@ -36,13 +55,16 @@ in
   config = mkIf cfg.airwave.enable {
     systemd.services.airwave = {
       description = "Airwave Plus Data Collection Service";
-      after = [ "bluetooth.target" ];
+      after = [ "bluetooth.target" ] ++ optional cfg.ingest.enable "smarthome-ingest.service";
+      requires = optional cfg.ingest.enable "smarthome-ingest.service";
       wantedBy = [ "multi-user.target" ];
 
       serviceConfig = {
-        ExecStart = "${pkgs.callPackage ./read_waveplus.nix {}}/bin/read_waveplus ${cfg.airwave.device} ${toString cfg.airwave.samplerate} ${cfg.airwave.database}";
+        ExecStart = "${pkgs.callPackage ./read_waveplus.nix {}}/bin/read_waveplus ${optionalString cfg.airwave.persistent "--persistent "}${if cfg.ingest.enable then "--ingest ${cfg.ingest.socket} " else optionalString cfg.partitioned "--partitioned "}${concatStringsSep "," cfg.airwave.devices} ${toString cfg.airwave.samplerate} ${cfg.airwave.database} ${toString cfg.airwave.maxConnections}";
         User = "smarthome";
         Group = "smarthome";
+        # Partition files are shared with the other collectors of the group.
+        UMask = "0002";
       };
     };
   };
@@ -14,5 +14,6 @@ buildPythonApplication {
 
   propagatedBuildInputs = [
     bleak
+    (pkgs.callPackage ../collector/collector.nix {})
   ];
 }
\ No newline at end of file
@@ -0,0 +1,258 @@
+import lzma
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+import logging
+import collector
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Raw tables moved to the monthly archives once a whole month is older than the retention period.
+ARCHIVE_TABLES = ('kamstrup_10sec', 'kamstrup_1hour', 'sensor_data')
+ARCHIVE_SUFFIX = '.db.xz'
+
+def archive_name(month):
+    return f"{month:%Y-%m}{ARCHIVE_SUFFIX}"
+
+def month_start(timestamp):
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(month):
+    return month_start(month + timedelta(days=32))
+
+def table_exists(cursor, table, schema='main'):
+    return cursor.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def bound(cursor, table, timestamp, schema='main'):
+    """Convert a datetime to a value comparable with the timestamp column of table."""
+    return int(timestamp.timestamp()) if collector.is_epoch_table(cursor, table, schema) else str(timestamp)
+
+def archive_tables(cursor):
+    """Return ARCHIVE_TABLES and the tables of the sensors registered by collectors built on the collector runtime."""
+    tables = list(ARCHIVE_TABLES)
+    if table_exists(cursor, 'sensors'):
+        for (table,) in cursor.execute("SELECT DISTINCT table_name FROM sensors ORDER BY table_name").fetchall():
+            if table not in tables:
+                tables.append(table)
+    return tables
+
+def oldest_timestamp(cursor, table):
+    row = cursor.execute(f"SELECT timestamp FROM {table} ORDER BY timestamp ASC LIMIT 1").fetchone()
+    if row is None or row[0] is None:
+        return None
+    if isinstance(row[0], int):
+        return datetime.fromtimestamp(row[0], timezone.utc)
+    timestamp = datetime.fromisoformat(row[0])
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def partitions(cursor, database):
+    """Return {month: path} of the monthly partitions listed in the catalog of the main database."""
+    if not table_exists(cursor, 'partitions'):
+        return {}
+    directory = os.path.dirname(database)
+    return {
+        datetime.strptime(month, '%Y-%m').replace(tzinfo=timezone.utc): os.path.join(directory, path)
+        for month, path in cursor.execute("SELECT month, path FROM partitions")
+    }
+
+def archivable_months(cursor, cutoff, partitioned=()):
+    """Return the months that hold rows in the database or a partition and end before cutoff, oldest first."""
+    oldest = [oldest_timestamp(cursor, table) for table in archive_tables(cursor) if table_exists(cursor, table)]
+    oldest = [timestamp for timestamp in oldest if timestamp is not None] + list(partitioned)
+    months = []
+    if oldest:
+        month = month_start(min(oldest))
+        while next_month(month) <= cutoff:
+            months.append(month)
+            month = next_month(month)
+    return months
+
+def reroll(cursor, table, start, end):
+    """Recompute the rollup buckets of table in [start, end) from the raw rows in the attached archive.
+
+    The collectors keep the rollups current by trigger; recomputing them right
+    before the raw rows leave the database guarantees the aggregates that stay
+    behind match the archive exactly. Buckets are recomputed per key, e.g. per
+    device, when the rollup table has one.
+    """
+    if collector.is_epoch_table(cursor, table, 'archive'):
+        epoch = "timestamp"
+    else:
+        epoch = "CAST(strftime('%s', timestamp) AS INTEGER)"
+    for name, seconds in collector.ROLLUP_RESOLUTIONS.items():
+        rollup = f"{table}_rollup_{name}"
+        fields = [row[1] for row in cursor.execute(f"PRAGMA table_info({rollup})")]
+        columns = [field[:-4] for field in fields if field.endswith('_min')]
+        if not columns:
+            continue
+        key = [field for field in fields if field != 'bucket' and not field.endswith(('_min', '_max', '_sum', '_count'))]
+        # Month boundaries are bucket boundaries at every resolution.
+        cursor.execute(f"DELETE FROM {rollup} WHERE bucket >= ? AND bucket < ?", (int(start.timestamp()), int(end.timestamp())))
+        cursor.execute(f"""
+            INSERT INTO {rollup} (bucket, {"".join(f"{k}, " for k in key)}{", ".join(f"{c}_min, {c}_max, {c}_sum, {c}_count" for c in columns)})
+            SELECT {epoch} / {seconds} * {seconds} AS bucket, {"".join(f"coalesce({k}, '') AS {k}, " for k in key)}
+                {", ".join(f"min({c}), max({c}), sum({c}), count({c})" for c in columns)}
+            FROM archive.{table}
+            WHERE timestamp >= ? AND timestamp < ?
+            GROUP BY {", ".join(["bucket"] + key)}
+        """, (bound(cursor, table, start, 'archive'), bound(cursor, table, end, 'archive')))
+
+def copy_rows(cursor, table, start, end, schema='main'):
+    """Copy the rows of schema.table in [start, end) into the attached archive. Returns the rows copied.
+
+    The archive table is created with the layout of the source table. When an
+    existing archive uses the other timestamp layout, timestamps are converted.
+    """
+    if not table_exists(cursor, table, 'archive'):
+        sql = cursor.execute(f"SELECT sql FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        cursor.execute(sql.replace("CREATE TABLE ", "CREATE TABLE archive.", 1))
+    columns = [row[1] for row in cursor.execute(f"PRAGMA archive.table_info({table})")]
+    existing = {row[1] for row in cursor.execute(f"PRAGMA {schema}.table_info({table})")}
+    timestamp = "timestamp"
+    epoch = collector.is_epoch_table(cursor, table, schema)
+    archive_epoch = collector.is_epoch_table(cursor, table, 'archive')
+    if epoch and not archive_epoch:
+        timestamp = collector.EPOCH_AS_TEXT
+    elif archive_epoch and not epoch:
+        timestamp = "CAST(strftime('%s', timestamp) AS INTEGER)"
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO archive.{table} ({", ".join(columns)})
+        SELECT {", ".join(timestamp if c == 'timestamp' else c if c in existing else "NULL" for c in columns)}
+        FROM {schema}.{table}
+        WHERE timestamp >= ? AND timestamp < ?
+    """, (bound(cursor, table, start, schema), bound(cursor, table, end, schema)))
+    return cursor.rowcount
+
+def count_rows(cursor, table, start, end, schema='main'):
+    if not table_exists(cursor, table, schema):
+        return 0
+    return cursor.execute(
+        f"SELECT count(*) FROM {schema}.{table} WHERE timestamp >= ? AND timestamp < ?",
+        (bound(cursor, table, start, schema), bound(cursor, table, end, schema)),
+    ).fetchone()[0]
+
+def archive_month(conn, directory, month, partition=None):
+    """Move the raw rows of month to its compressed archive. Returns the number of rows archived.
+
+    Rows are copied from the database and from the partition of the month, if
+    there is one, into an uncompressed SQLite file, merged with the existing
+    archive of the month if there is one. The rollups of the month are recomputed
+    from it, and the compressed result replaces the archive atomically before the
+    rows are deleted from the database and the partition file is removed.
+    """
+    end = next_month(month)
+    cursor = conn.cursor()
+    tables = archive_tables(cursor)
+    schemas = ['main']
+    if partition is not None and os.path.exists(partition):
+        cursor.execute("ATTACH DATABASE ? AS partition", (partition,))
+        schemas.append('partition')
+    try:
+        counts = {
+            (schema, table): count_rows(cursor, table, month, end, schema)
+            for schema in schemas
+            for table in tables
+        }
+        total = sum(counts.values())
+        path = os.path.join(directory, archive_name(month))
+        if total:
+            with tempfile.TemporaryDirectory(dir=directory) as scratch:
+                uncompressed = os.path.join(scratch, 'archive.db')
+                if os.path.exists(path):
+                    logger.info(f"Merging into existing archive {path}.")
+                    with lzma.open(path) as source, open(uncompressed, 'wb') as target:
+                        shutil.copyfileobj(source, target)
+                cursor.execute("ATTACH DATABASE ? AS archive", (uncompressed,))
+                try:
+                    with conn:
+                        for (schema, table), count in counts.items():
+                            if count:
+                                copy_rows(cursor, table, month, end, schema)
+                        for table in tables:
+                            if table_exists(cursor, table, 'archive'):
+                                reroll(cursor, table, month, end)
+                finally:
+                    cursor.execute("DETACH DATABASE archive")
+                with open(uncompressed, 'rb') as source, lzma.open(f"{path}.tmp", 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(f"{path}.tmp", path)
+            for table in tables:
+                if counts[('main', table)]:
+                    with conn:
+                        cursor.execute(
+                            f"DELETE FROM {table} WHERE timestamp >= ? AND timestamp < ?",
+                            (bound(cursor, table, month), bound(cursor, table, end)),
+                        )
+    finally:
+        if 'partition' in schemas:
+            cursor.execute("DETACH DATABASE partition")
+    if partition is not None:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(partition + suffix):
+                os.remove(partition + suffix)
+        with conn:
+            cursor.execute("DELETE FROM partitions WHERE month = ?", (f"{month:%Y-%m}",))
+        logger.info(f"Removed partition {partition}.")
+    if total:
+        logger.info(f"Archived {total} rows of {month:%Y-%m} to {path}.")
+    return total
+
+def enable_incremental_vacuum(conn):
+    """Switch the database to incremental auto vacuum.
+
+    This is a one-time migration: it rewrites the whole database with a full
+    VACUUM, which needs as much free disk space as the database and blocks the
+    collectors for its duration, so it only runs when asked for with --vacuum.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        logger.info("Enabling incremental vacuum, vacuuming database once.")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+def apply_retention(database, directory, keep_days, now=None, vacuum=False):
+    """Archive every whole month older than keep_days and give the freed pages back. Returns statistics.
+
+    Freed pages only go back to the file system once the database uses
+    incremental auto vacuum; pass vacuum=True to switch it over first.
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=keep_days)
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(database, timeout=60)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        if vacuum:
+            enable_incremental_vacuum(conn)
+        elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("Database does not use incremental vacuum, freed pages stay in the file. Run once with --vacuum to switch.")
+        partitioned = partitions(conn.cursor(), database)
+        archived = [
+            archive_month(conn, directory, month, partitioned.get(month))
+            for month in archivable_months(conn.cursor(), cutoff, partitioned)
+        ]
+        freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # execute() steps the pragma once and frees a single page; executescript() runs it to completion.
+        conn.executescript("PRAGMA incremental_vacuum;")
+    finally:
+        conn.close()
+    return {'months': sum(1 for rows in archived if rows), 'rows': sum(archived), 'pages_freed': freed}
+
+def main():
+    vacuum = '--vacuum' in sys.argv
+    if vacuum:
+        sys.argv.remove('--vacuum')
+    if len(sys.argv) < 3 or (len(sys.argv) > 3 and not sys.argv[3].isdigit()):
+        logger.error("USAGE: retention [--vacuum] DATABASE ARCHIVE-DIR [KEEP-DAYS]")
+        sys.exit(1)
+    keep_days = int(sys.argv[3]) if len(sys.argv) > 3 else 90
+    stats = apply_retention(sys.argv[1], sys.argv[2], keep_days, vacuum=vacuum)
+    logger.info(f"Archived {stats['rows']} rows in {stats['months']} months, freed {stats['pages_freed']} pages.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+{ config, lib, pkgs, ... }:
+
+with lib;
+
+let
+  cfg = config.services.smarthome;
+in
+{
+  options = {
+    services.smarthome.retention = {
+      enable = mkOption {
+        type = types.bool;
+        default = false;
+        description = "Enable archiving of old raw data to monthly compressed files.";
+      };
+
+      database = mkOption {
+        type = types.str;
+        default = cfg.database;
+        description = "Path to the SQLite database.";
+      };
+
+      archiveDir = mkOption {
+        type = types.str;
+        default = "/var/lib/smarthome/archive";
+        description = "Directory of the monthly archive files, also read by the dashboard.";
+      };
+
+      keepDays = mkOption {
+        type = types.int;
+        default = 90;
+        description = "Number of days raw rows stay in the database before their month is archived.";
+      };
+
+      vacuum = mkOption {
+        type = types.bool;
+        default = false;
+        description = ''
+          Switch the database to incremental auto vacuum on the next run, so
+          archived months give their space back. This is a one-time migration
+          that rewrites the whole database with a full VACUUM: it needs as much
+          free disk space as the database and blocks the collectors while it
+          runs. Enable it for one run, then disable it again.
+        '';
+      };
+
+      schedule = mkOption {
+        type = types.str;
+        default = "daily";
+        description = "When to run the retention service, in systemd OnCalendar format.";
+      };
+    };
+  };
+
+  config = mkIf cfg.retention.enable {
+    systemd.tmpfiles.rules = [
+      "d ${cfg.retention.archiveDir} 0775 smarthome smarthome"
+    ];
+
+    systemd.services.smarthome-retention = {
+      description = "Smarthome Data Retention Service";
+      after = [ "local-fs.target" ];
+
+      serviceConfig = {
+        Type = "oneshot";
+        ExecStart = "${pkgs.callPackage ./retention.nix {}}/bin/retention ${optionalString cfg.retention.vacuum "--vacuum "}${cfg.retention.database} ${cfg.retention.archiveDir} ${toString cfg.retention.keepDays}";
+        User = "smarthome";
+        Group = "smarthome";
+        Nice = 10;
+        IOSchedulingClass = "idle";
+      };
+    };
+
+    systemd.timers.smarthome-retention = {
+      wantedBy = [ "timers.target" ];
+      timerConfig = {
+        OnCalendar = cfg.retention.schedule;
+        Persistent = true;
+        RandomizedDelaySec = "1h";
+      };
+    };
+  };
+}
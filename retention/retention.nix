@@ -0,0 +1,18 @@
+{ pkgs ? import <nixpkgs> { } }:
+with pkgs.python3Packages;
+buildPythonApplication {
+  pname = "retention";
+  version = "0.1";
+  format = "pyproject";
+  src = builtins.filterSource (
+    name: type: (baseNameOf name == "app.py") || (baseNameOf name == "pyproject.toml")
+  ) ./.;
+
+  buildInputs = [
+    setuptools
+  ];
+
+  propagatedBuildInputs = [
+    (pkgs.callPackage ../collector/collector.nix {})
+  ];
+}
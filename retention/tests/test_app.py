@@ -0,0 +1,107 @@
+import unittest
+import importlib.util
+import lzma
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+DASHBOARD = os.path.join(os.pardir, "timeseries_plot", "app.py")
+
+def load_dashboard():
+    """Import the dashboard module, which is also called app, under its own name."""
+    spec = importlib.util.spec_from_file_location("timeseries_plot", DASHBOARD)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def dashboard_importable():
+    return os.path.exists(DASHBOARD) and all(
+        importlib.util.find_spec(name) is not None for name in ("flask", "plotly")
+    )
+
+class TestRetention(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.db')
+        self.archives = os.path.join(self.directory.name, 'archive')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_samples(self, timestamps):
+        """Store two devices' temperatures at every timestamp with a collector writer."""
+        import collector
+        sensor = collector.Sensor('thermometer', [('temperature', 'REAL'), ('device', 'TEXT')], key=['device'])
+        writer = collector.DataWriter(self.database, [sensor], batch_size=100)
+        for i, timestamp in enumerate(timestamps):
+            writer.add(sensor, {'timestamp': timestamp, 'temperature': float(i), 'device': 'attic'})
+            writer.add(sensor, {'timestamp': timestamp, 'temperature': 20.0 + i, 'device': 'kitchen'})
+        writer.close()
+
+    def select(self, database, sql):
+        conn = sqlite3.connect(database)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    @unittest.skipIf(not os.path.exists("app.py"), "retention not yet present")
+    def test_archive_round_trip_keeps_rows_and_rollups(self):
+        import app
+        january = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        timestamps = [january + timedelta(days=9, minutes=i) for i in range(5)]
+        self.write_samples(timestamps + [datetime(2024, 4, 10, tzinfo=timezone.utc)])
+        raw = self.select(self.database, "SELECT * FROM thermometer WHERE timestamp < 1706745600 ORDER BY timestamp, device")
+        rollup = self.select(self.database, "SELECT * FROM thermometer_rollup_1d ORDER BY bucket, device")
+
+        stats = app.apply_retention(self.database, self.archives, 30, now=datetime(2024, 4, 15, tzinfo=timezone.utc))
+
+        self.assertEqual((stats['months'], stats['rows']), (1, 10))
+        self.assertEqual(sorted(os.listdir(self.archives)), ['2024-01.db.xz'])
+        self.assertEqual(self.select(self.database, "SELECT timestamp FROM thermometer"), [(1712707200,)] * 2)
+        # The rollups of the archived month stay in the database, recomputed from the archive.
+        self.assertEqual(self.select(self.database, "SELECT * FROM thermometer_rollup_1d ORDER BY bucket, device"), rollup)
+        extracted = os.path.join(self.directory.name, 'extracted.db')
+        with lzma.open(os.path.join(self.archives, '2024-01.db.xz')) as source, open(extracted, 'wb') as target:
+            target.write(source.read())
+        self.assertEqual(self.select(extracted, "SELECT * FROM thermometer ORDER BY timestamp, device"), raw)
+
+    @unittest.skipIf(not os.path.exists("app.py"), "retention not yet present")
+    def test_archiving_again_merges_late_rows_into_the_archive(self):
+        import app
+        now = datetime(2024, 4, 15, tzinfo=timezone.utc)
+        self.write_samples([datetime(2024, 1, 10, tzinfo=timezone.utc)])
+        app.apply_retention(self.database, self.archives, 30, now=now)
+        self.write_samples([datetime(2024, 1, 20, tzinfo=timezone.utc)])
+        stats = app.apply_retention(self.database, self.archives, 30, now=now)
+
+        self.assertEqual(stats['rows'], 2)
+        extracted = os.path.join(self.directory.name, 'extracted.db')
+        with lzma.open(os.path.join(self.archives, '2024-01.db.xz')) as source, open(extracted, 'wb') as target:
+            target.write(source.read())
+        self.assertEqual(self.select(extracted, "SELECT count(*) FROM thermometer"), [(4,)])
+        self.assertEqual(
+            self.select(self.database, "SELECT device, temperature_count FROM thermometer_rollup_1d ORDER BY bucket, device"),
+            [('attic', 1), ('kitchen', 1)] * 2,
+        )
+
+    @unittest.skipIf(not os.path.exists("app.py"), "retention not yet present")
+    @unittest.skipUnless(dashboard_importable(), "timeseries_plot or its dependencies not present")
+    def test_dashboard_reads_the_archive(self):
+        import app
+        self.write_samples([datetime(2024, 1, 10, tzinfo=timezone.utc)])
+        app.apply_retention(self.database, self.archives, 30, now=datetime(2024, 4, 15, tzinfo=timezone.utc))
+
+        dashboard = load_dashboard()
+        store = dashboard.ArchiveStore(self.archives)
+        self.assertEqual(store.months(), {datetime(2024, 1, 1, tzinfo=timezone.utc)})
+        conn = store.connect(datetime(2024, 1, 1, tzinfo=timezone.utc))
+        try:
+            rows = conn.execute("SELECT timestamp, device, temperature FROM thermometer ORDER BY device").fetchall()
+        finally:
+            conn.close()
+        self.assertEqual(rows, [(1704844800, 'attic', 0.0), (1704844800, 'kitchen', 20.0)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,27 @@
 from datetime import datetime, timezone, timedelta
 from enum import Enum
-from functools import lru_cache
-from flask import Flask, render_template_string, request, jsonify
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from operator import itemgetter
+from array import array
+from flask import Flask, Response, render_template_string, request, jsonify, stream_with_context
+import heapq
+import json
+import lzma
+import queue
+import shutil
 import sqlite3
+import struct
+import sys
+import threading
+import time
 import plotly.graph_objs as go
 import plotly.io as pio
+from plotly.offline import get_plotlyjs
 import os
+import tempfile
 
 app = Flask(__name__)
 
@@ -32,89 +48,701 @@ class SensorData(Enum):
     Cumulative_hourly_reactive_import_kVArh = 'kamstrup_10sec.Cumulative_hourly_reactive_import_kVArh'
     Cumulative_hourly_active_export_kVArh = 'kamstrup_10sec.Cumulative_hourly_active_export_kVArh'
 
-def fetch_timeseries_data(sensor: SensorData, start_time=None, end_time=None):
-    # Partition the start and end times into 5-minute intervals
+def registered_sensors(database):
+    """Return [(name, 'table.column', panel, rollup)] of the sensors registered by collectors built on the collector runtime.
+
+    A sensor is named after its column, or after its table and column if the
+    column name is already taken.
+    """
+    if not database or not os.path.exists(database):
+        return []
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensors'").fetchone():
+            return []
+        rows = conn.execute("SELECT table_name, column_name, panel, rollup FROM sensors ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    values = {sensor.value for sensor in SensorData}
+    taken = {sensor.name for sensor in SensorData}
+    sensors = []
+    for table, column, panel, rollup in rows:
+        if f"{table}.{column}" in values:
+            continue
+        name = column if column not in taken else f"{table}_{column}"
+        taken.add(name)
+        sensors.append((name, f"{table}.{column}", panel, bool(rollup)))
+    return sensors
+
+# Sensors registered at startup extend SensorData; restart the dashboard to pick up a new collector.
+REGISTERED_SENSORS = registered_sensors(os.environ.get('DATABASE_PATH'))
+if REGISTERED_SENSORS:
+    SensorData = Enum('SensorData', [(sensor.name, sensor.value) for sensor in SensorData] + [
+        (name, value) for name, value, _, _ in REGISTERED_SENSORS
+    ])
+
+# Roughly two points per horizontal pixel of a full-width chart.
+DEFAULT_MAX_POINTS = 2000
+DOWNSAMPLE_METHODS = ('minmax', 'lttb')
+
+def _epoch(timestamp):
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return datetime.fromisoformat(timestamp).timestamp()
+
+def as_number(value):
+    """Return value as a number, or None for NULL and anything that is not one.
+
+    Some columns hold text or bytes next to numbers, like the 'N/A' radon
+    placeholder or the kVArh export; numeric text still counts as a number.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+def numeric_rows(rows):
+    """Return rows with every value passed through as_number, rows that need no change as they are."""
+    return [row if row[1] is None or isinstance(row[1], (int, float)) else (row[0], as_number(row[1])) for row in rows]
+
+def downsample_minmax(rows, max_points):
+    """Keep the first, minimum, maximum and last row of each time bucket.
+
+    The window is cut into max_points // 4 equally wide time buckets, so the
+    result never exceeds max_points rows while every peak and trough survives.
+    """
+    rows = [row for row in rows if row[1] is not None]
+    if len(rows) <= max_points:
+        return rows
+    bucket_count = max(1, max_points // 4)
+    first = _epoch(rows[0][0])
+    width = (_epoch(rows[-1][0]) - first) / bucket_count or 1
+    result = []
+    bucket = []
+    bucket_index = 0
+    for row in rows:
+        index = min(int((_epoch(row[0]) - first) / width), bucket_count - 1)
+        if index != bucket_index and bucket:
+            result.extend(_bucket_extremes(bucket))
+            bucket = []
+        bucket_index = index
+        bucket.append(row)
+    if bucket:
+        result.extend(_bucket_extremes(bucket))
+    return result
+
+def _bucket_extremes(bucket):
+    lowest = min(range(len(bucket)), key=lambda i: bucket[i][1])
+    highest = max(range(len(bucket)), key=lambda i: bucket[i][1])
+    return [bucket[i] for i in sorted({0, lowest, highest, len(bucket) - 1})]
+
+def downsample_lttb(rows, max_points):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Picks, from each of max_points - 2 buckets, the row spanning the largest
+    triangle with the previously kept row and the average of the next bucket.
+    """
+    rows = [row for row in rows if row[1] is not None]
+    if len(rows) <= max_points or max_points < 3:
+        return rows
+    x = [_epoch(row[0]) for row in rows]
+    y = [row[1] for row in rows]
+    every = (len(rows) - 2) / (max_points - 2)
+    result = [rows[0]]
+    a = 0
+    for i in range(max_points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(rows))
+        if end >= next_end:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            avg_x = sum(x[end:next_end]) / (next_end - end)
+            avg_y = sum(y[end:next_end]) / (next_end - end)
+        best = start
+        best_area = -1
+        for j in range(start, end):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best_area = area
+                best = j
+        result.append(rows[best])
+        a = best
+    result.append(rows[-1])
+    return result
+
+def downsample(rows, max_points, method='minmax'):
+    rows = numeric_rows(rows)
+    if not max_points:
+        return rows
+    if method == 'lttb':
+        return downsample_lttb(rows, max_points)
+    return downsample_minmax(rows, max_points)
+
+# Collectors reading several devices into one table, like read_waveplus, key its rows by this column.
+DEVICE_COLUMN = 'device'
+# Rollup tables maintained by the collectors, coarsest first.
+ROLLUP_RESOLUTIONS = [('1d', 86400), ('1h', 3600), ('15m', 900), ('1m', 60)]
+ROLLUP_TABLES = {'sensor_data', 'kamstrup_10sec'} | {value.split('.')[0] for _, value, _, rollup in REGISTERED_SENSORS if rollup}
+UNROLLED_SENSORS = {SensorData.Cumulative_hourly_active_export_kVArh} | {
+    SensorData[name] for name, value, _, rollup in REGISTERED_SENSORS if not rollup
+}
+
+def resolve_window(start_time=None, end_time=None):
     if not end_time:
         end_time = datetime.now(timezone.utc)
     if not start_time:
         start_time = end_time - timedelta(hours=6)
-    start_time = start_time.replace(minute=start_time.minute - start_time.minute % 5, second=0, microsecond=0)
-    next_time = start_time + timedelta(minutes=5)
-    result = []
-    while next_time < end_time:
-        if next_time > datetime.now(timezone.utc):
-            next_time = datetime.now(timezone.utc)
-        data = fetch_timeseries_data_cached(sensor, start_time, next_time)
-        result.extend(data)
-        start_time = next_time
-        next_time = next_time + timedelta(minutes=5)
-    return result
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    if end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo=timezone.utc)
+    return start_time.astimezone(timezone.utc), end_time.astimezone(timezone.utc)
 
-@lru_cache(maxsize=65535)
-def fetch_timeseries_data_cached(sensor: SensorData, start_time=None, end_time=None):
-    assert SensorData(sensor.value) == sensor
-    table, column = sensor.value.split('.')
+def choose_rollup(sensor: SensorData, start_time, end_time, max_points):
+    """Return the coarsest rollup resolution that still yields max_points, or None for raw rows.
+
+    Each rollup bucket is plotted as its minimum and maximum, so it counts as two points.
+    """
+    if not max_points or sensor in UNROLLED_SENSORS or sensor.value.split('.')[0] not in ROLLUP_TABLES:
+        return None
+    span = (end_time - start_time).total_seconds()
+    for resolution, seconds in ROLLUP_RESOLUTIONS:
+        if 2 * span / seconds >= max_points:
+            return resolution
+    return None
+
+def fetch_rollup_data(sensors: list[SensorData], resolution, start_time, end_time, device=None):
+    """Fetch the per-bucket minimum and maximum of sensors of one table in one query.
+
+    Rollups keyed by device hold one row per bucket and device; without device
+    the devices of a bucket are combined. Returns rows per sensor, or None if
+    the rollup cannot be read.
+    """
+    table = _table_of(sensors)
+    columns = [sensor.value.split('.')[1] for sensor in sensors]
     query = f"""
         SELECT
-            timestamp,
-            {column}
-        FROM {table}
-        WHERE 1=1
-    """
-    params = []
-    if start_time:
-        query += " AND timestamp >= ?"
-        params.append(start_time)
-    if end_time:
-        query += " AND timestamp <= ?"
-        params.append(end_time)
-    query += " ORDER BY timestamp ASC"
+            bucket,
+            {", ".join(f"min({column}_min), max({column}_max), sum({column}_count)" for column in columns)}
+        FROM {table}_rollup_{resolution}
+        WHERE bucket >= ? AND bucket <= ? {f"AND coalesce({DEVICE_COLUMN}, '') = ?" if device is not None else ""}
+        GROUP BY bucket
+        ORDER BY bucket ASC
+    """
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute(query, (int(start_time.timestamp()), int(end_time.timestamp())) + ((device,) if device is not None else ()))
+        rows = cursor.fetchall()
+    except Exception as e:
+        print(f"Error fetching {resolution} rollup for {table}: {str(e)}")
+        return None
+    data = {sensor: [] for sensor in sensors}
+    for row in rows:
+        timestamp = str(datetime.fromtimestamp(row[0], timezone.utc))
+        for i, sensor in enumerate(sensors):
+            minimum, maximum, count = row[1 + 3 * i:4 + 3 * i]
+            if count:
+                data[sensor].append((timestamp, minimum))
+                data[sensor].append((timestamp, maximum))
+    return data
+
+def fetch_plot_data(sensor: SensorData, start_time=None, end_time=None, max_points=DEFAULT_MAX_POINTS, method='minmax', device=None):
+    """Fetch at most max_points rows of sensor, reading from a rollup table when the window is long."""
+    return fetch_panel_data([sensor], start_time, end_time, max_points, method, device)[sensor]
+
+def fetch_panel_data(sensors: list[SensorData], start_time=None, end_time=None, max_points=DEFAULT_MAX_POINTS, method='minmax', device=None):
+    """Fetch at most max_points rows for each of sensors, of device only when given.
+
+    Sensors are grouped by table and resolution, every group is read with one query
+    per contiguous run of uncached chunks, and groups run in parallel on query_pool.
+    """
+    start_time, end_time = resolve_window(start_time, end_time)
+    groups = {}
+    for sensor in sensors:
+        key = (sensor.value.split('.')[0], choose_rollup(sensor, start_time, end_time, max_points))
+        groups.setdefault(key, []).append(sensor)
+
+    def fetch_group(key):
+        _, resolution = key
+        if resolution:
+            data = fetch_rollup_data(groups[key], resolution, start_time, end_time, device)
+            if data is not None:
+                return data
+        return fetch_timeseries_columns(groups[key], start_time, end_time, device)
+
+    if len(groups) > 1:
+        results = query_pool.map(fetch_group, groups)
+    else:
+        results = map(fetch_group, groups)
+    data = {}
+    for result in results:
+        data.update(result)
+    return {sensor: downsample(data[sensor], max_points, method) for sensor in sensors}
+
+# Timestamps are stored as UTC ISO text, so chunk boundaries are compared as text too.
+CHUNK_SIZE = timedelta(minutes=5)
+# Chunks that ended less than this long ago may still receive late rows,
+# e.g. from read_han, which buffers frames for up to a minute.
+SETTLE_TIME = timedelta(minutes=2)
+# How long the still-growing head chunk may be served from the cache.
+HEAD_CHUNK_TTL = 5
+
+class ChunkCache:
+    """LRU cache of timeseries chunks bounded by an estimate of their size in bytes.
+
+    Settled chunks never change and stay until evicted. Entries put with a ttl,
+    such as the head chunk, expire after ttl seconds.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, rows, ttl=None):
+        rows = tuple(rows)
+        size = sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, size, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+_local = threading.local()
+# Queries for different tables of one panel run in parallel, each on its thread's connection.
+query_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix='query')
+chunk_cache = ChunkCache(int(os.environ.get('CHUNK_CACHE_BYTES', 64 * 1024 * 1024)))
+
+# Page cache of each connection. Pages read through mmap live in the OS page
+# cache instead, shared by every connection and worker process.
+SQLITE_CACHE_BYTES = int(os.environ.get('SQLITE_CACHE_BYTES', 8 * 1024 * 1024))
+SQLITE_MMAP_BYTES = int(os.environ.get('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))
+# The main database and the partitions of the last months, per thread.
+MAX_THREAD_CONNECTIONS = 4
+
+def connect_readonly(path, immutable=False):
+    """Open a read-only connection to path tuned for reading."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro{'&immutable=1' if immutable else ''}", uri=True)
+    conn.execute("PRAGMA query_only=ON")
+    conn.execute(f"PRAGMA cache_size={-(SQLITE_CACHE_BYTES // 1024)}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+    return conn
+
+def get_connection(path=None):
+    """Return this thread's read-only connection to path, the main database by default.
+
+    Connections stay open for the life of the thread, so the schema is parsed
+    and the page cache warmed once per thread instead of once per request.
+    """
+    if path is None:
+        path = os.environ.get('DATABASE_PATH')
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = OrderedDict()
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = connect_readonly(path)
+        while len(connections) > MAX_THREAD_CONNECTIONS:
+            connections.popitem(last=False)[1].close()
+    else:
+        connections.move_to_end(path)
+    return conn
+
+# Tables converted by the collectors' migrate tools key rows by integer epoch seconds.
+# They are read back as the same ISO text older tables store, so the rest of the
+# app sees one format, while the range conditions compare against the integer keys.
+EPOCH_AS_TEXT = "strftime('%Y-%m-%d %H:%M:%S+00:00', timestamp, 'unixepoch')"
+_table_columns = {}
+
+def table_columns(conn, table):
+    """Return {column: declared type} of table. Cached per database file until its schema changes."""
+    key = (
+        conn.execute("PRAGMA database_list").fetchone()[2],
+        table,
+        conn.execute("PRAGMA schema_version").fetchone()[0],
+    )
+    if key not in _table_columns:
+        _table_columns[key] = {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+    return _table_columns[key]
+
+def is_epoch_table(conn, table):
+    """True if table stores integer epoch seconds."""
+    return table_columns(conn, table).get('timestamp') == 'INTEGER'
+
+def timestamp_sql(conn, table):
+    """Return the expression selecting the timestamp of table as text, and the conversion of bounds to its key."""
+    if is_epoch_table(conn, table):
+        return EPOCH_AS_TEXT, _epoch
+    return 'timestamp', str
+
+def milliseconds_sql(conn, table):
+    """Return the expression selecting the timestamp of table as epoch milliseconds, and the conversion of bounds to its key."""
+    if is_epoch_table(conn, table):
+        return "timestamp * 1000", _epoch
+    return "CAST(strftime('%s', timestamp) AS INTEGER) * 1000 + CAST(round(strftime('%f', timestamp) * 1000) AS INTEGER) % 1000", str
+
+ARCHIVE_SUFFIX = '.db.xz'
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+class ArchiveStore:
+    """The monthly archives written by the retention service, decompressed on demand.
+
+    An archive holds every raw row of its month that has left the database, so
+    ranges within an archived month are read from the archive alone. Up to
+    max_files archives are kept decompressed in a private temporary directory;
+    an archive replaced by the retention service is decompressed again.
+    """
+    def __init__(self, directory, max_files=4):
+        self.directory = directory
+        self.max_files = max_files
+        self._extracted = OrderedDict()
+        self._lock = threading.Lock()
+        self._scratch = None
+
+    def months(self):
+        """Return the set of months, as aware UTC datetimes, that have an archive."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return set()
+        months = set()
+        for name in os.listdir(self.directory):
+            if name.endswith(ARCHIVE_SUFFIX):
+                try:
+                    months.add(datetime.strptime(name[:-len(ARCHIVE_SUFFIX)], '%Y-%m').replace(tzinfo=timezone.utc))
+                except ValueError:
+                    continue
+        return months
+
+    def connect(self, month):
+        """Open a read-only connection to the archive of month, decompressing it if needed."""
+        path = os.path.join(self.directory, f"{month:%Y-%m}{ARCHIVE_SUFFIX}")
+        key = (month, os.stat(path).st_mtime_ns)
+        with self._lock:
+            if key in self._extracted:
+                self._extracted.move_to_end(key)
+            else:
+                if self._scratch is None:
+                    self._scratch = tempfile.mkdtemp(prefix='archives-')
+                extracted = os.path.join(self._scratch, f"{month:%Y-%m}-{key[1]}.db")
+                with lzma.open(path) as source, open(extracted, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                self._extracted[key] = extracted
+                while len(self._extracted) > self.max_files:
+                    # Connections still reading an evicted file keep it alive until they close.
+                    os.remove(self._extracted.popitem(last=False)[1])
+            return connect_readonly(self._extracted[key], immutable=True)
+
+archive_store = ArchiveStore(os.environ.get('ARCHIVE_DIR'))
+
+def partitions(conn):
+    """Return {month: path} of the monthly partitions listed in the catalog of the main database."""
+    if not _has_table(conn, 'partitions'):
+        return {}
+    directory = os.path.dirname(os.environ.get('DATABASE_PATH'))
+    return {
+        datetime.strptime(month, '%Y-%m').replace(tzinfo=timezone.utc): os.path.join(directory, path)
+        for month, path in conn.execute("SELECT month, path FROM partitions")
+    }
+
+def range_pieces(start_time, end_time):
+    """Split [start_time, end_time) into (sources, start, end) pieces in order.
+
+    Partitions and archives of months outside the range are never opened. An
+    archived month is read from its archive alone, a partitioned month from its
+    partition and from the main database, which still holds the rows written
+    before partitioning was enabled.
+    """
+    archived = archive_store.months()
+    partitioned = partitions(get_connection())
+    if not archived and not partitioned:
+        return [([('main', None)], start_time, end_time)]
+    pieces = []
+    month = start_time.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= end_time:
+        if month in archived:
+            sources = [('archive', month)]
+        elif month in partitioned:
+            sources = [('partition', partitioned[month]), ('main', None)]
+        else:
+            sources = [('main', None)]
+        start, end = max(start_time, month), min(end_time, _next_month(month))
+        if pieces and pieces[-1][0] == sources == [('main', None)]:
+            pieces[-1] = (sources, pieces[-1][1], end)
+        else:
+            pieces.append((sources, start, end))
+        month = _next_month(month)
+    return pieces
+
+def open_source(source):
+    """Open a read-only connection to a source of range_pieces. Only archive connections must be closed."""
+    kind, where = source
+    if kind == 'main':
+        return get_connection()
+    if kind == 'archive':
+        return archive_store.connect(where)
+    return get_connection(where)
+
+def latest_timestamp(table):
+    """Return the newest timestamp of table as ISO text, or None if it has no rows."""
+    conn = get_connection()
+    sources = [('main', None)]
+    partitioned = partitions(conn)
+    if partitioned:
+        sources.append(('partition', partitioned[max(partitioned)]))
+    latest = []
+    for source in sources:
+        source_conn = open_source(source)
+        try:
+            if _has_table(source_conn, table):
+                timestamp, _ = timestamp_sql(source_conn, table)
+                row = source_conn.execute(f"SELECT {timestamp} FROM {table} ORDER BY timestamp DESC LIMIT 1").fetchone()
+                if row:
+                    latest.append(row[0])
+        finally:
+            if source[0] == 'archive':
+                source_conn.close()
+    return max(latest, default=None)
+
+def query_range(table, columns, start_time, end_time, inclusive=False, milliseconds=False, device=None):
+    """Yield the rows of table in [start_time, end_time) from every source of the range, in timestamp order.
+
+    Each row holds the timestamp, as ISO text or with milliseconds as epoch
+    milliseconds, followed by columns. With inclusive, end_time itself is included.
+    With device, only the rows of that device are read. Rows stored before their
+    table had a device column, with no device or a NULL one, belong to the device ''.
+    """
+    pieces = range_pieces(start_time, end_time)
+    for i, (sources, start, end) in enumerate(pieces):
+        connections = []
+        try:
+            cursors = []
+            for source in sources:
+                conn = open_source(source)
+                connections.append((source, conn))
+                if not _has_table(conn, table):
+                    continue
+                has_device = DEVICE_COLUMN in table_columns(conn, table)
+                if device and not has_device:
+                    continue
+                timestamp, bound = milliseconds_sql(conn, table) if milliseconds else timestamp_sql(conn, table)
+                selected = [column if has_device or column != DEVICE_COLUMN else "''" for column in columns]
+                cursors.append(conn.execute(f"""
+                    SELECT {timestamp}, {", ".join(selected)}
+                    FROM {table}
+                    WHERE timestamp >= ? AND timestamp {"<=" if inclusive and i == len(pieces) - 1 else "<"} ?
+                    {f"AND coalesce({DEVICE_COLUMN}, '') = ?" if device is not None and has_device else ""}
+                    ORDER BY timestamp ASC
+                """, (bound(start), bound(end)) + ((device,) if device is not None and has_device else ())))
+            yield from cursors[0] if len(cursors) == 1 else heapq.merge(*cursors, key=itemgetter(0))
+        finally:
+            for source, conn in connections:
+                if source[0] == 'archive':
+                    conn.close()
+
+def _chunk_start(timestamp):
+    seconds = CHUNK_SIZE.total_seconds()
+    return datetime.fromtimestamp(timestamp.timestamp() // seconds * seconds, timezone.utc)
+
+def _contiguous_runs(chunks):
+    run = []
+    for chunk in chunks:
+        if run and chunk != run[-1] + CHUNK_SIZE:
+            yield run
+            run = []
+        run.append(chunk)
+    if run:
+        yield run
+
+def _has_table(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def _table_of(sensors):
+    tables = {sensor.value.split('.')[0] for sensor in sensors}
+    assert len(tables) == 1, "Sensors must be stored in the same table."
+    return tables.pop()
+
+def fetch_timeseries_data(sensor: SensorData, start_time=None, end_time=None, device=None):
+    """Fetch the raw rows of sensor between start_time and end_time."""
+    return fetch_timeseries_columns([sensor], start_time, end_time, device)[sensor]
+
+def fetch_timeseries_columns(sensors: list[SensorData], start_time=None, end_time=None, device=None):
+    """Fetch the raw rows of sensors of one table between start_time and end_time.
+
+    The window is covered by aligned chunks, and every contiguous run of chunks
+    missing from chunk_cache for any of the sensors is read with a single query
+    for all their columns. Failed queries are not cached.
+    """
+    start_time, end_time = resolve_window(start_time, end_time)
+    settled = datetime.now(timezone.utc) - SETTLE_TIME
+    chunks = []
+    chunk = _chunk_start(start_time)
+    while chunk <= end_time:
+        chunks.append(chunk)
+        chunk += CHUNK_SIZE
 
+    parts = {sensor: {} for sensor in sensors}
+    for sensor in sensors:
+        for chunk in chunks:
+            part = chunk_cache.get((sensor, device, chunk))
+            if part is not None:
+                parts[sensor][chunk] = part
+    missing = [chunk for chunk in chunks if any(chunk not in parts[sensor] for sensor in sensors)]
+    for run in _contiguous_runs(missing):
+        rows = fetch_timeseries_range(sensors, run[0], run[-1] + CHUNK_SIZE, device)
+        if rows is None:
+            continue
+        timestamps = [row[0] for row in rows]
+        for chunk in run:
+            part = rows[bisect_left(timestamps, str(chunk)):bisect_left(timestamps, str(chunk + CHUNK_SIZE))]
+            ttl = None if chunk + CHUNK_SIZE <= settled else HEAD_CHUNK_TTL
+            for i, sensor in enumerate(sensors, start=1):
+                if chunk not in parts[sensor]:
+                    parts[sensor][chunk] = [(row[0], row[i]) for row in part]
+                    chunk_cache.put((sensor, device, chunk), parts[sensor][chunk], ttl=ttl)
+
+    data = {}
+    for sensor in sensors:
+        result = []
+        for chunk in chunks:
+            result.extend(parts[sensor].get(chunk, ()))
+        timestamps = [row[0] for row in result]
+        data[sensor] = result[bisect_left(timestamps, str(start_time)):bisect_right(timestamps, str(end_time))]
+    return data
+
+def fetch_timeseries_range(sensors: list[SensorData], start_time, end_time, device=None):
+    """Fetch the rows of sensors of one table in [start_time, end_time), or None if the query fails.
+
+    Each row holds the timestamp followed by one value per sensor.
+    """
+    for sensor in sensors:
+        assert SensorData(sensor.value) == sensor
+    table = _table_of(sensors)
+    try:
+        return list(query_range(table, [sensor.value.split('.')[1] for sensor in sensors], start_time, end_time, device=device))
+    except Exception as e:
+        print(f"Error fetching data from {table}: {str(e)}")
+        return None
+
+def table_devices(table):
+    """Return the devices of table, sorted, or [None] if its rows are not keyed by device.
+
+    The devices are listed from the daily rollup, which outlives the raw rows, or
+    from the raw rows when table has no rollups.
+    """
+    conn = get_connection()
+    if DEVICE_COLUMN not in table_columns(conn, table):
+        return [None]
+    source = f"{table}_rollup_1d" if DEVICE_COLUMN in table_columns(conn, f"{table}_rollup_1d") else table
     try:
-        with sqlite3.connect(f"file:{os.environ.get('DATABASE_PATH')}?mode=ro", uri=True) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            data = cursor.fetchall()
-        return data
+        devices = [row[0] or '' for row in conn.execute(f"SELECT DISTINCT {DEVICE_COLUMN} FROM {source}")]
     except Exception as e:
-        print(f"Error fetching data for {sensor.name}: {str(e)}")
-        return [[None, None]]
+        print(f"Error listing the devices of {table}: {str(e)}")
+        devices = []
+    return sorted(set(devices)) or ['']
+
+def trace_name(sensor: SensorData, device=None):
+    return f"{sensor.name} ({device})" if device else sensor.name
 
-def plot_data(sensors: list[SensorData], title: str, start_time=None, end_time=None):
+def panel_traces(sensors: list[SensorData]):
+    """Return the (sensor, device) of every trace of a panel: one per sensor and device of its table."""
+    devices = {table: table_devices(table) for table in {sensor.value.split('.')[0] for sensor in sensors}}
+    return [(sensor, device) for sensor in sensors for device in devices[sensor.value.split('.')[0]]]
+
+def plot_data(sensors: list[SensorData], title: str, start_time=None, end_time=None, max_points=DEFAULT_MAX_POINTS, method='minmax', include_plotlyjs=True):
     fig = go.Figure()
-    for sensor in sensors:
-        data = fetch_timeseries_data(sensor, start_time, end_time)
+    traces = panel_traces(sensors)
+    panel_data = {}
+    for device in dict.fromkeys(device for _, device in traces):
+        group = [sensor for sensor, trace_device in traces if trace_device == device]
+        for sensor, data in fetch_panel_data(group, start_time, end_time, max_points, method, device).items():
+            panel_data[sensor, device] = data
+    for sensor, device in traces:
+        data = panel_data[sensor, device]
         if len(data) < 1:
             continue
         timestamps, values = zip(*data)
-        fig.add_trace(go.Scatter(x=timestamps, y=values, mode='lines', name=sensor.name))
+        fig.add_trace(go.Scatter(x=timestamps, y=values, mode='lines', name=trace_name(sensor, device)))
     fig.update_layout(
         title=title,
         xaxis_title='Timestamp',
         yaxis_title='Value',
         template='plotly_dark'
     )
-    return pio.to_html(fig, full_html=False)
+    # 'plotly.js' makes the page load the cached /plotly.js instead of embedding it.
+    return pio.to_html(fig, full_html=False, include_plotlyjs='plotly.js' if include_plotlyjs else False)
 
-@app.route('/')
-def plot():
+def parse_downsampling(args, default_max_points=None):
+    max_points = args.get('max_points', default_max_points, type=int)
+    method = args.get('method', 'minmax')
+    if max_points is None or max_points < 0 or method not in DOWNSAMPLE_METHODS:
+        raise ValueError("max_points must be a non-negative integer and method one of " + ", ".join(DOWNSAMPLE_METHODS))
+    return max_points, method
 
-    end_time = request.args.get('end_time')
-    end_time = datetime.fromisoformat(end_time) if end_time else None
-    plot1_html = plot_data([
+PANELS = [
+    ('Temperature and humidity', [
         SensorData.humidity,
         SensorData.temperature,
-    ], title='Temperature and humidity', end_time=end_time)
-
-    plot2_html = plot_data([
+    ]),
+    ('Radon, VOC', [
         SensorData.radon_st_avg,
         SensorData.radon_lt_avg,
         SensorData.voc
         #SensorData.pressure,
         #SensorData.co2,
-    ], title='Radon, VOC', end_time=end_time)
-
-    plot3_html = plot_data([
+    ]),
+    ('HAN', [
         SensorData.ACTIVE_POWER_PLUS,
         SensorData.ACTIVE_POWER_MINUS,
         SensorData.REACTIVE_POWER_PLUS,
@@ -129,7 +757,33 @@ def plot():
         #SensorData.Cumulative_hourly_active_export_kWh,
         #SensorData.Cumulative_hourly_reactive_import_kVArh,
         #SensorData.Cumulative_hourly_active_export_kVArh
-    ], title='HAN', end_time=end_time)
+    ]),
+]
+
+def add_registered_panels(panels):
+    """Add the registered sensors to panels, in a panel of their own title unless it exists."""
+    by_title = dict(panels)
+    for name, _, title, _ in REGISTERED_SENSORS:
+        if title not in by_title:
+            by_title[title] = []
+            panels.append((title, by_title[title]))
+        by_title[title].append(SensorData[name])
+
+add_registered_panels(PANELS)
+
+@app.route('/')
+def plot():
+
+    end_time = request.args.get('end_time')
+    end_time = datetime.fromisoformat(end_time) if end_time else None
+    try:
+        max_points, method = parse_downsampling(request.args, DEFAULT_MAX_POINTS)
+    except ValueError as e:
+        return str(e), 400
+    plots_html = [
+        plot_data(sensors, title=title, end_time=end_time, max_points=max_points, method=method, include_plotlyjs=i == 0)
+        for i, (title, sensors) in enumerate(PANELS)
+    ]
 
     return render_template_string('''
         <!DOCTYPE html>
@@ -138,34 +792,450 @@ def plot():
             <title>Interactive Timeseries Plot</title>
         </head>
         <body style="background: rgb(17, 17, 17);">
-            {{ plot1_html|safe }}
-            {{ plot2_html|safe }}
-            {{ plot3_html|safe }}
+            {% for plot_html in plots_html %}
+            {{ plot_html|safe }}
+            {% endfor %}
+        </body>
+        </html>
+    ''',
+        plots_html=plots_html,
+    )
+
+@app.route('/plotly.js')
+def plotly_js():
+    return Response(get_plotlyjs(), mimetype='text/javascript', headers={'Cache-Control': 'public, max-age=86400'})
+
+@app.route('/live')
+def live():
+    """Dashboard that loads each trace once and then appends the rows pushed on /events."""
+    max_points = request.args.get('max_points', DEFAULT_MAX_POINTS, type=int)
+    refresh = request.args.get('refresh', 10, type=int)
+    # The page keeps at most max_points per trace and polls every refresh seconds, so neither can be zero.
+    if max_points is None or max_points < 1 or refresh is None or refresh < 1:
+        return "max_points and refresh must be positive integers", 400
+    return render_template_string('''
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Live Timeseries Plot</title>
+            <script src="plotly.js"></script>
+            <script src="columns.js"></script>
+        </head>
+        <body style="background: rgb(17, 17, 17);">
+            {% for panel in panels %}
+            <div id="panel-{{ loop.index0 }}"></div>
+            {% endfor %}
+            <script>
+                const panels = {{ panels|tojson }};
+                const template = {{ template|tojson }};
+                const maxPoints = {{ max_points }};
+                const last = {};
+
+                async function fetchColumns(params) {
+                    const response = await fetch('data?' + new URLSearchParams({...params, format: 'columns'}));
+                    if (!response.ok) throw new Error(response.statusText);
+                    return decodeColumns(await response.arrayBuffer());
+                }
+
+                async function load(panel, index) {
+                    const traces = [];
+                    for (const trace of panel.traces) {
+                        const {x, y} = await fetchColumns({...trace.params, max_points: maxPoints});
+                        last[trace.name] = x.length ? x[x.length - 1] : Date.now();
+                        traces.push({x, y, mode: 'lines', name: trace.name});
+                    }
+                    await Plotly.newPlot('panel-' + index, traces, {
+                        title: panel.title,
+                        xaxis: {title: 'Timestamp', type: 'date'},
+                        yaxis: {title: 'Value'},
+                        template,
+                    });
+                }
+
+                async function append(panel, index) {
+                    const update = {x: [], y: []};
+                    const indices = [];
+                    for (const [i, trace] of panel.traces.entries()) {
+                        const {x, y} = await fetchColumns({...trace.params, start_time: new Date(last[trace.name]).toISOString()});
+                        let first = 0;
+                        while (first < x.length && x[first] <= last[trace.name]) first++;
+                        if (first === x.length) continue;
+                        update.x.push(Array.from(x.subarray(first)));
+                        update.y.push(Array.from(y.subarray(first)));
+                        indices.push(i);
+                        last[trace.name] = x[x.length - 1];
+                    }
+                    if (indices.length) Plotly.extendTraces('panel-' + index, update, indices, maxPoints);
+                }
+
+                function catchUp() {
+                    panels.forEach((panel, index) => append(panel, index).catch(console.error));
+                }
+
+                function applyEvent(event) {
+                    panels.forEach((panel, index) => {
+                        const update = {x: [], y: []};
+                        const indices = [];
+                        panel.traces.forEach((trace, i) => {
+                            const rows = event[trace.name];
+                            if (!rows) return;
+                            let first = 0;
+                            while (first < rows.x.length && rows.x[first] <= last[trace.name]) first++;
+                            if (first === rows.x.length) return;
+                            update.x.push(rows.x.slice(first));
+                            update.y.push(rows.y.slice(first));
+                            indices.push(i);
+                            last[trace.name] = rows.x[rows.x.length - 1];
+                        });
+                        if (indices.length) Plotly.extendTraces('panel-' + index, update, indices, maxPoints);
+                    });
+                }
+
+                Promise.all(panels.map(load)).then(() => {
+                    if (!window.EventSource) {
+                        setInterval(catchUp, {{ refresh * 1000 }});
+                        return;
+                    }
+                    const source = new EventSource('events');
+                    source.onmessage = message => {
+                        const event = JSON.parse(message.data);
+                        if (event.resync) catchUp();
+                        else applyEvent(event);
+                    };
+                    // Rows committed while (re)connecting are not pushed.
+                    source.onopen = catchUp;
+                    // A refused stream (503 when all live streams are taken) is not retried.
+                    source.onerror = () => {
+                        if (source.readyState === EventSource.CLOSED) setInterval(catchUp, {{ refresh * 1000 }});
+                    };
+                });
+            </script>
         </body>
         </html>
     ''',
-        plot1_html=plot1_html,
-        plot2_html=plot2_html,
-        plot3_html=plot3_html,
+        panels=[
+            {'title': title, 'traces': [
+                {
+                    'name': trace_name(sensor, device),
+                    'params': {'sensor': sensor.name} if device is None else {'sensor': sensor.name, 'device': device},
+                }
+                for sensor, device in panel_traces(sensors)
+            ]}
+            for title, sensors in PANELS
+        ],
+        template=pio.templates['plotly_dark'].to_plotly_json(),
+        max_points=max_points,
+        refresh=refresh,
     )
 
+# ===============================
+# Columnar binary encoding
+# ===============================
+
+# A sequence of blocks. Each block is a little-endian uint32 row count and four
+# padding bytes, followed by count float64 epoch milliseconds and count float64
+# values (NaN for NULL). Every buffer starts 8-byte aligned, so the browser can
+# view it as a Float64Array without copying. A block with count 0 ends the stream.
+COLUMNS_MIMETYPE = 'application/vnd.smarthome.columns'
+BLOCK_HEADER = struct.Struct('<I4x')
+BLOCK_ROWS = 8192
+NAN = float('nan')
+
+def encode_block(timestamps, values):
+    timestamps = array('d', timestamps)
+    try:
+        values = array('d', (NAN if value is None else value for value in values))
+    except TypeError:
+        # Non-numeric values, such as 'N/A', become NaN like NULLs do.
+        values = array('d', (NAN if value is None else value for value in map(as_number, values)))
+    if sys.byteorder != 'little':
+        timestamps.byteswap()
+        values.byteswap()
+    return BLOCK_HEADER.pack(len(timestamps)) + timestamps.tobytes() + values.tobytes()
+
+def encode_rows(rows):
+    """Encode (timestamp, value) rows as one block followed by the end marker."""
+    rows = [row for row in rows if row[0] is not None]
+    block = encode_block([_epoch(row[0]) * 1000 for row in rows], [row[1] for row in rows]) if rows else b''
+    return block + BLOCK_HEADER.pack(0)
+
+def stream_blocks(sensor: SensorData, start_time=None, end_time=None, device=None):
+    """Yield encoded blocks of BLOCK_ROWS rows straight from the database cursors."""
+    assert SensorData(sensor.value) == sensor
+    start_time, end_time = resolve_window(start_time, end_time)
+    table, column = sensor.value.split('.')
+    rows = query_range(table, [column], start_time, end_time, inclusive=True, milliseconds=True, device=device)
+    while block := list(islice(rows, BLOCK_ROWS)):
+        timestamps, values = zip(*block)
+        yield encode_block(timestamps, values)
+    yield BLOCK_HEADER.pack(0)
+
+COLUMNS_DECODER_JS = """
+// Decode a response of /data in the columnar encoding into {x, y} Float64Arrays.
+function decodeColumns(buffer) {
+    const view = new DataView(buffer);
+    const blocks = [];
+    let total = 0;
+    for (let offset = 0; offset < buffer.byteLength;) {
+        const count = view.getUint32(offset, true);
+        offset += 8;
+        if (count === 0) break;
+        blocks.push([new Float64Array(buffer, offset, count), new Float64Array(buffer, offset + 8 * count, count)]);
+        offset += 16 * count;
+        total += count;
+    }
+    if (blocks.length === 1) return {x: blocks[0][0], y: blocks[0][1]};
+    const x = new Float64Array(total), y = new Float64Array(total);
+    let at = 0;
+    for (const [bx, by] of blocks) {
+        x.set(bx, at);
+        y.set(by, at);
+        at += bx.length;
+    }
+    return {x, y};
+}
+"""
+
+@app.route('/columns.js')
+def columns_js():
+    return Response(COLUMNS_DECODER_JS, mimetype='text/javascript', headers={'Cache-Control': 'public, max-age=86400'})
+
 @app.route('/data')
 def data():
     sensor_name = request.args.get('sensor')
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
+    # Without device, the rows of every device of the table are returned together.
+    device = request.args.get('device')
 
     if not sensor_name or sensor_name != SensorData[sensor_name].name:
         return jsonify({"error": "Invalid sensor name"}), 400
 
+    try:
+        max_points, method = parse_downsampling(request.args, 0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     sensor = SensorData[sensor_name]
-    data = fetch_timeseries_data(
-        sensor,
-        datetime.fromisoformat(start_time) if start_time else None,
-        datetime.fromisoformat(end_time) if end_time else None
-    )
+    start_time = datetime.fromisoformat(start_time) if start_time else None
+    end_time = datetime.fromisoformat(end_time) if end_time else None
+    columnar = request.args.get('format') == 'columns' or \
+        request.accept_mimetypes.best_match(['application/json', COLUMNS_MIMETYPE]) == COLUMNS_MIMETYPE
+    if columnar and not max_points:
+        return Response(stream_with_context(stream_blocks(sensor, start_time, end_time, device)), mimetype=COLUMNS_MIMETYPE)
+
+    data = fetch_plot_data(sensor, start_time, end_time, max_points, method, device)
+    if columnar:
+        return Response(encode_rows(data), mimetype=COLUMNS_MIMETYPE)
     return jsonify(data)
 
+# ===============================
+# Live feed
+# ===============================
+
+class LiveFeed:
+    """Fan rows committed by the collectors out to every subscriber of this worker.
+
+    One background thread polls PRAGMA data_version, which changes whenever another
+    connection commits, and then reads the new rows of each table once, however
+    many dashboards are subscribed. A subscriber that falls behind gets a resync
+    event instead of the rows it missed. Rows written to a partition change the
+    main database too, through the rollups their triggers maintain there.
+
+    Each subscriber is an open /events response, which holds one request thread
+    of its gthread worker for as long as the page stays open. max_subscribers
+    caps them, so the other requests always have threads left; subscribe
+    returns None once the cap is reached.
+    """
+    def __init__(self, interval=1.0, queue_size=100, max_subscribers=None):
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.last = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self.subscribers) >= self.max_subscribers:
+                return None
+            self.subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait({'resync': True})
+
+    def _run(self):
+        version = None
+        conn = None
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.subscribers:
+                    # The next thread starts over, so rows committed meanwhile are not replayed as new.
+                    self._thread = None
+                    self.last = {}
+                    break
+            try:
+                if conn is None:
+                    conn = connect_readonly(os.environ.get('DATABASE_PATH'))
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current == version:
+                    continue
+                version = current
+                event = self._poll()
+            except Exception as e:
+                print(f"Error polling live feed: {str(e)}")
+                conn = None
+                version = None
+                continue
+            if event:
+                self.publish(event)
+        if conn is not None:
+            conn.close()
+
+    def _poll(self):
+        event = {}
+        tables = {}
+        for sensor in SensorData:
+            table, column = sensor.value.split('.')
+            tables.setdefault(table, []).append((sensor, column))
+        now = datetime.now(timezone.utc)
+        for table, columns in tables.items():
+            if table not in self.last:
+                self.last[table] = latest_timestamp(table)
+                continue
+            last = self.last[table]
+            start = datetime.fromisoformat(last) if last else now - timedelta(days=1)
+            # The device of each row, when table has devices, comes last.
+            keyed = table_devices(table) != [None]
+            rows = [
+                row for row in query_range(
+                    table, [column for _, column in columns] + ([DEVICE_COLUMN] if keyed else []), start, now + timedelta(days=1),
+                )
+                if not last or row[0] > last
+            ]
+            if not rows:
+                continue
+            self.last[table] = rows[-1][0]
+            devices = {}
+            for row in rows:
+                devices.setdefault((row[-1] or '') if keyed else None, []).append(row)
+            for device, device_rows in devices.items():
+                x = [_epoch(row[0]) * 1000 for row in device_rows]
+                for i, (sensor, _) in enumerate(columns, start=1):
+                    event[trace_name(sensor, device)] = {'x': x, 'y': [as_number(row[i]) for row in device_rows]}
+        return event
+
+# Open /events streams per worker; gunicorn needs this many threads on top of those for other requests.
+live_feed = LiveFeed(max_subscribers=int(os.environ.get('LIVE_STREAMS', 8)))
+
+@app.route('/events')
+def events():
+    subscriber = live_feed.subscribe()
+    if subscriber is None:
+        # The page falls back to polling /data.
+        return "Too many live streams", 503
+
+    def stream():
+        try:
+            while True:
+                try:
+                    event = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            live_feed.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cache')
+def cache():
+    return jsonify(chunk_cache.stats())
+
+# ===============================
+# Benchmark
+# ===============================
+
+def benchmark(url, viewers=8, duration=30, max_points=DEFAULT_MAX_POINTS):
+    """Load the server at url with concurrent dashboard viewers. Returns request rate and latency statistics.
+
+    Each viewer fetches every trace of every panel as columns, the way the live
+    dashboard loads, over and over until duration seconds have passed.
+    """
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+
+    paths = [
+        '/data?' + urlencode({'sensor': sensor.name, 'max_points': max_points, 'format': 'columns'})
+        for _, sensors in PANELS
+        for sensor in sensors
+    ]
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+
+    def view():
+        while time.monotonic() < deadline:
+            for path in paths:
+                started = time.monotonic()
+                try:
+                    with urlopen(url.rstrip('/') + path, timeout=60) as response:
+                        response.read()
+                except OSError as e:
+                    errors.append(e)
+                    continue
+                latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=view) for _ in range(viewers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p99_ms': latencies[int((len(latencies) - 1) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+def benchmark_main():
+    if len(sys.argv) < 2:
+        print("USAGE: timeseries_plot_benchmark URL [VIEWERS] [SECONDS]")
+        sys.exit(1)
+    stats = benchmark(
+        sys.argv[1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 30,
+    )
+    print(f"requests:     {stats['requests']} ({stats['errors']} errors)")
+    print(f"requests/s:   {stats['requests_per_second']:.1f}")
+    print(f"p50 latency:  {stats['p50_ms']:.1f} ms")
+    print(f"p99 latency:  {stats['p99_ms']:.1f} ms")
+
 if __name__ == "__main__":
     app.run(debug=True)
 
@@ -25,6 +25,47 @@ in
         default = "127.0.0.1:8000";
         description = "Bind address for the web server.";
       };
+
+      cacheBytes = mkOption {
+        type = types.int;
+        default = 64 * 1024 * 1024;
+        description = "Memory budget in bytes of each worker's timeseries chunk cache.";
+      };
+
+      workers = mkOption {
+        type = types.int;
+        default = 1;
+        description = "Number of gunicorn worker processes. Each has its own chunk cache and live feed.";
+      };
+
+      threads = mkOption {
+        type = types.int;
+        default = 16;
+        description = "Number of request threads of each gthread worker for page and data requests, each with its own database connections.";
+      };
+
+      liveStreams = mkOption {
+        type = types.int;
+        default = 8;
+        description = ''
+          Number of /events streams each worker serves at once. Every open live
+          dashboard holds one gthread thread for as long as it is open, so each
+          worker gets this many threads on top of `threads`. Further live
+          dashboards are refused and fall back to polling.
+        '';
+      };
+
+      pageCacheBytes = mkOption {
+        type = types.int;
+        default = 8 * 1024 * 1024;
+        description = "SQLite page cache in bytes of each database connection.";
+      };
+
+      mmapBytes = mkOption {
+        type = types.int;
+        default = 256 * 1024 * 1024;
+        description = "Bytes of each database file SQLite reads through mmap, shared by all connections through the OS page cache. 0 disables mmap.";
+      };
     };
   };
 
@@ -35,11 +76,19 @@ in
       wantedBy = [ "multi-user.target" ];
 
       serviceConfig = {
-        ExecStart = "${pkgs.callPackage ./timeseries_plot.nix {}}/bin/start-server -w 1 -b ${cfg.timeseries_plot.bind} app:app";
+        ExecStart = "${pkgs.callPackage ./timeseries_plot.nix {}}/bin/start-server -w ${toString cfg.timeseries_plot.workers} -k gthread --threads ${toString (cfg.timeseries_plot.threads + cfg.timeseries_plot.liveStreams)} -b ${cfg.timeseries_plot.bind} app:app";
         User = "smarthome";
         Group = "smarthome";
       };
-      environment = { DATABASE_PATH = cfg.database; };
+      environment = {
+        DATABASE_PATH = cfg.database;
+        CHUNK_CACHE_BYTES = toString cfg.timeseries_plot.cacheBytes;
+        SQLITE_CACHE_BYTES = toString cfg.timeseries_plot.pageCacheBytes;
+        SQLITE_MMAP_BYTES = toString cfg.timeseries_plot.mmapBytes;
+        LIVE_STREAMS = toString cfg.timeseries_plot.liveStreams;
+      } // optionalAttrs cfg.retention.enable {
+        ARCHIVE_DIR = cfg.retention.archiveDir;
+      };
     };
   };
 }
\ No newline at end of file
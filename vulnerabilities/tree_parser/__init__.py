@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterable
 from .interfaces import (
     TreeParserInterface,
     TreeMergerInterface,
@@ -9,6 +9,8 @@ from .core.parser import TreeParserImpl
 from .core.merger import TreeMergerImpl
 from .core.formatter import TreeFormatterImpl
 from .core.orchestrator import TreeOrchestrator
+from .core.node import StoreNode
+from .core.graph import DependencyGraph
 import json
 
 def get_tree_parser_orchestrator() -> TreeOrchestratorInterface:
@@ -20,3 +22,15 @@ def get_tree_parser_orchestrator() -> TreeOrchestratorInterface:
 def merge_nix_trees(input_text: str) -> Dict[str, Any]:
     orchestrator = get_tree_parser_orchestrator()
     return orchestrator.merge_nix_trees(input_text)
+
+def merge_nix_trees_stream(lines: Iterable[str]) -> Dict[str, Any]:
+    orchestrator = get_tree_parser_orchestrator()
+    return orchestrator.process_tree_stream(lines)
+
+def merge_nix_nodes(lines: Iterable[str]) -> StoreNode:
+    orchestrator = get_tree_parser_orchestrator()
+    return orchestrator.process_node_stream(lines)
+
+def merge_nix_graph(lines: Iterable[str]) -> DependencyGraph:
+    orchestrator = get_tree_parser_orchestrator()
+    return orchestrator.process_graph_stream(lines)
@@ -1,7 +1,7 @@
 import sys
 import os
 
-from tree_parser import merge_nix_trees
+from tree_parser import get_tree_parser_orchestrator, merge_nix_trees, merge_nix_trees_stream, merge_nix_graph
 
 def main():
     input_text = """/nix/store/z35z9cw932qg03bb0anvj0j9n0gr7idr-nixos-system-OrjanAMD-595.58.03-26.05pre977467.4c1018dae018.drv
@@ -17,7 +17,19 @@ def main():
         └───/nix/store/hcydnrs0kr1sdj9mqz772vlp8qhp4cls-snappy-1.2.2.drv
 """
 
-    result = merge_nix_trees(input_text)
+    # `-` merges trees from stdin as they arrive, e.g. piped from a loop over `nix why-depends`.
+    lines = sys.stdin if '-' in sys.argv[1:] else input_text.splitlines()
+
+    # `--graph` prints every derivation's dependencies once, "(see above)" elsewhere.
+    if '--graph' in sys.argv[1:]:
+        tree = merge_nix_graph(lines).to_dict()
+        get_tree_parser_orchestrator().formatter.write_ascii_tree(tree, sys.stdout)
+        return tree
+
+    if '-' in sys.argv[1:]:
+        result = merge_nix_trees_stream(lines)
+    else:
+        result = merge_nix_trees(input_text)
     
     print("JSON representation:")
     print(result['json'])
@@ -0,0 +1,83 @@
+"""Benchmark the tree merger on synthetic `nix why-depends` output.
+
+    python -m tree_parser.benchmark [TREES] [SIBLINGS]
+
+Every synthetic tree starts at the same system derivation and goes through
+`system-path.drv` to one of SIBLINGS packages, and from there down a short
+dependency chain, the shape that makes merging hundreds of real trees slow.
+"""
+import copy
+import random
+import sys
+import time
+import tracemalloc
+from typing import List, Dict, Any
+
+from .core.merger import TreeMergerImpl
+
+SYSTEM = '/nix/store/z35z9cw932qg03bb0anvj0j9n0gr7idr-nixos-system.drv'
+SYSTEM_PATH = '/nix/store/dygnwmswkg1v839pnd3zg6b4431ggbg0-system-path.drv'
+
+
+def synthetic_trees(count: int, siblings: int, depth: int = 4, seed: int = 0) -> List[Dict[str, Any]]:
+    """Return `count` parsed trees sharing their first two levels."""
+    rng = random.Random(seed)
+    trees = []
+    for _ in range(count):
+        names = [SYSTEM, SYSTEM_PATH, f'/nix/store/{rng.randrange(siblings):032d}-package.drv']
+        names += [f'/nix/store/{rng.randrange(siblings):032d}-dependency-{level}.drv' for level in range(depth - 2)]
+        node = None
+        for name in reversed(names):
+            node = {'name': name, 'type': 'directory', 'children': [node] if node else []}
+        trees.append(node)
+    return trees
+
+
+def linear_merge(trees: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The merger before name indexes: a linear scan per lookup and a deep copy per new subtree."""
+    root = {'name': '.', 'type': 'directory', 'children': []}
+
+    def add_node(parent_node, new_node):
+        for child in parent_node.get('children', []):
+            if child['name'] == new_node['name']:
+                for child_in_new_node in new_node.get('children', []):
+                    add_node(child, child_in_new_node)
+                return
+        parent_node.setdefault('children', []).append(copy.deepcopy(new_node))
+
+    for tree in trees:
+        add_node(root, tree)
+    root['children'].sort(key=lambda x: x['name'])
+    return root
+
+
+def measure(merge, trees) -> Dict[str, Any]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = merge(trees)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'peak_bytes': peak, 'result': result}
+
+
+def benchmark(count: int = 1000, siblings: int = 5000) -> Dict[str, Dict[str, Any]]:
+    """Merge `count` synthetic trees with both mergers. Returns their time and peak memory."""
+    trees = synthetic_trees(count, siblings)
+    results = {
+        'linear': measure(linear_merge, trees),
+        'indexed': measure(TreeMergerImpl().merge_trees, trees),
+    }
+    assert results['linear'].pop('result') == results['indexed'].pop('result'), "Mergers disagree"
+    return results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    siblings = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    for name, stats in benchmark(count, siblings).items():
+        print(f"{name:8} {stats['seconds'] * 1000:9.1f} ms  {stats['peak_bytes'] / 1024:9.0f} KiB peak")
+
+
+if __name__ == "__main__":
+    main()
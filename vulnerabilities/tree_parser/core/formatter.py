@@ -1,69 +1,40 @@
-from typing import Dict, Any
+import json
+from typing import Dict, Any, Iterator, IO
 from ..interfaces.TreeFormatter import TreeFormatterInterface
 
 
 class TreeFormatterImpl(TreeFormatterInterface):
     def generate_ascii_tree(self, node: Dict[str, Any]) -> str:
         """Generate ASCII tree representation."""
-        children = node.get('children', [])
-        
-        # Skip synthetic '.' root node from merger
-        if node.get('name') == '.' and len(children) > 0:
-            lines = self._format_children_top_level(node, children)
-            return '\n'.join(lines) + '\n'
-        
-        lines = [node.get('name', '')]
+        lines = list(self.iter_ascii_lines(node))
         
-        if not children:
+        # A lone node is its name, without a line break.
+        if len(lines) == 1 and not node.get('children'):
             return lines[0]
         
-        for i, child in enumerate(children):
-            if i == len(children) - 1:
-                connector = '└───'
-                next_prefix = "    "
-            else:
-                connector = '├───'
-                next_prefix = "|   "
-            
-            lines.append(connector + child.get('name', ''))
-            
-            child_lines = self._format_children(
-                child, 
-                child.get('children', []),
-                next_prefix
-            )
-            if child_lines:
-                lines.extend(child_lines.split('\n'))
-        
         return '\n'.join(lines) + '\n'
     
-    def _format_children_top_level(self, node: Dict[str, Any], children: list) -> list:
-        """Format children of the synthetic '.' root as top-level (no connector prefix)."""
-        lines = []
-        for i, child in enumerate(children):
-            if i == len(children) - 1:
-                connector = '└───'
-                next_prefix = "    "
-            else:
-                connector = '├───'
-                next_prefix = "|   "
-            
-            lines.append(connector + child.get('name', ''))
-            
-            grand_children = child.get('children', [])
-            if grand_children:
-                grand_children_lines = self._format_children(
-                    child, grand_children, next_prefix
-                )
-                if grand_children_lines:
-                    lines.extend(grand_children_lines.split('\n'))
+    def iter_ascii_lines(self, node: Dict[str, Any]) -> Iterator[str]:
+        """Yield the lines of the ASCII tree, without line breaks.
         
-        return lines
-    
-    def _format_children(self, node: Dict[str, Any], children: list, prefix: str) -> str:
-        """Format children of a node recursively."""
-        lines = []
-        for i, child in enumerate(children):
+        Walks the tree with an explicit stack, so deep trees neither hit the
+        recursion limit nor copy a line once per ancestor.
+        """
+        children = node.get('children', [])
+        
+        # Skip synthetic '.' root node from merger
+        if not (node.get('name') == '.' and len(children) > 0):
+            yield node.get('name', '')
+        
+        # Each entry is a list of children, the position of the next one and its prefix.
+        stack = [(children, 0, '')]
+        while stack:
+            children, i, prefix = stack.pop()
+            if i == len(children):
+                continue
+            stack.append((children, i + 1, prefix))
+            
+            child = children[i]
             if i == len(children) - 1:
                 connector = '└───'
                 next_prefix = prefix + "    "
@@ -71,14 +42,46 @@ class TreeFormatterImpl(TreeFormatterInterface):
                 connector = '├───'
                 next_prefix = prefix + "|   "
             
-            lines.append(prefix + connector + child.get('name', ''))
+            yield prefix + connector + self._label(child)
             
             grand_children = child.get('children', [])
             if grand_children:
-                grand_children_lines = self._format_children(
-                    child, grand_children, next_prefix
-                )
-                if grand_children_lines:
-                    lines.extend(grand_children_lines.split('\n'))
-        
-        return '\n'.join(lines)
+                stack.append((grand_children, 0, next_prefix))
+    
+    def write_ascii_tree(self, node: Dict[str, Any], sink: IO[str]) -> None:
+        """Write the ASCII tree to `sink` a line at a time, every line ending in a line break."""
+        for line in self.iter_ascii_lines(node):
+            sink.write(line + '\n')
+    
+    def iter_json_chunks(self, node: Dict[str, Any], indent: int = 2) -> Iterator[str]:
+        """Yield `json.dumps(node, indent=indent)` in pieces, walking the tree with an explicit stack."""
+        # Entries are a value and its nesting level, or text to yield as is and None.
+        stack = [(node, 0)]
+        while stack:
+            value, level = stack.pop()
+            if level is None:
+                yield value
+                continue
+            if not (isinstance(value, (dict, list)) and value):
+                yield json.dumps(value)
+                continue
+            
+            is_dict = isinstance(value, dict)
+            yield '{' if is_dict else '['
+            stack.append(('\n' + ' ' * (indent * level) + ('}' if is_dict else ']'), None))
+            entries = list(value.items()) if is_dict else list(enumerate(value))
+            newline = '\n' + ' ' * (indent * (level + 1))
+            for position, (key, item) in reversed(list(enumerate(entries))):
+                stack.append((item, level + 1))
+                stack.append(((',' if position else '') + newline + (json.dumps(str(key)) + ': ' if is_dict else ''), None))
+    
+    def write_json(self, node: Dict[str, Any], sink: IO[str], indent: int = 2) -> None:
+        """Write `json.dumps(node, indent=indent)` to `sink` without building the whole string."""
+        for chunk in self.iter_json_chunks(node, indent):
+            sink.write(chunk)
+    
+    def _label(self, node: Dict[str, Any]) -> str:
+        """The name of a node, marked when a graph printed its dependencies further up."""
+        if node.get('see_above'):
+            return node.get('name', '') + ' (see above)'
+        return node.get('name', '')
@@ -0,0 +1,64 @@
+from typing import List, Dict, Any, Iterable
+from .node import StoreNode
+
+
+class DependencyGraph:
+    """Merged trees as a DAG with one `StoreNode` per derivation.
+
+    A derivation reached through several parents is stored once, and each of
+    those parents' `children` holds that same node. `root` is the synthetic '.'
+    node whose children are the top-level trees.
+    """
+
+    def __init__(self):
+        self.root = StoreNode('.')
+        self.nodes: Dict[str, StoreNode] = {}
+        self.parents: Dict[str, List[StoreNode]] = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add_tree(self, tree: StoreNode) -> None:
+        """Add the nodes and edges of `tree`. `tree` itself is not kept or modified."""
+        pending = [(self.root, tree)]
+        while pending:
+            parent, new_node = pending.pop()
+            node = self.nodes.get(new_node.key)
+            if node is None:
+                node = self.nodes[new_node.key] = StoreNode.__new__(StoreNode)
+                node.hash, node.name, node.children = new_node.hash, new_node.name, None
+            if parent.children is None:
+                parent.children = {}
+            if node.key not in parent.children:
+                parent.children[node.key] = node
+                if parent is not self.root:
+                    self.parents.setdefault(node.key, []).append(parent)
+            pending.extend((node, child) for child in reversed(list(new_node)))
+
+    def add_trees(self, trees: Iterable[StoreNode]) -> 'DependencyGraph':
+        for tree in trees:
+            self.add_tree(tree)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the graph in the list-of-dicts shape, top-level trees sorted by path.
+
+        Each derivation with dependencies is expanded where it is first reached;
+        later occurrences have no children and `'see_above': True`, so the
+        output grows with the number of edges rather than the number of paths.
+        """
+        expanded = set()
+        root = {'name': '.', 'type': 'directory', 'children': []}
+        # Depth first, so a derivation is expanded where the ASCII view reaches it first.
+        pending = [(node, root) for node in reversed(sorted(self.root, key=lambda node: node.path))]
+        while pending:
+            node, parent = pending.pop()
+            tree = {'name': node.path, 'type': 'directory', 'children': []}
+            parent['children'].append(tree)
+            if node.children:
+                if node.key in expanded:
+                    tree['see_above'] = True
+                else:
+                    expanded.add(node.key)
+                    pending.extend((child, tree) for child in reversed(list(node)))
+        return root
@@ -1,32 +1,134 @@
-import copy
-from typing import List, Dict, Any
+from collections import deque
+from typing import List, Dict, Any, Iterable, Optional
 from ..interfaces.TreeMerger import TreeMergerInterface
+from .node import StoreNode
+from .graph import DependencyGraph
+
+
+class MergeNode:
+    """A node of the merged tree with a name-to-child index.
+
+    `source` is the input node the merged node stands for. Children that no
+    other tree has merged into yet are kept as the input nodes themselves,
+    shared rather than copied; a child becomes a `MergeNode` only when another
+    tree merges into it.
+    """
+    __slots__ = ('source', 'children', 'index', 'has_children')
+
+    def __init__(self, source: Dict[str, Any]):
+        self.source = source
+        self.children = list(source.get('children', []))
+        self.has_children = 'children' in source
+        self.index: Optional[Dict[str, int]] = None
+
+    def find(self, name: str) -> Optional[int]:
+        """Return the position of the first child called `name`, or None."""
+        if self.index is None:
+            self.index = {}
+            for position, child in enumerate(self.children):
+                self.index.setdefault(_name_of(child), position)
+        return self.index.get(name)
+
+    def open(self, position: int) -> 'MergeNode':
+        """Return the child at `position` as a `MergeNode`, wrapping a shared input node if needed."""
+        child = self.children[position]
+        if not isinstance(child, MergeNode):
+            child = self.children[position] = MergeNode(child)
+        return child
+
+    def append(self, child: Dict[str, Any]) -> None:
+        if self.index is not None:
+            self.index.setdefault(child['name'], len(self.children))
+        self.children.append(child)
+        self.has_children = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the list-of-dicts shape. Subtrees nothing was merged into are the input nodes."""
+        root: Dict[str, Any] = {}
+        # Each dict is created empty in its parent's list and filled in when popped.
+        pending = [(self, root)]
+        while pending:
+            merge_node, node = pending.pop()
+            children = []
+            for child in merge_node.children:
+                if isinstance(child, MergeNode):
+                    child_node: Dict[str, Any] = {}
+                    pending.append((child, child_node))
+                    child = child_node
+                children.append(child)
+            node.update((key, children if key == 'children' else value) for key, value in merge_node.source.items())
+            if merge_node.has_children:
+                node['children'] = children
+        return root
+
+
+def _name_of(node) -> str:
+    return node.source['name'] if isinstance(node, MergeNode) else node['name']
+
 
 class TreeMergerImpl(TreeMergerInterface):
     def merge_trees(self, trees: List[Dict[str, Any]]) -> Dict[str, Any]:
         if not trees:
             return {'name': '.', 'type': 'directory', 'children': []}
-        
-        root = {'name': '.', 'type': 'directory', 'children': []}
-        
-        def add_node(parent_node: Dict[str, Any], new_node: Dict[str, Any]):
-            existing_child = None
-            for child in parent_node.get('children', []):
-                if child['name'] == new_node['name']:
-                    existing_child = child
-                    break
-            
-            if existing_child:
+
+        return self.index_to_tree(self.merge_into_index(trees))
+
+    def merge_into_index(self, trees: List[Dict[str, Any]], root: Optional[MergeNode] = None) -> MergeNode:
+        """Merge `trees` into `root`, a '.' node by default, and return it without building dicts.
+
+        Nodes with the same name under the same parent are merged into the
+        first of them. Input trees are not modified; subtrees that nothing is
+        merged into are shared with the result instead of copied.
+        """
+        if root is None:
+            root = MergeNode({'name': '.', 'type': 'directory', 'children': []})
+        for tree in trees:
+            # Breadth first keeps the order in which each parent receives its children.
+            pending = deque([(root, tree)])
+            while pending:
+                parent, new_node = pending.popleft()
+                position = parent.find(new_node['name'])
+                if position is None:
+                    parent.append(new_node)
+                    continue
+                existing_child = parent.open(position)
                 for child_in_new_node in new_node.get('children', []):
-                    add_node(existing_child, child_in_new_node)
-            else:
-                new_child_copy = copy.deepcopy(new_node)
-                if 'children' not in parent_node:
-                    parent_node['children'] = []
-                parent_node['children'].append(new_child_copy)
+                    pending.append((existing_child, child_in_new_node))
+        return root
 
+    def index_to_tree(self, root: MergeNode) -> Dict[str, Any]:
+        """Sort the top-level trees of `root` by name and return it in the list-of-dicts shape."""
+        root.children.sort(key=_name_of)
+        root.index = None
+        return root.to_dict()
+
+    def merge_nodes(self, trees: Iterable[StoreNode], root: Optional[StoreNode] = None) -> StoreNode:
+        """Merge `StoreNode` trees into `root`, a '.' node by default, and return it.
+
+        Children keep the order in which they were first seen. Subtrees that
+        nothing is merged into are moved into the result, not copied.
+        """
+        if root is None:
+            root = StoreNode('.')
         for tree in trees:
-            add_node(root, tree)
-            
-        root['children'].sort(key=lambda x: x['name'])
+            pending = [(root, tree)]
+            while pending:
+                parent, new_node = pending.pop()
+                if parent.children is None:
+                    parent.children = {}
+                existing_child = parent.children.setdefault(new_node.key, new_node)
+                if existing_child is not new_node:
+                    pending.extend((existing_child, child) for child in reversed(list(new_node)))
         return root
+
+    def sort_nodes(self, root: StoreNode) -> StoreNode:
+        """Sort the top-level trees of `root` by path, as `merge_trees` does, and return it."""
+        if root.children:
+            root.children = dict(sorted(root.children.items(), key=lambda item: item[1].path))
+        return root
+
+    def merge_graph(self, trees: Iterable[StoreNode], graph: Optional[DependencyGraph] = None) -> DependencyGraph:
+        """Merge `StoreNode` trees into a `DependencyGraph` that stores each derivation once."""
+        if graph is None:
+            graph = DependencyGraph()
+        return graph.add_trees(trees)
@@ -0,0 +1,129 @@
+import json
+import sys
+from typing import List, Dict, Any, Optional, Tuple, IO
+
+STORE_DIR = '/nix/store/'
+HASH_LENGTH = 32
+
+
+def split_store_path(path: str) -> Tuple[str, str]:
+    """Split '/nix/store/<hash>-<name>' into interned (hash, name).
+
+    Anything else, such as the synthetic '.' root, has an empty hash and the
+    whole path as its name.
+    """
+    if path.startswith(STORE_DIR) and path[len(STORE_DIR) + HASH_LENGTH:len(STORE_DIR) + HASH_LENGTH + 1] == '-':
+        start = len(STORE_DIR)
+        return sys.intern(path[start:start + HASH_LENGTH]), sys.intern(path[start + HASH_LENGTH + 1:])
+    return '', sys.intern(path)
+
+
+class StoreNode:
+    """A compact tree node for a store path.
+
+    The path is kept as its interned hash and name, so every node for the same
+    derivation shares both strings. `children` maps the key of each child, its
+    hash or, without one, its name, to the child in insertion order, which
+    merges siblings with the same path; leaves have no dict at all.
+    """
+    __slots__ = ('hash', 'name', 'children')
+
+    def __init__(self, path: str):
+        self.hash, self.name = split_store_path(path)
+        self.children: Optional[Dict[str, 'StoreNode']] = None
+
+    @property
+    def key(self) -> str:
+        return self.hash or self.name
+
+    @property
+    def path(self) -> str:
+        return f'{STORE_DIR}{self.hash}-{self.name}' if self.hash else self.name
+
+    def child(self, path: str) -> 'StoreNode':
+        """Return the child for `path`, adding it if there is none."""
+        hash_, name = split_store_path(path)
+        if self.children is None:
+            self.children = {}
+        node = self.children.get(hash_ or name)
+        if node is None:
+            node = self.children[hash_ or name] = StoreNode(path)
+        return node
+
+    def __iter__(self):
+        return iter(self.children.values() if self.children else ())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, StoreNode):
+            return NotImplemented
+        return (self.hash, self.name, list(self)) == (other.hash, other.name, list(other))
+
+    def __repr__(self) -> str:
+        return f'StoreNode({self.path!r}, {len(self.children or ())} children)'
+
+
+def to_dict(node: StoreNode) -> Dict[str, Any]:
+    """Return `node` in the list-of-dicts shape the formatter and `json.dumps` take."""
+    root = {'name': node.path, 'type': 'directory', 'children': []}
+    pending = [(node, root)]
+    while pending:
+        node, tree = pending.pop()
+        for child in node:
+            child_tree = {'name': child.path, 'type': 'directory', 'children': []}
+            tree['children'].append(child_tree)
+            pending.append((child, child_tree))
+    return root
+
+
+def from_dict(tree: Dict[str, Any], node: Optional[StoreNode] = None) -> StoreNode:
+    """Build a `StoreNode` tree from the list-of-dicts shape, merging it into `node` if given."""
+    if node is None:
+        node = StoreNode(tree['name'])
+    pending = [(tree, node)]
+    while pending:
+        tree, parent = pending.pop()
+        for child in tree.get('children', []):
+            pending.append((child, parent.child(child['name'])))
+    return node
+
+
+def dump(node: StoreNode, fp: IO[str]) -> None:
+    """Write `node` to `fp` as JSON with every hash and name stored once, e.g. to cache a scan.
+
+    The tree is a flat list holding the hash, name and number of children of
+    each node in depth-first order, so depth costs neither nesting nor stack.
+    """
+    strings: Dict[str, int] = {}
+    tree: List[int] = []
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        tree += (strings.setdefault(node.hash, len(strings)), strings.setdefault(node.name, len(strings)), len(node.children or ()))
+        pending.extend(reversed(list(node)))
+    json.dump({'strings': list(strings), 'tree': tree}, fp, separators=(',', ':'))
+
+
+def load(fp: IO[str]) -> StoreNode:
+    """Read a tree written by `dump`."""
+    data = json.load(fp)
+    strings = [sys.intern(string) for string in data['strings']]
+    tree = data['tree']
+    root = None
+    # Each entry is a parent and how many of its children are still to be read.
+    parents: List[List[Any]] = []
+    for position in range(0, len(tree), 3):
+        node = StoreNode.__new__(StoreNode)
+        node.hash, node.name, node.children = strings[tree[position]], strings[tree[position + 1]], None
+        if parents:
+            parent = parents[-1]
+            if parent[0].children is None:
+                parent[0].children = {}
+            parent[0].children[node.key] = node
+            parent[1] -= 1
+            if not parent[1]:
+                parents.pop()
+        else:
+            root = node
+        if tree[position + 2]:
+            parents.append([node, tree[position + 2]])
+    return root
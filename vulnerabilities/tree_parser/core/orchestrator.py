@@ -1,9 +1,39 @@
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Callable, Iterable, Iterator
+from collections.abc import Mapping
 from ..interfaces.TreeParser import TreeParserInterface
 from ..interfaces.TreeMerger import TreeMergerInterface
 from ..interfaces.TreeFormatter import TreeFormatterInterface
 from ..interfaces.TreeOrchestrator import TreeOrchestratorInterface
+from .node import StoreNode
+from .graph import DependencyGraph
+
+class TreeOutputs(Mapping):
+    """The 'tree', 'json' and 'ascii' outputs of a merged tree.
+
+    'json' and 'ascii' are rendered the first time they are looked up, so
+    callers that need one of them, or that write the tree to a file with the
+    formatter, never build the other.
+    """
+
+    def __init__(self, merged_tree: Dict[str, Any], formatter: TreeFormatterInterface):
+        self._renderers: Dict[str, Callable[[], Any]] = {
+            'tree': lambda: merged_tree,
+            'json': lambda: ''.join(formatter.iter_json_chunks(merged_tree)),
+            'ascii': lambda: formatter.generate_ascii_tree(merged_tree),
+        }
+        self._rendered: Dict[str, Any] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._rendered:
+            self._rendered[key] = self._renderers[key]()
+        return self._rendered[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._renderers)
+
+    def __len__(self) -> int:
+        return len(self._renderers)
+
 
 class TreeOrchestrator(TreeOrchestratorInterface):
     def __init__(self, 
@@ -24,15 +54,39 @@ class TreeOrchestrator(TreeOrchestratorInterface):
                 tree_dicts.append(tree)
         
         merged_tree = self.merger.merge_trees(tree_dicts)
-        
-        json_output = json.dumps(merged_tree, indent=2)
-        ascii_output = self.formatter.generate_ascii_tree(merged_tree)
-        
-        return {
-            'tree': merged_tree,
-            'json': json_output,
-            'ascii': ascii_output
-        }
+        return self._outputs(merged_tree)
+
+    def process_tree_stream(self, lines: Iterable[str]) -> Dict[str, Any]:
+        """Like `process_tree_output`, but merge each tree of `lines` as soon as it is read.
+
+        Memory grows with the merged tree rather than with the input, and
+        merging overlaps with whatever still produces the lines.
+        """
+        index = self.merger.merge_into_index([])
+        for tree in self.parser.iter_trees(lines):
+            self.merger.merge_into_index([tree], index)
+        return self._outputs(self.merger.index_to_tree(index))
+
+    def process_node_stream(self, lines: Iterable[str]) -> StoreNode:
+        """Merge the trees of `lines` into compact `StoreNode`s as they are read.
+
+        Returns the merged '.' root, top-level trees sorted by path. Use
+        `node.to_dict` for the outputs of `process_tree_output` and `node.dump`
+        to cache it.
+        """
+        root = self.merger.merge_nodes(self.parser.iter_nodes(lines))
+        return self.merger.sort_nodes(root)
+
+    def process_graph_stream(self, lines: Iterable[str]) -> DependencyGraph:
+        """Merge the trees of `lines` into a `DependencyGraph` as they are read.
+
+        `graph.to_dict()` gives the tree, which `formatter.generate_ascii_tree`
+        prints with "(see above)" for derivations already expanded.
+        """
+        return self.merger.merge_graph(self.parser.iter_nodes(lines))
+
+    def _outputs(self, merged_tree: Dict[str, Any]) -> 'TreeOutputs':
+        return TreeOutputs(merged_tree, self.formatter)
 
     def merge_nix_trees(self, input_text: str) -> Dict[str, Any]:
         return self.process_tree_output(input_text)
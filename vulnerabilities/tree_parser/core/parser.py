@@ -1,6 +1,7 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 from ..interfaces.TreeParser import TreeParserInterface
 from ..utils.tree_utils import count_indent, get_node_name
+from .node import StoreNode
 
 class TreeParserImpl(TreeParserInterface):
     def parse_tree_block(self, lines: List[str]) -> Dict[str, Any]:
@@ -70,3 +71,65 @@ class TreeParserImpl(TreeParserInterface):
             trees.append(current_block)
         
         return trees
+
+    def iter_trees(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Parse trees from `lines`, e.g. a pipe, yielding each as soon as its block ends.
+
+        Gives the trees of `split_into_trees` and `parse_tree_block` on the
+        joined text while holding only the block being read.
+        """
+        for block in self._iter_blocks(lines):
+            yield self.parse_tree_block(block)
+
+    def parse_node_block(self, lines: List[str]) -> StoreNode:
+        """Like `parse_tree_block`, but build compact `StoreNode`s."""
+        lines = [line_ for line_ in lines if line_.strip()]
+
+        if not lines:
+            return StoreNode('.')
+
+        root = StoreNode(lines[0].strip())
+        path_nodes = [root]
+
+        for line in lines[1:]:
+            depth = count_indent(line)
+            node_name = get_node_name(line)
+
+            if depth == -1 or not node_name:
+                continue
+
+            if depth == 0:
+                path_nodes = [root, root.child(node_name)]
+            elif depth - 1 < len(path_nodes):
+                node = path_nodes[depth - 1].child(node_name)
+                path_nodes = path_nodes[:depth + 1]
+                path_nodes.append(node)
+        return root
+
+    def iter_nodes(self, lines: Iterable[str]) -> Iterator[StoreNode]:
+        """Like `iter_trees`, but yield `StoreNode` trees."""
+        for block in self._iter_blocks(lines):
+            yield self.parse_node_block(block)
+
+    def _iter_blocks(self, lines: Iterable[str]) -> Iterator[List[str]]:
+        current_block = []
+        first = True
+
+        for line in lines:
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            if first:
+                # split_into_trees strips the text as a whole.
+                line = line.lstrip()
+                first = False
+
+            if line.startswith('/'):
+                if current_block:
+                    yield current_block
+                current_block = [line]
+            else:
+                current_block.append(line)
+
+        if current_block:
+            yield current_block
@@ -1,7 +1,23 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, IO
 
 class TreeFormatterInterface(ABC):
     @abstractmethod
     def generate_ascii_tree(self, node: Dict[str, Any]) -> str:
         pass
+
+    @abstractmethod
+    def iter_ascii_lines(self, node: Dict[str, Any]) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def write_ascii_tree(self, node: Dict[str, Any], sink: IO[str]) -> None:
+        pass
+
+    @abstractmethod
+    def iter_json_chunks(self, node: Dict[str, Any], indent: int = 2) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def write_json(self, node: Dict[str, Any], sink: IO[str], indent: int = 2) -> None:
+        pass
@@ -1,7 +1,27 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional
 
 class TreeMergerInterface(ABC):
     @abstractmethod
     def merge_trees(self, trees: List[Dict[str, Any]]) -> Dict[str, Any]:
         pass
+
+    @abstractmethod
+    def merge_into_index(self, trees: List[Dict[str, Any]], root: Optional[Any] = None) -> Any:
+        pass
+
+    @abstractmethod
+    def index_to_tree(self, root: Any) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def merge_nodes(self, trees: Iterable[Any], root: Optional[Any] = None) -> Any:
+        pass
+
+    @abstractmethod
+    def sort_nodes(self, root: Any) -> Any:
+        pass
+
+    @abstractmethod
+    def merge_graph(self, trees: Iterable[Any], graph: Optional[Any] = None) -> Any:
+        pass
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Iterable
 
 class TreeOrchestratorInterface(ABC):
     @abstractmethod
@@ -9,3 +9,15 @@ class TreeOrchestratorInterface(ABC):
     @abstractmethod
     def merge_nix_trees(self, input_text: str) -> Dict[str, Any]:
         pass
+
+    @abstractmethod
+    def process_tree_stream(self, lines: Iterable[str]) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def process_node_stream(self, lines: Iterable[str]) -> Any:
+        pass
+
+    @abstractmethod
+    def process_graph_stream(self, lines: Iterable[str]) -> Any:
+        pass
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 
 class TreeParserInterface(ABC):
     @abstractmethod
@@ -9,3 +9,15 @@ class TreeParserInterface(ABC):
     @abstractmethod
     def split_into_trees(self, input_text: str) -> List[List[str]]:
         pass
+
+    @abstractmethod
+    def iter_trees(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def parse_node_block(self, lines: List[str]) -> Any:
+        pass
+
+    @abstractmethod
+    def iter_nodes(self, lines: Iterable[str]) -> Iterator[Any]:
+        pass
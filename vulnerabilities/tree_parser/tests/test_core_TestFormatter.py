@@ -80,6 +80,40 @@ class TestFormatter(unittest.TestCase):
     └───/bastard
 """)
 
+    @unittest.skipIf(not os.path.exists("tree_parser/core/formatter.py"), "Formatter implementation not yet present")
+    def test_formatter_very_deep_tree(self):
+        import io
+        from tree_parser.core.formatter import TreeFormatterImpl
+        formatter = TreeFormatterImpl()
+        tree = {'name': '.', 'type': 'directory', 'children': []}
+        node = tree
+        for depth in range(5000):
+            child = {'name': f'/nix/store/{depth}', 'type': 'directory', 'children': []}
+            node['children'].append(child)
+            node = child
+        lines = list(formatter.iter_ascii_lines(tree))
+        self.assertEqual(len(lines), 5000)
+        self.assertEqual(lines[-1], '    ' * 4999 + '└───/nix/store/4999')
+        sink = io.StringIO()
+        formatter.write_json(tree, sink)
+        json_text = sink.getvalue()
+        self.assertTrue(json_text.startswith('{\n  "name": ".",'))
+        self.assertIn(' ' * (4 * 4999 + 6) + '"name": "/nix/store/4999",', json_text)
+        self.assertTrue(json_text.endswith('\n}'))
+
+    @unittest.skipIf(not os.path.exists("tree_parser/core/formatter.py"), "Formatter implementation not yet present")
+    def test_formatter_json_chunks_match_json_dumps(self):
+        import json
+        from tree_parser.core.formatter import TreeFormatterImpl
+        formatter = TreeFormatterImpl()
+        tree = {'name': '.', 'type': 'directory', 'children': [
+            {'name': '/nix/store/a', 'str_name': '/nix/store/a', 'type': 'directory', 'children': [
+                {'name': '/nix/store/b', 'see_above': True, 'children': []},
+            ]},
+            {'name': '/nix/store/c', 'children': [], 'extra': {}},
+        ]}
+        self.assertEqual(''.join(formatter.iter_json_chunks(tree)), json.dumps(tree, indent=2))
+
 if __name__ == "__main__":
     import sys
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
@@ -0,0 +1,46 @@
+import unittest
+import os
+import io
+from typing import Dict, Any
+
+INPUT_TEXT = """/nix/store/z35z9cw932qg03bb0anvj0j9n0gr7idr-nixos-system.drv
+└───/nix/store/dygnwmswkg1v839pnd3zg6b4431ggbg0-system-path.drv
+    └───/nix/store/0ssvqdkk1wl5jgkj1wrn0bn4m0rxv1xm-shellcheck.drv
+        └───/nix/store/8hpxxbm0rm6v5vb3yx5j8c1p3gwf6kcw-ghc.drv
+/nix/store/z35z9cw932qg03bb0anvj0j9n0gr7idr-nixos-system.drv
+└───/nix/store/mi5kw37r0ndvd9w7fr9s1y5f063xhv0v-pre-switch-checks.drv
+    └───/nix/store/0ssvqdkk1wl5jgkj1wrn0bn4m0rxv1xm-shellcheck.drv
+        └───/nix/store/8hpxxbm0rm6v5vb3yx5j8c1p3gwf6kcw-ghc.drv
+"""
+
+class TestGraph(unittest.TestCase):
+    @unittest.skipIf(not os.path.exists("tree_parser/core/graph.py"), "Graph implementation not yet present")
+    def test_graph_stores_shared_derivations_once(self):
+        from tree_parser import merge_nix_graph
+        graph = merge_nix_graph(io.StringIO(INPUT_TEXT))
+        self.assertEqual(len(graph), 5)
+        shellcheck = graph.nodes['0ssvqdkk1wl5jgkj1wrn0bn4m0rxv1xm']
+        self.assertEqual(
+            [parent.name for parent in graph.parents[shellcheck.key]],
+            ['system-path.drv', 'pre-switch-checks.drv'],
+        )
+        self.assertIs(graph.nodes['mi5kw37r0ndvd9w7fr9s1y5f063xhv0v'].children[shellcheck.key], shellcheck)
+
+    @unittest.skipIf(not os.path.exists("tree_parser/core/graph.py"), "Graph implementation not yet present")
+    def test_graph_ascii_refers_back_to_expanded_derivations(self):
+        from tree_parser import get_tree_parser_orchestrator, merge_nix_graph
+        formatter = get_tree_parser_orchestrator().formatter
+        output_text = """└───/nix/store/z35z9cw932qg03bb0anvj0j9n0gr7idr-nixos-system.drv
+    ├───/nix/store/dygnwmswkg1v839pnd3zg6b4431ggbg0-system-path.drv
+    |   └───/nix/store/0ssvqdkk1wl5jgkj1wrn0bn4m0rxv1xm-shellcheck.drv
+    |       └───/nix/store/8hpxxbm0rm6v5vb3yx5j8c1p3gwf6kcw-ghc.drv
+    └───/nix/store/mi5kw37r0ndvd9w7fr9s1y5f063xhv0v-pre-switch-checks.drv
+        └───/nix/store/0ssvqdkk1wl5jgkj1wrn0bn4m0rxv1xm-shellcheck.drv (see above)
+"""
+        graph = merge_nix_graph(io.StringIO(INPUT_TEXT))
+        self.assertEqual(formatter.generate_ascii_tree(graph.to_dict()), output_text)
+
+if __name__ == "__main__":
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    unittest.main()
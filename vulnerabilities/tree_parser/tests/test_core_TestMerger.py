@@ -39,6 +39,26 @@ class TestMerger(unittest.TestCase):
         self.assertEqual(result['name'], '.')
         self.assertEqual(result['children'], [])
 
+    @unittest.skipIf(not os.path.exists("tree_parser/core/merger.py"), "Merger implementation not yet present")
+    def test_merger_matches_linear_merge(self):
+        import copy
+        import random
+        from tree_parser.core.merger import TreeMergerImpl
+        from tree_parser.benchmark import linear_merge, synthetic_trees
+        rng = random.Random(1)
+
+        def random_tree(depth):
+            node = {'name': f'/nix/store/{rng.randrange(3)}', 'type': 'directory'}
+            if depth and rng.random() < 0.8:
+                node['children'] = [random_tree(depth - 1) for _ in range(rng.randrange(4))]
+            return node
+
+        merger = TreeMergerImpl()
+        for trees in ([random_tree(4) for _ in range(30)], synthetic_trees(200, 50)):
+            before = copy.deepcopy(trees)
+            self.assertEqual(merger.merge_trees(trees), linear_merge(copy.deepcopy(trees)))
+            self.assertEqual(trees, before)
+
 if __name__ == "__main__":
     import sys
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
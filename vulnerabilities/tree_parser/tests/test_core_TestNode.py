@@ -0,0 +1,56 @@
+import unittest
+import os
+import io
+from typing import Dict, Any
+
+class TestNode(unittest.TestCase):
+    @unittest.skipIf(not os.path.exists("tree_parser/core/node.py"), "Node implementation not yet present")
+    def test_node_splits_and_interns_store_paths(self):
+        from tree_parser.core.node import StoreNode
+        path = "/nix/store/dygnwmswkg1v839pnd3zg6b4431ggbg0-system-path.drv"
+        node = StoreNode(path)
+        self.assertEqual(node.hash, "dygnwmswkg1v839pnd3zg6b4431ggbg0")
+        self.assertEqual(node.name, "system-path.drv")
+        self.assertEqual(node.path, path)
+        self.assertIs(StoreNode(path[:]).name, node.name)
+        self.assertEqual(StoreNode("/nix/store/a").path, "/nix/store/a")
+        self.assertEqual(StoreNode(".").hash, "")
+
+    @unittest.skipIf(not os.path.exists("tree_parser/core/node.py"), "Node implementation not yet present")
+    def test_node_dict_and_dump_round_trip(self):
+        from tree_parser.core.node import from_dict, to_dict, dump, load
+        tree = {'name': '.', 'type': 'directory', 'children': [
+            {'name': '/nix/store/a', 'type': 'directory', 'children': [
+                {'name': '/nix/store/b', 'type': 'directory', 'children': []},
+            ]},
+            {'name': '/nix/store/c', 'type': 'directory', 'children': []},
+        ]}
+        node = from_dict(tree)
+        self.assertEqual(to_dict(node), tree)
+        cache = io.StringIO()
+        dump(node, cache)
+        cache.seek(0)
+        self.assertEqual(load(cache), node)
+
+    @unittest.skipIf(not os.path.exists("tree_parser/core/node.py"), "Node implementation not yet present")
+    def test_node_stream_matches_dict_output(self):
+        from tree_parser import get_tree_parser_orchestrator
+        from tree_parser.core.node import to_dict
+        orchestrator = get_tree_parser_orchestrator()
+        input_text = """/nix/store/z35z9cw932qg03bb0anvj0j9n0gr7idr-nixos-system.drv
+└───/nix/store/dygnwmswkg1v839pnd3zg6b4431ggbg0-system-path.drv
+    └───/nix/store/vy9hrd513j41b4vc4708vkmsv0q7ic3c-xdg-utils-1.2.1.drv
+/nix/store/mi5kw37r0ndvd9w7fr9s1y5f063xhv0v-etc.drv
+└───/nix/store/0ibyb85glxh980wmnr1i1i1hm0xclh7l-system-units.drv
+/nix/store/z35z9cw932qg03bb0anvj0j9n0gr7idr-nixos-system.drv
+└───/nix/store/dygnwmswkg1v839pnd3zg6b4431ggbg0-system-path.drv
+    └───/nix/store/ydqg7di6cd4gvdfjv1c5hpmsjd2x7hdx-brave-1.88.138.drv
+"""
+        root = orchestrator.process_node_stream(io.StringIO(input_text))
+        expected = orchestrator.process_tree_output(input_text)
+        self.assertEqual(orchestrator.formatter.generate_ascii_tree(to_dict(root)), expected['ascii'])
+
+if __name__ == "__main__":
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    unittest.main()
@@ -38,6 +38,42 @@ class TestOrchestrator(unittest.TestCase):
         result = orchestrator.merge_nix_trees(input_text)
         self.assertEqual(result["ascii"], output_text)
 
+    @unittest.skipIf(not os.path.exists("tree_parser/core/orchestrator.py"), "Orchestrator implementation not yet present")
+    def test_orchestrator_stream(self):
+        import io
+        from tree_parser import get_tree_parser_orchestrator
+        orchestrator = get_tree_parser_orchestrator()
+        input_text = """/nix/store/system.drv
+└───/nix/store/system-path.drv
+    └───/nix/store/xdg-utils.drv
+/nix/store/etc.drv
+└───/nix/store/system-units.drv
+/nix/store/system.drv
+└───/nix/store/system-path.drv
+    └───/nix/store/brave.drv
+        └───/nix/store/snappy.drv
+"""
+        self.assertEqual(
+            orchestrator.process_tree_stream(io.StringIO(input_text)),
+            orchestrator.process_tree_output(input_text),
+        )
+        self.assertEqual(orchestrator.process_tree_stream([]), orchestrator.process_tree_output(""))
+
+    @unittest.skipIf(not os.path.exists("tree_parser/core/orchestrator.py"), "Orchestrator implementation not yet present")
+    def test_orchestrator_renders_outputs_on_demand(self):
+        from tree_parser.core.orchestrator import TreeOutputs
+        from tree_parser.core.formatter import TreeFormatterImpl
+
+        class AsciiOnlyFormatter(TreeFormatterImpl):
+            def iter_json_chunks(self, node, indent=2):
+                raise AssertionError("JSON rendered")
+
+        tree = {'name': '.', 'type': 'directory', 'children': [{'name': '/nix/store/a', 'children': []}]}
+        outputs = TreeOutputs(tree, AsciiOnlyFormatter())
+        self.assertIs(outputs['tree'], tree)
+        self.assertEqual(outputs['ascii'], '└───/nix/store/a\n')
+        self.assertEqual(sorted(outputs), ['ascii', 'json', 'tree'])
+
 if __name__ == "__main__":
     import sys
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
@@ -12,6 +12,16 @@ class TestParser(unittest.TestCase):
         self.assertEqual(len(trees), 2)
         self.assertEqual(trees[0][0], "/nix/store/a")
 
+    @unittest.skipIf(not os.path.exists("tree_parser/core/parser.py"), "Parser implementation not yet present")
+    def test_parser_iter_trees_matches_split_and_parse(self):
+        import io
+        from tree_parser.core.parser import TreeParserImpl
+        parser = TreeParserImpl()
+        input_text = "\n  stray\n/nix/store/a\n└───/nix/store/b\n\n    └───/nix/store/d\n/nix/store/c\n│   \n"
+        expected = [parser.parse_tree_block(block) for block in parser.split_into_trees(input_text)]
+        self.assertEqual(list(parser.iter_trees(io.StringIO(input_text))), expected)
+        self.assertEqual(list(parser.iter_trees(input_text.split('\n'))), expected)
+
 if __name__ == "__main__":
     import sys
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))